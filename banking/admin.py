@@ -2,6 +2,7 @@
 from django.contrib import admin
 
 from .models import BankAccount, Transaction
+from .search import search_transactions
 
 class BankAccountAdmin(admin.ModelAdmin):
     list_display = ('account_number', 'user', 'account_type', 'balance')
@@ -10,8 +11,18 @@ class BankAccountAdmin(admin.ModelAdmin):
 
 class TransactionAdmin(admin.ModelAdmin):
     list_display = ('account', 'transaction_type', 'amount', 'timestamp')
+    list_select_related = ('account__user',)
     search_fields = ('account__account_number', 'description')
     list_filter = ('transaction_type', 'timestamp')
 
+    def get_search_results(self, request, queryset, search_term):
+        # Exact account number, or the description full-text index, instead
+        # of a LIKE '%...%' scan over every description
+        if not search_term:
+            return queryset, False
+        matches = queryset.filter(account__account_number=search_term) | \
+            search_transactions(queryset, search_term)
+        return matches, False
+
 admin.site.register(BankAccount, BankAccountAdmin)
 admin.site.register(Transaction, TransactionAdmin)
\ No newline at end of file
@@ -0,0 +1,132 @@
+# banking/balances.py
+from datetime import timedelta
+
+from django.db.models import Case, F, Sum, When
+from django.db.models.functions import Trunc
+
+from .models import BalanceCheckpoint, BankAccount, Transaction
+
+BUCKETS = {
+    # name: (width, the Trunc kind the database groups by)
+    '5min': (timedelta(minutes=5), 'minute'),
+    'hour': (timedelta(hours=1), 'hour'),
+    'day': (timedelta(days=1), 'day'),
+}
+
+
+def signed_amount():
+    """Expression for a transaction's effect on its account's balance"""
+    return Case(
+        When(direction='debit', then=-F('amount')),
+        default=F('amount'),
+        output_field=Transaction._meta.get_field('amount')
+    )
+
+
+def floor_time(moment, width):
+    """Round ``moment`` down to a multiple of ``width`` (widths divide a day evenly)"""
+    midnight = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return midnight + ((moment - midnight) // width) * width
+
+
+def balance_as_of(account, moment):
+    """
+    Return ``account``'s balance at ``moment``.
+
+    Seeks to the first checkpoint after ``moment`` on the (account, timestamp)
+    index (or uses the live balance if there is none) and subtracts only the
+    postings between the two, so at most one checkpoint interval is summed.
+    """
+    checkpoint = BalanceCheckpoint.objects.filter(
+        account=account,
+        timestamp__gt=moment
+    ).order_by('timestamp').values_list('timestamp', 'balance').first()
+
+    tail = Transaction.objects.filter(account=account, timestamp__gt=moment)
+    if checkpoint:
+        anchor_time, anchor_balance = checkpoint
+        tail = tail.filter(timestamp__lte=anchor_time)
+    else:
+        anchor_balance = BankAccount.objects.values_list('balance', flat=True).get(pk=account.pk)
+    return anchor_balance - (tail.aggregate(net=Sum(signed_amount()))['net'] or 0)
+
+
+def balance_series(accounts, start, end, bucket='hour'):
+    """
+    Reconstruct each account's closing balance for every bucket in [start, end].
+
+    Starting from the current balance, the ledger is walked backwards: the
+    balance at the close of a bucket is the current balance minus the net of
+    everything posted after it. The database does the grouping with Trunc, so
+    the work in Python is proportional to the number of buckets, not rows.
+    Returns ``(bucket_ends, {account_id: [balance, ...]})``: each balance is
+    labelled with the end of its bucket, the moment it is the balance at.
+    """
+    width, kind = BUCKETS[bucket]
+    first = floor_time(start, width)
+    buckets = []
+    moment = first
+    while moment <= end:
+        buckets.append(moment)
+        moment += width
+
+    account_ids = [account.pk for account in accounts]
+    net = {}
+    rows = Transaction.objects.filter(
+        account_id__in=account_ids,
+        timestamp__gte=first
+    ).annotate(
+        period=Trunc('timestamp', kind)
+    ).values('account_id', 'period').annotate(net=Sum(signed_amount()))
+    for row in rows:
+        # Fold the truncated period into our (possibly wider) bucket
+        index = min((row['period'] - first) // width, len(buckets))
+        key = (row['account_id'], index)
+        net[key] = net.get(key, 0) + row['net']
+
+    series = {}
+    for account in accounts:
+        balance = account.balance - net.get((account.pk, len(buckets)), 0)
+        values = [0] * len(buckets)
+        for index in range(len(buckets) - 1, -1, -1):
+            values[index] = balance
+            balance -= net.get((account.pk, index), 0)
+        series[account.pk] = values
+    return [bucket + width for bucket in buckets], series
+
+
+def lttb_indices(values, threshold):
+    """
+    Pick ``threshold`` indices of ``values`` with largest-triangle-three-buckets.
+
+    The first and last points are always kept; from each bucket in between the
+    point forming the largest triangle with its neighbours is chosen, which
+    keeps peaks and troughs that plain striding would drop.
+    """
+    count = len(values)
+    if threshold >= count or threshold < 3:
+        return list(range(count))
+
+    picked = [0]
+    every = (count - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, count)
+        avg_x = (next_start + next_end - 1) / 2
+        avg_y = sum(float(v) for v in values[next_start:next_end]) / (next_end - next_start)
+
+        range_start = int(i * every) + 1
+        range_end = int((i + 1) * every) + 1
+        best, best_area = range_start, -1.0
+        for j in range(range_start, range_end):
+            area = abs(
+                (a - avg_x) * (float(values[j]) - float(values[a]))
+                - (a - j) * (avg_y - float(values[a]))
+            )
+            if area > best_area:
+                best, best_area = j, area
+        picked.append(best)
+        a = best
+    picked.append(count - 1)
+    return picked
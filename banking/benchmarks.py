@@ -0,0 +1,372 @@
+# banking/benchmarks.py
+# Shared by the benchmark_views and loadtest commands: seeding a data set of
+# a chosen size, the requests each benchmarked route sends, serving the app
+# under gunicorn, and turning latencies into the figures saved as baselines.
+# Queries per request come from the profiling middleware's Server-Timing
+# header, so they include queries run on gather_queries' worker threads.
+# For a streamed response (the statement export) the header is sent before
+# the body, so only the queries run before streaming starts are counted.
+import os
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from decimal import Decimal
+
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import CommandError
+from django.urls import reverse
+from django.utils import timezone
+
+from banking.models import BankAccount, Transaction
+from banking.money import multiply
+from banking.numbering import allocate_account_numbers
+from crypto.models import CryptoAccount, CryptoHolding, CryptoLot, CryptoTransaction, Cryptocurrency
+
+# gunicorn worker class for each serving mode
+MODES = {
+    'wsgi': 'sync',
+    'gthread': 'gthread',
+    'asgi': 'uvicorn_worker.UvicornWorker',
+}
+
+# Latencies compared against a baseline. p99 is recorded but not compared:
+# over a few hundred requests it is one or two samples, and too noisy to gate on.
+LATENCY_METRICS = ('p50_ms', 'p95_ms')
+
+# Every seeded customer can log in with this password
+BENCHMARK_PASSWORD = 'Ledger-bench-2718'
+
+_SQL_TIMING = re.compile(r'\bsql;[^,]*desc="(\d+) quer')
+_SIMILAR_TIMING = re.compile(r'\bsimilar;desc="(\d+) repeated')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def _wait_until_up(server, base_url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise CommandError('gunicorn exited while starting; is the worker class installed?')
+        try:
+            requests.get(base_url + reverse('login'), timeout=1)
+            return
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    raise CommandError(f'gunicorn did not start within {timeout}s')
+
+
+@contextmanager
+def serve(mode, workers=2, threads=4, env=None, timeout=30):
+    """Run the app under gunicorn in serving ``mode`` on a free local port and yield its base URL"""
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', str(settings.BASE_DIR / 'gunicorn.conf.py'),
+         '--bind', f'127.0.0.1:{port}'],
+        cwd=settings.BASE_DIR,
+        env={
+            **os.environ,
+            'PORT': str(port),
+            'GUNICORN_WORKER_CLASS': MODES[mode],
+            'WEB_CONCURRENCY': str(workers),
+            'GUNICORN_THREADS': str(threads),
+            **(env or {}),
+        },
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        _wait_until_up(server, base_url, timeout)
+        yield base_url
+    finally:
+        server.terminate()
+        server.wait()
+
+
+class BenchmarkUser:
+    """A seeded customer: the account their requests use, and one of someone else's to pay"""
+
+    def __init__(self, user, account, payee, crypto):
+        self.user = user
+        self.account = account
+        self.payee = payee
+        self.crypto = crypto
+
+
+class BenchmarkData:
+    def __init__(self, prefix, users, operator, order_ids, created_cryptos):
+        self.prefix = prefix
+        self.users = users
+        self.operator = operator
+        self.order_ids = order_ids
+        self.created_cryptos = created_cryptos
+
+    def delete(self):
+        # Everything else hangs off the users and goes with them, including
+        # the users the register route signed up
+        get_user_model().objects.filter(username__startswith=self.prefix).delete()
+        Cryptocurrency.objects.filter(pk__in=[crypto.pk for crypto in self.created_cryptos]).delete()
+
+
+def seed_benchmark_data(users=10, accounts_per_user=3, transactions_per_account=200, pending_orders=200,
+                        opening_balance=Decimal('1000000.00'), holding_quantity=Decimal('1000')):
+    """
+    Create ``users`` customers with bank and crypto accounts, ledger history,
+    crypto holdings and ``pending_orders`` pending sells, plus a superuser
+    for the approval queue. Balances are large enough that the write routes
+    never run out of money during a run.
+    """
+    User = get_user_model()
+    suffix = uuid.uuid4().hex[:8]
+    rng = random.Random(suffix)
+
+    # Hashing is deliberately slow, so every customer shares one hash
+    password = make_password(BENCHMARK_PASSWORD)
+    people = [
+        User(username=f'bench-{suffix}-{i}', email=f'bench-{suffix}-{i}@example.com', password=password)
+        for i in range(users)
+    ]
+    people = User.objects.bulk_create(people)
+    operator = User.objects.create_user(
+        username=f'bench-{suffix}-operator', email=f'bench-{suffix}-operator@example.com',
+        password=None, is_staff=True, is_superuser=True
+    )
+
+    cryptos = list(Cryptocurrency.objects.order_by('pk')[:3])
+    created_cryptos = []
+    if not cryptos:
+        created_cryptos = Cryptocurrency.objects.bulk_create([
+            Cryptocurrency(name=f'Benchmark coin {i}', symbol=f'B{suffix[:6]}{i}', current_price=Decimal(price))
+            for i, price in enumerate(['60000', '3000', '150'])
+        ])
+        cryptos = created_cryptos
+
+    account_types = [kind for kind, _ in BankAccount.ACCOUNT_TYPES]
+    numbers = iter(allocate_account_numbers('bank', users * accounts_per_user))
+    bank_accounts = BankAccount.objects.bulk_create([
+        BankAccount(
+            user=user,
+            account_type=account_types[i % len(account_types)],
+            account_number=next(numbers),
+            balance=opening_balance
+        )
+        for user in people
+        for i in range(accounts_per_user)
+    ])
+    CryptoAccount.objects.bulk_create([
+        CryptoAccount(user=user, account_number=number, balance=opening_balance)
+        for user, number in zip(people, allocate_account_numbers('crypto', users))
+    ])
+
+    Transaction.objects.bulk_create((
+        Transaction(
+            account=account,
+            transaction_type=rng.choice(('deposit', 'withdrawal', 'payment')),
+            direction=rng.choice(('credit', 'debit')),
+            amount=Decimal(rng.randint(100, 50000)) / 100,
+            description=f'Benchmark transaction {n}'
+        )
+        for account in bank_accounts
+        for n in range(transactions_per_account)
+    ), batch_size=1000)
+
+    now = timezone.now()
+    holdings = CryptoHolding.objects.bulk_create([
+        CryptoHolding(
+            user=user, crypto=crypto, quantity=holding_quantity,
+            cost_basis=multiply(holding_quantity, crypto.current_price)
+        )
+        for user in people
+        for crypto in cryptos
+    ])
+    CryptoLot.objects.bulk_create([
+        CryptoLot(
+            holding=holding, acquired_at=now, price=holding.crypto.current_price,
+            quantity=holding.quantity, remaining_quantity=holding.quantity, remaining_cost=holding.cost_basis
+        )
+        for holding in holdings
+    ])
+
+    # Pending sells, with the coins they need reserved as the sell view would
+    orders = []
+    reserved = {}
+    for n in range(pending_orders):
+        holding = holdings[n % len(holdings)]
+        amount = Decimal(rng.randint(1, 100)) / 1000
+        orders.append(CryptoTransaction(
+            user=holding.user, crypto=holding.crypto, transaction_type='sell', amount=amount,
+            price_at_transaction=holding.crypto.current_price,
+            total_value=multiply(amount, holding.crypto.current_price), status='pending'
+        ))
+        reserved[holding] = reserved.get(holding, 0) + amount
+    orders = CryptoTransaction.objects.bulk_create(orders, batch_size=1000)
+    for holding, amount in reserved.items():
+        holding.reserved_quantity = amount
+    CryptoHolding.objects.bulk_update(list(reserved), ['reserved_quantity'], batch_size=500)
+
+    first_accounts = bank_accounts[::accounts_per_user]
+    return BenchmarkData(
+        prefix=f'bench-{suffix}-',
+        users=[
+            BenchmarkUser(user, first_accounts[i], first_accounts[(i + 1) % users], cryptos[i % len(cryptos)])
+            for i, user in enumerate(people)
+        ],
+        operator=operator,
+        order_ids=[order.pk for order in orders],
+        created_cryptos=created_cryptos
+    )
+
+
+def _approve(data, user, n):
+    if not data.order_ids:
+        return 'GET', reverse('admin_approve'), None
+    return 'POST', reverse('admin_approve'), {
+        'action': 'approve', 'transaction_id': data.order_ids[n % len(data.order_ids)]
+    }
+
+
+def _register(data, user, n):
+    username = f'{data.prefix}signup-{n}'
+    return 'POST', reverse('register'), {
+        'username': username, 'email': f'{username}@example.com',
+        'password1': BENCHMARK_PASSWORD, 'password2': BENCHMARK_PASSWORD
+    }
+
+
+def _batch_transfer(data, user, n):
+    payments = (
+        'from_account,to_account_number,amount,description\n'
+        f'{user.account.account_number},{user.payee.account_number},1.00,Benchmark batch {n}\n'
+    )
+    return 'POST', reverse('batch_transfer'), {
+        'file': SimpleUploadedFile('payments.csv', payments.encode(), content_type='text/csv')
+    }
+
+
+# name -> (operator only, expected status, request(data, user, n) -> (method, path, form data)).
+# ``n`` numbers the requests sent to a route, so each can pick different rows.
+ROUTES = {
+    'login': (False, 200, lambda data, u, n: ('GET', reverse('login'), None)),
+    'login_post': (False, 302, lambda data, u, n: (
+        'POST', reverse('login'), {'username': u.user.username, 'password': BENCHMARK_PASSWORD}
+    )),
+    'register': (False, 200, lambda data, u, n: ('GET', reverse('register'), None)),
+    'register_post': (False, 302, _register),
+    'dashboard': (False, 200, lambda data, u, n: ('GET', reverse('home'), None)),
+    'profile': (False, 200, lambda data, u, n: ('GET', reverse('profile'), None)),
+    'create_account': (False, 200, lambda data, u, n: ('GET', reverse('create_account'), None)),
+    'create_account_post': (False, 302, lambda data, u, n: (
+        'POST', reverse('create_account'), {'account_type': 'savings'}
+    )),
+    'deposit': (False, 200, lambda data, u, n: ('GET', reverse('deposit', args=[u.account.pk]), None)),
+    'deposit_post': (False, 302, lambda data, u, n: (
+        'POST', reverse('deposit', args=[u.account.pk]), {'amount': '1.00', 'description': 'Benchmark'}
+    )),
+    'withdraw': (False, 200, lambda data, u, n: ('GET', reverse('withdraw', args=[u.account.pk]), None)),
+    'withdraw_post': (False, 302, lambda data, u, n: (
+        'POST', reverse('withdraw', args=[u.account.pk]), {'amount': '1.00', 'description': 'Benchmark'}
+    )),
+    'transfer': (False, 200, lambda data, u, n: ('GET', reverse('transfer', args=[u.account.pk]), None)),
+    'transfer_post': (False, 302, lambda data, u, n: (
+        'POST', reverse('transfer', args=[u.account.pk]),
+        {'amount': '1.00', 'description': 'Benchmark', 'to_account': u.payee.account_number}
+    )),
+    'batch_transfer': (False, 200, lambda data, u, n: ('GET', reverse('batch_transfer'), None)),
+    'batch_transfer_post': (False, 200, _batch_transfer),
+    'transaction_history': (False, 200, lambda data, u, n: ('GET', reverse('transaction_history'), None)),
+    'export_transactions': (False, 200, lambda data, u, n: ('GET', reverse('export_transactions'), None)),
+    'crypto_home': (False, 200, lambda data, u, n: ('GET', reverse('crypto_home'), None)),
+    'crypto_price_history': (False, 200, lambda data, u, n: (
+        'GET', reverse('crypto_price_history', args=[u.crypto.symbol]), None
+    )),
+    'transfer_to_crypto': (False, 200, lambda data, u, n: ('GET', reverse('transfer_to_crypto'), None)),
+    'transfer_to_crypto_post': (False, 302, lambda data, u, n: (
+        'POST', reverse('transfer_to_crypto'), {'amount': '1.00', 'bank_account': u.account.pk}
+    )),
+    'transfer_from_crypto': (False, 200, lambda data, u, n: ('GET', reverse('transfer_from_crypto'), None)),
+    'transfer_from_crypto_post': (False, 302, lambda data, u, n: (
+        'POST', reverse('transfer_from_crypto'), {'amount': '1.00', 'bank_account': u.account.pk}
+    )),
+    'buy_crypto': (False, 200, lambda data, u, n: ('GET', reverse('buy_crypto'), None)),
+    'buy_crypto_post': (False, 302, lambda data, u, n: (
+        'POST', reverse('buy_crypto'), {'crypto': u.crypto.pk, 'amount': '0.00001'}
+    )),
+    'sell_crypto': (False, 200, lambda data, u, n: ('GET', reverse('sell_crypto'), None)),
+    'sell_crypto_post': (False, 302, lambda data, u, n: (
+        'POST', reverse('sell_crypto'), {'crypto': u.crypto.pk, 'amount': '0.001'}
+    )),
+    'admin_approve': (True, 200, lambda data, u, n: ('GET', reverse('admin_approve'), None)),
+    'admin_approve_post': (True, 200, _approve),
+    'cache_metrics': (True, 200, lambda data, u, n: ('GET', reverse('cache_metrics'), None)),
+}
+
+# URLs deliberately left out of ROUTES, and why
+EXCLUDED_ROUTES = {
+    'logout': 'it ends the session, so every request after the first would time an anonymous redirect',
+    'profile POST': 'the profile page has no form; a POST renders the same page as the GET',
+    'crypto_price_stream': 'the SSE stream stays open until the client leaves, so it has no request latency',
+    '/admin/': "Django's own admin site, not code this project maintains",
+}
+
+
+def queries_from_server_timing(header):
+    """``(queries, repeated queries)`` from the profiling middleware's Server-Timing header"""
+    sql = _SQL_TIMING.search(header or '')
+    similar = _SIMILAR_TIMING.search(header or '')
+    return (int(sql.group(1)) if sql else None), (int(similar.group(1)) if similar else 0)
+
+
+def summarize(latencies, queries, repeated, errors, elapsed):
+    """The figures recorded for one route: throughput, latency percentiles and queries per request"""
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': round(statistics.mean(latencies) * 1000, 2),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'queries_per_request': round(statistics.mean(queries), 2) if queries else None,
+        'repeated_queries': max(repeated, default=0),
+    }
+
+
+def compare_results(baseline, current, tolerance=0.25):
+    """
+    ``[(route, metric, baseline value, current value)]`` for every route in
+    both runs that got slower than ``tolerance`` allows, lost throughput,
+    ran more queries per request, or failed more requests.
+    """
+    regressions = []
+    for route, after in current['results'].items():
+        before = baseline['results'].get(route)
+        if before is None:
+            continue
+        for metric in LATENCY_METRICS:
+            if after[metric] > before[metric] * (1 + tolerance):
+                regressions.append((route, metric, before[metric], after[metric]))
+        if after['throughput'] < before['throughput'] * (1 - tolerance):
+            regressions.append((route, 'throughput', before['throughput'], after['throughput']))
+        # Query counts don't vary from run to run, so any increase counts
+        for metric in ('queries_per_request', 'repeated_queries', 'errors'):
+            if before.get(metric) is not None and (after.get(metric) or 0) > before[metric]:
+                regressions.append((route, metric, before[metric], after[metric]))
+    return regressions
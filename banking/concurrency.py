@@ -0,0 +1,46 @@
+# banking/concurrency.py
+# Async views use this to run independent ORM reads at the same time. Django
+# runs async ORM calls one after another on a single thread, so each call
+# here runs on a thread of a process-wide pool, and therefore on that
+# thread's database connection. The pool outlives event loops (WSGI runs
+# each async view on a fresh one), so its threads and connections are reused
+# across requests; as between requests, a connection is kept until it breaks
+# or outlives CONN_MAX_AGE, and with a connection pool (CONN_MAX_AGE=0) it
+# goes back to the pool after every call.
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'GATHER_QUERIES_THREADS', 8), thread_name_prefix='gather-queries'
+)
+
+
+def _on_worker_connection(call):
+    def run():
+        close_old_connections()
+        try:
+            return call()
+        finally:
+            close_old_connections()
+    return run
+
+
+async def gather_queries(*calls):
+    """
+    Run the blocking ``calls`` concurrently and return their results in order.
+
+    Each call reads on its own connection, so the calls don't share a
+    snapshot: don't split reads that have to agree with each other across
+    calls. Inside a transaction other connections can't see its uncommitted
+    rows, so there the calls run one by one on the caller's connection instead.
+    """
+    if await sync_to_async(lambda: connection.in_atomic_block)():
+        return [await sync_to_async(call)() for call in calls]
+    return await asyncio.gather(*[
+        sync_to_async(_on_worker_connection(call), thread_sensitive=False, executor=_executor)()
+        for call in calls
+    ])
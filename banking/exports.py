@@ -0,0 +1,148 @@
+# banking/exports.py
+import csv
+import zlib
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+
+EXPORT_CHUNK_SIZE = 2000
+
+CSV_HEADER = ['date', 'account_number', 'account_type', 'type', 'direction', 'amount',
+              'counterparty', 'description', 'id']
+
+OFX_ACCOUNT_TYPES = {
+    'checking': 'CHECKING',
+    'savings': 'SAVINGS',
+    'business': 'CHECKING',
+}
+
+
+class _Echo:
+    """File-like object whose write() hands the line back to the caller"""
+
+    def write(self, value):
+        return value
+
+
+def statement_rows(transactions):
+    """
+    Iterate ``transactions`` for export in (account, timestamp) order.
+
+    Rows are streamed from a server-side cursor in fixed-size chunks with their
+    accounts joined in, so memory stays flat however long the history is.
+    """
+    return transactions.select_related('account', 'related_account').order_by(
+        'account_id', 'timestamp', 'id'
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def _signed(entry):
+    return -entry.amount if entry.direction == 'debit' else entry.amount
+
+
+def csv_statement(transactions):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_HEADER)
+    for entry in statement_rows(transactions):
+        yield writer.writerow([
+            entry.timestamp.isoformat(),
+            entry.account.account_number,
+            entry.account.account_type,
+            entry.transaction_type,
+            entry.direction,
+            _signed(entry),
+            entry.related_account.account_number if entry.related_account else '',
+            entry.description,
+            entry.pk,
+        ])
+
+
+def _ofx_text(value):
+    return ' '.join(str(value).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').split())
+
+
+def _ofx_time(moment):
+    return timezone.localtime(moment).strftime('%Y%m%d%H%M%S')
+
+
+def _ofx_statement_end(account):
+    return (
+        f"</BANKTRANLIST>\n"
+        f"<LEDGERBAL><BALAMT>{account.balance}<DTASOF>{_ofx_time(timezone.now())}</LEDGERBAL>\n"
+        f"</STMTRS></STMTTRNRS>\n"
+    )
+
+
+def ofx_statement(transactions, start, end):
+    """
+    Yield an OFX 1.0.2 (SGML) document with one statement per account.
+
+    The response body is UTF-8, so the header declares ENCODING:UTF-8 with
+    CHARSET:NONE rather than USASCII/1252.
+    """
+    now = _ofx_time(timezone.now())
+    yield (
+        "OFXHEADER:100\nDATA:OFXSGML\nVERSION:102\nSECURITY:NONE\nENCODING:UTF-8\n"
+        "CHARSET:NONE\nCOMPRESSION:NONE\nOLDFILEUID:NONE\nNEWFILEUID:NONE\n\n"
+        "<OFX>\n"
+        f"<SIGNONMSGSRSV1><SONRS><STATUS><CODE>0<SEVERITY>INFO</STATUS>"
+        f"<DTSERVER>{now}<LANGUAGE>ENG</SONRS></SIGNONMSGSRSV1>\n"
+        "<BANKMSGSRSV1>\n"
+    )
+    account = None
+    for entry in statement_rows(transactions):
+        if account is None or entry.account_id != account.pk:
+            if account is not None:
+                yield _ofx_statement_end(account)
+            account = entry.account
+            yield (
+                f"<STMTTRNRS><TRNUID>{account.pk}<STATUS><CODE>0<SEVERITY>INFO</STATUS>\n"
+                f"<STMTRS><CURDEF>USD\n"
+                f"<BANKACCTFROM><BANKID>BANKINGAPP<ACCTID>{account.account_number}"
+                f"<ACCTTYPE>{OFX_ACCOUNT_TYPES.get(account.account_type, 'CHECKING')}</BANKACCTFROM>\n"
+                f"<BANKTRANLIST><DTSTART>{_ofx_time(start)}<DTEND>{_ofx_time(end)}\n"
+            )
+        trntype = 'XFER' if entry.transaction_type == 'transfer' else entry.direction.upper()
+        yield (
+            f"<STMTTRN><TRNTYPE>{trntype}<DTPOSTED>{_ofx_time(entry.timestamp)}"
+            f"<TRNAMT>{_signed(entry)}<FITID>{entry.pk}"
+            f"<NAME>{_ofx_text(entry.get_transaction_type_display())}"
+            f"<MEMO>{_ofx_text(entry.description)}</STMTTRN>\n"
+        )
+    if account is not None:
+        yield _ofx_statement_end(account)
+    yield "</BANKMSGSRSV1>\n</OFX>\n"
+
+
+def gzip_stream(chunks):
+    """Gzip a stream of text chunks on the fly"""
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _next_batch(chunks, size):
+    parts = list(islice(chunks, size))
+    return parts[0][:0].join(parts) if parts else None
+
+
+async def async_stream(chunks):
+    """
+    Serve a sync export stream to an ASGI server without buffering it.
+
+    Django would otherwise drain a sync iterator into a list before the
+    first byte is sent. Here up to EXPORT_CHUNK_SIZE pieces are pulled per
+    hop to the sync thread, the same thread each time, so the server-side
+    cursor behind ``chunks`` stays on its connection.
+    """
+    chunks = iter(chunks)
+    next_batch = sync_to_async(_next_batch)
+    while True:
+        data = await next_batch(chunks, EXPORT_CHUNK_SIZE)
+        if data is None:
+            return
+        yield data
@@ -1,5 +1,12 @@
 # banking/forms.py
+import csv
+import io
+import json
+from datetime import datetime, time, timedelta
+
 from django import forms
+from django.conf import settings
+from django.utils import timezone
 
 from .models import BankAccount, Transaction
 
@@ -24,4 +31,93 @@ class TransferForm(forms.ModelForm):
         fields = ['amount', 'description']
         widgets = {
             'amount': forms.NumberInput(attrs={'min': 0.01}),
-        }
\ No newline at end of file
+        }
+
+class BatchTransferForm(forms.Form):
+    BATCH_FIELDS = ('from_account', 'to_account_number', 'amount', 'description')
+
+    file = forms.FileField(
+        label="Payments file",
+        help_text="CSV with a header row, or a JSON list of objects, with the columns "
+                  "from_account, to_account_number, amount and description."
+    )
+
+    def clean_file(self):
+        upload = self.cleaned_data['file']
+        max_rows = getattr(settings, 'BATCH_TRANSFER_MAX_ROWS', 10000)
+        try:
+            text = upload.read().decode('utf-8-sig')
+        except UnicodeDecodeError:
+            raise forms.ValidationError("The file must be UTF-8 encoded.")
+
+        if upload.name.lower().endswith('.json'):
+            try:
+                rows = json.loads(text)
+            except ValueError:
+                raise forms.ValidationError("The file is not valid JSON.")
+            if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+                raise forms.ValidationError("The JSON file must contain a list of objects.")
+        else:
+            reader = csv.DictReader(io.StringIO(text))
+            missing = set(self.BATCH_FIELDS[:3]) - set(reader.fieldnames or [])
+            if missing:
+                raise forms.ValidationError(f"Missing columns: {', '.join(sorted(missing))}")
+            rows = list(reader)
+
+        if not rows:
+            raise forms.ValidationError("The file contains no payments.")
+        if len(rows) > max_rows:
+            raise forms.ValidationError(f"A batch can contain at most {max_rows} payments.")
+        return [
+            {field: str(row.get(field) or '').strip() for field in self.BATCH_FIELDS}
+            for row in rows
+        ]
+
+
+class StatementExportForm(forms.Form):
+    FORMATS = (
+        ('csv', 'CSV'),
+        ('ofx', 'OFX'),
+    )
+
+    format = forms.ChoiceField(choices=FORMATS, required=False)
+    start = forms.DateField(required=False)
+    end = forms.DateField(required=False)
+    gzip = forms.BooleanField(required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        start, end = cleaned_data.get('start'), cleaned_data.get('end')
+        if start and end and start > end:
+            raise forms.ValidationError("The start date must be before the end date.")
+        return cleaned_data
+
+
+class TransactionFilterForm(forms.Form):
+    start = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    end = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    transaction_type = forms.ChoiceField(
+        choices=(('', 'Any type'),) + Transaction.TRANSACTION_TYPES,
+        required=False,
+        label="Type"
+    )
+    min_amount = forms.DecimalField(required=False, min_value=0, decimal_places=2)
+    max_amount = forms.DecimalField(required=False, min_value=0, decimal_places=2)
+    counterparty = forms.CharField(max_length=20, required=False, label="Counterparty account")
+    q = forms.CharField(max_length=100, required=False, label="Description")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for name, field in self.fields.items():
+            css = 'form-select' if name == 'transaction_type' else 'form-control'
+            field.widget.attrs['class'] = f'{css} {css}-sm'
+
+    def clean(self):
+        cleaned_data = super().clean()
+        tz = timezone.get_current_timezone()
+        # Dates become [start of first day, start of the day after the last)
+        if cleaned_data.get('start'):
+            cleaned_data['start'] = datetime.combine(cleaned_data['start'], time.min, tz)
+        if cleaned_data.get('end'):
+            cleaned_data['end'] = datetime.combine(cleaned_data['end'] + timedelta(days=1), time.min, tz)
+        return cleaned_data
@@ -0,0 +1,325 @@
+# banking/ledger.py
+# Every movement of money goes through this module. Balances are only changed
+# with F() updates inside transaction.atomic, debits carry the funds check in
+# their WHERE clause, and the Transaction rows are written in the same
+# transaction, so concurrent postings can neither overdraw nor lose updates.
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from .models import BalanceCheckpoint, BankAccount, Transaction
+from .money import money_value
+from .summary import invalidate_portfolio_summary
+
+
+class LedgerError(Exception):
+    """Raised when a posting is rejected; the message is safe to show users"""
+
+
+class InsufficientFunds(LedgerError):
+    def __init__(self, message='Insufficient funds.'):
+        super().__init__(message)
+
+
+def _check_amount(amount):
+    amount = Decimal(amount)
+    if amount <= 0:
+        raise LedgerError('Amount must be greater than zero.')
+    return amount
+
+
+def lock_accounts(model, pks):
+    """
+    Lock the given rows in primary key order.
+
+    Every posting takes its locks through here, so two transfers touching the
+    same pair of accounts always queue in the same order instead of deadlocking.
+    """
+    return list(model.objects.select_for_update().filter(pk__in=set(pks)).order_by('pk'))
+
+
+def _posting_counters(model, postings=1):
+    # Bank accounts count postings so checkpoints can be taken every N of them
+    if model is BankAccount:
+        return {'postings_since_checkpoint': F('postings_since_checkpoint') + postings}
+    return {}
+
+
+def debit(model, pk, amount, reserved_field=None):
+    """
+    Take ``amount`` from an account, failing if it would overdraw it or, with
+    ``reserved_field``, dip into the funds that field holds back.
+    """
+    balance = model._meta.get_field('balance')
+    required = money_value(amount, balance)
+    if reserved_field:
+        required = F(reserved_field) + required
+    updated = model.objects.filter(
+        pk=pk, balance__gte=required
+    ).update(balance=F('balance') - money_value(amount, balance), **_posting_counters(model))
+    if not updated:
+        raise InsufficientFunds()
+
+
+def credit(model, pk, amount):
+    balance = model._meta.get_field('balance')
+    model.objects.filter(pk=pk).update(balance=F('balance') + money_value(amount, balance), **_posting_counters(model))
+
+
+def checkpoint_interval():
+    return getattr(settings, 'LEDGER_CHECKPOINT_INTERVAL', 100)
+
+
+def record_checkpoints(pks=None, force=False):
+    """
+    Checkpoint the running balance of bank accounts.
+
+    By default only accounts that have reached the checkpoint interval are
+    written; ``force`` checkpoints every account with postings since its last
+    checkpoint. ``pks=None`` considers all accounts. Returns the number written.
+    """
+    with transaction.atomic():
+        due = BankAccount.objects.select_for_update().filter(
+            postings_since_checkpoint__gte=1 if force else checkpoint_interval()
+        )
+        if pks is not None:
+            due = due.filter(pk__in=set(pks))
+        due = list(due.order_by('pk').values_list('pk', 'balance', 'postings_since_checkpoint'))
+        # Stamped once the row locks are held and the balances read: any
+        # posting the balances include committed (and was timestamped) before
+        # this, and any later one has to wait for the locks
+        now = timezone.now()
+        if not due:
+            return 0
+        BalanceCheckpoint.objects.bulk_create([
+            BalanceCheckpoint(account_id=pk, timestamp=now, balance=balance)
+            for pk, balance, _ in due
+        ], batch_size=1000)
+        # Subtract what was read rather than zeroing, so the counter never
+        # drops a posting that this checkpoint's balance doesn't include
+        by_count = {}
+        for pk, _, postings in due:
+            by_count.setdefault(postings, []).append(pk)
+        for postings, account_pks in by_count.items():
+            BankAccount.objects.filter(pk__in=account_pks).update(
+                postings_since_checkpoint=F('postings_since_checkpoint') - postings
+            )
+    return len(due)
+
+
+def post_deposit(account, amount, description=''):
+    amount = _check_amount(amount)
+    with transaction.atomic():
+        lock_accounts(BankAccount, [account.pk])
+        credit(BankAccount, account.pk, amount)
+        entry = Transaction.objects.create(
+            account=account,
+            transaction_type='deposit',
+            direction='credit',
+            amount=amount,
+            description=description
+        )
+        record_checkpoints([account.pk])
+        invalidate_portfolio_summary(account.user_id)
+    return entry
+
+
+def post_withdrawal(account, amount, description=''):
+    amount = _check_amount(amount)
+    with transaction.atomic():
+        lock_accounts(BankAccount, [account.pk])
+        debit(BankAccount, account.pk, amount)
+        entry = Transaction.objects.create(
+            account=account,
+            transaction_type='withdrawal',
+            direction='debit',
+            amount=amount,
+            description=description
+        )
+        record_checkpoints([account.pk])
+        invalidate_portfolio_summary(account.user_id)
+    return entry
+
+
+def post_transfer(from_account, to_account, amount, description='', incoming_description=None):
+    """Move ``amount`` between two bank accounts and write both legs atomically"""
+    amount = _check_amount(amount)
+    if from_account.pk == to_account.pk:
+        raise LedgerError('Cannot transfer to the same account.')
+    if incoming_description is None:
+        incoming_description = f"Incoming transfer from {from_account.user.username}"
+
+    with transaction.atomic():
+        lock_accounts(BankAccount, [from_account.pk, to_account.pk])
+        debit(BankAccount, from_account.pk, amount)
+        credit(BankAccount, to_account.pk, amount)
+        legs = Transaction.objects.bulk_create([
+            Transaction(
+                account=from_account,
+                transaction_type='transfer',
+                direction='debit',
+                amount=amount,
+                description=description,
+                related_account=to_account
+            ),
+            Transaction(
+                account=to_account,
+                transaction_type='transfer',
+                direction='credit',
+                amount=amount,
+                description=incoming_description,
+                related_account=from_account
+            ),
+        ])
+        record_checkpoints([from_account.pk, to_account.pk])
+        invalidate_portfolio_summary(from_account.user_id, to_account.user_id)
+    return legs
+
+
+def fund_crypto_account(bank_account, crypto_account, amount):
+    """Move cash from a bank account into the user's crypto account"""
+    amount = _check_amount(amount)
+    with transaction.atomic():
+        # Bank rows are always locked before crypto rows
+        lock_accounts(BankAccount, [bank_account.pk])
+        lock_accounts(type(crypto_account), [crypto_account.pk])
+        debit(BankAccount, bank_account.pk, amount)
+        credit(type(crypto_account), crypto_account.pk, amount)
+        entry = Transaction.objects.create(
+            account=bank_account,
+            transaction_type='transfer',
+            direction='debit',
+            amount=amount,
+            description=f"Transfer to crypto account {crypto_account.account_number}"
+        )
+        record_checkpoints([bank_account.pk])
+        invalidate_portfolio_summary(bank_account.user_id, crypto_account.user_id)
+    return entry
+
+
+def withdraw_crypto_account(crypto_account, bank_account, amount):
+    """Move cash from a crypto account to a bank account, leaving funds reserved for orders untouched"""
+    amount = _check_amount(amount)
+    with transaction.atomic():
+        lock_accounts(BankAccount, [bank_account.pk])
+        lock_accounts(type(crypto_account), [crypto_account.pk])
+        debit(type(crypto_account), crypto_account.pk, amount, reserved_field='reserved_balance')
+        credit(BankAccount, bank_account.pk, amount)
+        entry = Transaction.objects.create(
+            account=bank_account,
+            transaction_type='deposit',
+            direction='credit',
+            amount=amount,
+            description=f"Transfer from crypto account {crypto_account.account_number}"
+        )
+        record_checkpoints([bank_account.pk])
+        invalidate_portfolio_summary(bank_account.user_id, crypto_account.user_id)
+    return entry
+
+
+def post_batch_transfers(user, rows, chunk_size=500):
+    """
+    Post many transfers from ``user``'s accounts in one transaction.
+
+    ``rows`` is a sequence of dicts with ``from_account``, ``to_account_number``,
+    ``amount`` and ``description``. Every account number is resolved (and
+    locked) with one IN query, rows are checked against running balances in
+    memory, and the net change per account is applied with one CASE update
+    per chunk. Returns one ``{'row', 'ok', 'message'}`` result per input row;
+    rows that fail are skipped, the rest are posted.
+    """
+    numbers = set()
+    for row in rows:
+        numbers.add(row.get('from_account'))
+        numbers.add(row.get('to_account_number'))
+
+    results = []
+    legs = []
+    deltas = {}
+    postings = {}
+    with transaction.atomic():
+        accounts = {
+            account.account_number: account
+            for account in BankAccount.objects.select_for_update().filter(
+                account_number__in=numbers - {None}
+            ).order_by('pk')
+        }
+        balances = {account.pk: account.balance for account in accounts.values()}
+
+        for index, row in enumerate(rows, start=1):
+            source = accounts.get(row.get('from_account'))
+            target = accounts.get(row.get('to_account_number'))
+            try:
+                amount = _check_amount(row.get('amount'))
+                if amount != amount.quantize(Decimal('0.01')):
+                    raise LedgerError('Amounts are limited to whole cents.')
+            except (LedgerError, ArithmeticError, TypeError, ValueError):
+                results.append({'row': index, 'ok': False, 'message': 'Invalid amount.'})
+                continue
+            if source is None or source.user_id != user.pk:
+                message = 'Source account not found.'
+            elif target is None:
+                message = 'Destination account not found.'
+            elif source.pk == target.pk:
+                message = 'Cannot transfer to the same account.'
+            elif balances[source.pk] < amount:
+                message = 'Insufficient funds.'
+            else:
+                message = None
+            if message:
+                results.append({'row': index, 'ok': False, 'message': message})
+                continue
+
+            balances[source.pk] -= amount
+            balances[target.pk] += amount
+            deltas[source.pk] = deltas.get(source.pk, 0) - amount
+            deltas[target.pk] = deltas.get(target.pk, 0) + amount
+            postings[source.pk] = postings.get(source.pk, 0) + 1
+            postings[target.pk] = postings.get(target.pk, 0) + 1
+            description = row.get('description') or ''
+            legs.append(Transaction(
+                account=source,
+                transaction_type='transfer',
+                direction='debit',
+                amount=amount,
+                description=description,
+                related_account=target
+            ))
+            legs.append(Transaction(
+                account=target,
+                transaction_type='transfer',
+                direction='credit',
+                amount=amount,
+                description=f"Incoming transfer from {user.username}",
+                related_account=source
+            ))
+            results.append({'row': index, 'ok': True, 'message': 'Posted.'})
+
+        changed = list(postings)
+        balance = BankAccount._meta.get_field('balance')
+        for start in range(0, len(changed), chunk_size):
+            chunk = changed[start:start + chunk_size]
+            BankAccount.objects.filter(pk__in=chunk).update(
+                balance=F('balance') + Case(
+                    *[When(pk=pk, then=money_value(deltas[pk], balance)) for pk in chunk],
+                    output_field=balance
+                ),
+                postings_since_checkpoint=F('postings_since_checkpoint') + Case(
+                    *[When(pk=pk, then=Value(postings[pk])) for pk in chunk],
+                    output_field=BankAccount._meta.get_field('postings_since_checkpoint')
+                )
+            )
+        debited = [pk for pk in changed if deltas[pk] < 0]
+        if debited and BankAccount.objects.filter(pk__in=debited, balance__lt=0).exists():
+            # Only possible if a row changed outside the ledger's locks
+            raise InsufficientFunds('Balances changed while the batch was posting; nothing was posted.')
+
+        Transaction.objects.bulk_create(legs, batch_size=1000)
+        record_checkpoints(changed)
+        invalidate_portfolio_summary(
+            *{account.user_id for account in accounts.values() if account.pk in deltas}
+        )
+    return results
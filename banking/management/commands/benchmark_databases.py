@@ -0,0 +1,64 @@
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+THROUGHPUT = re.compile(r'\(([\d.]+) transfers/s')
+
+
+class Command(BaseCommand):
+    help = 'Migrates each DATABASE_URL given and compares ledger write throughput across them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', action='append', required=True, metavar='DATABASE_URL',
+            help='Database to migrate and benchmark (repeatable)'
+        )
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--transfers', type=int, default=2000, help='Total transfers per database')
+        parser.add_argument('--skip-migrate', action='store_true', help="Don't run migrations first")
+
+    def run(self, url, *args):
+        # A child process per database, so each is configured by settings
+        # exactly as a web worker with that DATABASE_URL would be
+        result = subprocess.run(
+            [sys.executable, str(settings.BASE_DIR / 'manage.py'), *args],
+            env={**os.environ, 'DATABASE_URL': url},
+            capture_output=True, text=True
+        )
+        if result.returncode:
+            raise CommandError(f'{" ".join(args)} failed for {url}:\n{result.stderr}')
+        return result.stdout
+
+    def handle(self, *args, **options):
+        results = []
+        failed = []
+        for url in options['url']:
+            if not options['skip_migrate']:
+                self.run(url, 'migrate', '--noinput')
+            try:
+                # benchmark_ledger exits non-zero when the balances drifted
+                output = self.run(
+                    url, 'benchmark_ledger',
+                    '--workers', str(options['workers']), '--transfers', str(options['transfers'])
+                )
+            except CommandError as e:
+                self.stderr.write(self.style.ERROR(str(e)))
+                failed.append(url)
+                continue
+            match = THROUGHPUT.search(output)
+            if not match:
+                raise CommandError(f'No throughput reported for {url}:\n{output}')
+            results.append((url, float(match.group(1))))
+            self.stdout.write(f'{url}: {match.group(1)} transfers/s')
+
+        fastest = max((rate for _, rate in results), default=0)
+        for url, rate in sorted(results, key=lambda result: -result[1]):
+            self.stdout.write(f'{rate:>10.1f} transfers/s  {rate / fastest:>6.0%}  {url}')
+        for url in failed:
+            self.stdout.write(f'{"FAILED":>23}  {"":>6}  {url}')
+        if failed:
+            raise CommandError(f'{len(failed)} of {len(options["url"])} databases failed the ledger benchmark')
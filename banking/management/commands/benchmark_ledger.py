@@ -0,0 +1,98 @@
+import random
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.db import OperationalError, connection
+from django.db.models import Sum
+
+from banking.ledger import InsufficientFunds, post_transfer
+from banking.models import BankAccount, Transaction
+
+
+class Command(BaseCommand):
+    help = 'Runs concurrent transfers through the ledger and checks that no money is created or lost'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--transfers', type=int, default=2000, help='Total transfers across all workers')
+        parser.add_argument('--accounts', type=int, default=10)
+        parser.add_argument('--opening-balance', type=Decimal, default=Decimal('1000.00'))
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark user and accounts afterwards')
+
+    def handle(self, *args, **options):
+        suffix = uuid.uuid4().hex[:8]
+        user = get_user_model().objects.create_user(
+            username=f"ledger-bench-{suffix}",
+            email=f"ledger-bench-{suffix}@example.com",
+            password=None
+        )
+        opening = options['opening_balance']
+        accounts = BankAccount.objects.bulk_create([
+            BankAccount(
+                user=user,
+                account_type='checking',
+                account_number=f"LB{suffix}{i}",
+                balance=opening
+            )
+            for i in range(options['accounts'])
+        ])
+        expected_total = opening * len(accounts)
+
+        counts = {'posted': 0, 'insufficient': 0, 'retried': 0}
+        counts_lock = threading.Lock()
+        per_worker = options['transfers'] // options['workers']
+
+        def worker():
+            rng = random.Random()
+            try:
+                for _ in range(per_worker):
+                    source, target = rng.sample(accounts, 2)
+                    amount = Decimal(rng.randint(1, 20000)) / 100
+                    while True:
+                        try:
+                            post_transfer(source, target, amount, 'benchmark', 'benchmark')
+                            outcome = 'posted'
+                        except InsufficientFunds:
+                            outcome = 'insufficient'
+                        except OperationalError:
+                            # Lock wait timed out; the posting rolled back, so try again
+                            with counts_lock:
+                                counts['retried'] += 1
+                            continue
+                        break
+                    with counts_lock:
+                        counts[outcome] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['workers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        total = BankAccount.objects.filter(user=user).aggregate(total=Sum('balance'))['total']
+        legs = Transaction.objects.filter(account__user=user).count()
+        drift = total - expected_total
+
+        self.stdout.write(
+            f"{counts['posted']} transfers posted, {counts['insufficient']} rejected for insufficient "
+            f"funds, {counts['retried']} retries in {elapsed:.2f}s "
+            f"({counts['posted'] / elapsed:.1f} transfers/s, {options['workers']} workers)"
+        )
+        self.stdout.write(f"Ledger legs written: {legs} (expected {counts['posted'] * 2})")
+        if not options['keep']:
+            user.delete()
+
+        if drift or legs != counts['posted'] * 2:
+            # A non-zero exit, so scripted runs (e.g. benchmark_databases) fail too
+            raise CommandError(
+                f"Drift detected: {drift} in balances, {legs} ledger legs for {counts['posted']} transfers"
+            )
+        self.stdout.write(self.style.SUCCESS('Zero drift'))
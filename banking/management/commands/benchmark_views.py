@@ -0,0 +1,246 @@
+import json
+import logging
+import subprocess
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from banking.benchmarks import (
+    EXCLUDED_ROUTES, MODES, ROUTES, compare_results, queries_from_server_timing, seed_benchmark_data, serve, summarize
+)
+
+# Turned on for the run so every response carries its query count
+PROFILING = {
+    'PROFILING_ENABLED': True,
+    'PROFILING_SAMPLE_RATE': 1.0,
+    'PROFILING_SERVER_TIMING': True,
+}
+
+
+def git_commit():
+    try:
+        result = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True
+        )
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+class Command(BaseCommand):
+    help = (
+        'Seeds benchmark data, drives every page and form in the app through the test client or a '
+        'gunicorn server, and reports throughput, latency percentiles and queries per request. '
+        'Not benchmarked: ' + '; '.join(f'{name} ({reason})' for name, reason in EXCLUDED_ROUTES.items()) + '.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--route', action='append', choices=sorted(ROUTES), help='Route to run (repeatable)')
+        parser.add_argument(
+            '--mode', choices=['client'] + sorted(MODES), default='client',
+            help='client runs in-process through the test client; the others start gunicorn'
+        )
+        parser.add_argument('--requests', type=int, default=200, help='Requests per route')
+        parser.add_argument('--concurrency', type=int, default=1, help='Clients sending requests at once')
+        parser.add_argument('--warmup', type=int, default=5, help='Unmeasured requests per route first')
+        parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+        parser.add_argument('--threads', type=int, default=4, help='Threads per gthread worker')
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--accounts', type=int, default=3, help='Bank accounts per user')
+        parser.add_argument('--transactions', type=int, default=200, help='Ledger rows per bank account')
+        parser.add_argument('--pending-orders', type=int, default=500)
+        parser.add_argument('--output', help='Write the results as a JSON baseline to this file')
+        parser.add_argument('--compare', metavar='BASELINE', help='Fail if a route regressed against this baseline')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.25,
+            help='Allowed latency increase / throughput drop before a route counts as regressed'
+        )
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded data afterwards')
+
+    def handle(self, *args, **options):
+        if options['users'] < 2 or options['accounts'] < 1:
+            raise CommandError('Transfers need at least 2 users with an account each')
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        routes = options['route'] or list(ROUTES)
+        if 'admin_approve_post' in routes and options['pending_orders'] < options['requests'] + options['warmup']:
+            self.stderr.write(self.style.WARNING(
+                'Fewer pending orders than approvals; later approvals will find their order already settled'
+            ))
+
+        started = time.perf_counter()
+        data = seed_benchmark_data(
+            users=options['users'],
+            accounts_per_user=options['accounts'],
+            transactions_per_account=options['transactions'],
+            pending_orders=options['pending_orders']
+        )
+        self.stdout.write(f'Seeded {len(data.users)} users in {time.perf_counter() - started:.1f}s')
+
+        profiling_logger = logging.getLogger('banking_project.profiling')
+        was_disabled, profiling_logger.disabled = profiling_logger.disabled, True
+        # The test client (also used to log the HTTP clients in) sends Host: testserver
+        overrides = {'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, 'testserver']}
+        try:
+            if options['mode'] == 'client':
+                with override_settings(**overrides, **PROFILING):
+                    results = self.run_routes(data, routes, options, self.client_sender)
+            else:
+                env = {name: str(value) for name, value in PROFILING.items()}
+                with override_settings(**overrides), \
+                        serve(options['mode'], options['workers'], options['threads'], env) as base_url:
+                    results = self.run_routes(data, routes, options, self.http_sender(base_url))
+        finally:
+            profiling_logger.disabled = was_disabled
+            if not options['keep']:
+                data.delete()
+
+        report = {
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'database': connection.vendor,
+            'options': {
+                name: options[name] for name in (
+                    'mode', 'requests', 'concurrency', 'workers', 'threads',
+                    'users', 'accounts', 'transactions', 'pending_orders'
+                )
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline:
+            self.check_baseline(baseline, report, options['tolerance'])
+
+    def run_routes(self, data, routes, options, sender):
+        results = {}
+        for name in routes:
+            operator, expected, build = ROUTES[name]
+            people = [data.operator] if operator else [user.user for user in data.users]
+            by_user = {user.user.pk: user for user in data.users}
+            lock = threading.Lock()
+            latencies, queries, repeated = [], [], []
+            errors = 0
+
+            def client(user, numbers, measured):
+                nonlocal errors
+                send = sender(user)
+                benchmark_user = by_user.get(user.pk, data.users[0])
+                while True:
+                    with lock:
+                        n = next(numbers, None)
+                    if n is None:
+                        return
+                    method, path, form = build(data, benchmark_user, n)
+                    started = time.perf_counter()
+                    try:
+                        status, timing = send(method, path, form)
+                    except requests.RequestException:
+                        status, timing = None, None
+                    elapsed = time.perf_counter() - started
+                    if not measured:
+                        continue
+                    count, similar = queries_from_server_timing(timing)
+                    with lock:
+                        latencies.append(elapsed)
+                        errors += status != expected
+                        if count is not None:
+                            queries.append(count)
+                        repeated.append(similar)
+
+            client(people[0], iter(range(options['warmup'])), measured=False)
+            numbers = iter(range(options['warmup'], options['warmup'] + options['requests']))
+            started = time.perf_counter()
+            if options['concurrency'] == 1:
+                client(people[0], numbers, measured=True)
+            else:
+                def worker(user):
+                    try:
+                        client(user, numbers, measured=True)
+                    finally:
+                        connection.close()
+
+                threads = [
+                    threading.Thread(target=worker, args=(people[i % len(people)],))
+                    for i in range(options['concurrency'])
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            elapsed = time.perf_counter() - started
+
+            results[name] = summary = summarize(latencies, queries, repeated, errors, elapsed)
+            queries_per_request = summary['queries_per_request']
+            self.stdout.write(
+                f"{name:<26} {summary['throughput']:8.1f} req/s  p50 {summary['p50_ms']:7.1f}ms  "
+                f"p95 {summary['p95_ms']:7.1f}ms  p99 {summary['p99_ms']:7.1f}ms  "
+                f"{'-' if queries_per_request is None else f'{queries_per_request:g}':>5} queries  "
+                f"{errors} errors"
+            )
+        return results
+
+    def client_sender(self, user):
+        client = Client()
+        client.force_login(user)
+
+        def send(method, path, form):
+            response = client.get(path) if method == 'GET' else client.post(path, form)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            return response.status_code, response.get('Server-Timing')
+        return send
+
+    def http_sender(self, base_url):
+        def sender(user):
+            client = Client()
+            client.force_login(user)
+            # A form page sets the CSRF cookie the POST routes need
+            client.get(reverse('create_account'))
+            session = requests.Session()
+            session.cookies.update({name: cookie.value for name, cookie in client.cookies.items()})
+            session.headers['X-CSRFToken'] = client.cookies[settings.CSRF_COOKIE_NAME].value
+
+            def send(method, path, form):
+                form = form or {}
+                files = {name: (value.name, value.read()) for name, value in form.items() if hasattr(value, 'read')}
+                data = {name: value for name, value in form.items() if name not in files}
+                response = session.request(
+                    method, base_url + path, data=data, files=files or None, timeout=30, allow_redirects=False
+                )
+                # Logging in rotates the CSRF token; replace the cookie copied from the test client
+                token = response.cookies.get(settings.CSRF_COOKIE_NAME)
+                if token:
+                    session.cookies.set(settings.CSRF_COOKIE_NAME, token)
+                    session.headers['X-CSRFToken'] = token
+                return response.status_code, response.headers.get('Server-Timing')
+            return send
+        return sender
+
+    def check_baseline(self, baseline, report, tolerance):
+        if baseline.get('options') != report['options'] or baseline.get('database') != report['database']:
+            self.stderr.write(self.style.WARNING(
+                'The baseline was recorded with different options or database; comparisons may not be meaningful'
+            ))
+        regressions = compare_results(baseline, report, tolerance)
+        for route, metric, before, after in regressions:
+            self.stderr.write(f'{route:<26} {metric:<20} {before} -> {after}')
+        if regressions:
+            raise CommandError(
+                f"{len(regressions)} regressions against {baseline.get('commit') or 'the baseline'}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"No regressions against {baseline.get('commit') or 'the baseline'}"))
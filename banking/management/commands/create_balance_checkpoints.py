@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from banking.ledger import record_checkpoints
+
+
+class Command(BaseCommand):
+    help = 'Checkpoints the balance of every account with postings since its last checkpoint'
+
+    def handle(self, *args, **options):
+        written = record_checkpoints(force=True)
+        self.stdout.write(f'Successfully created {written} balance checkpoints')
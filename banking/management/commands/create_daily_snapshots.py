@@ -1,12 +1,35 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 from django.core.management.base import BaseCommand
-from django.contrib.auth import get_user_model
-from banking.views import create_daily_snapshot
+from django.db import connection
+
+from banking.snapshots import iter_user_id_chunks, snapshot_users
+from crypto.valuation import price_vector
+
 
 class Command(BaseCommand):
     help = 'Creates daily account snapshots for all users'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Users snapshotted per query')
+        parser.add_argument('--workers', type=int, default=1, help='Chunks snapshotted in parallel')
+
     def handle(self, *args, **options):
-        User = get_user_model()
-        for user in User.objects.all():
-            create_daily_snapshot(user)
-        self.stdout.write('Successfully created daily snapshots')
\ No newline at end of file
+        started = time.perf_counter()
+        chunks = iter_user_id_chunks(options['chunk_size'])
+        prices = price_vector()
+
+        def snapshot_chunk(user_ids):
+            try:
+                return snapshot_users(user_ids, prices)
+            finally:
+                connection.close()
+
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+                total = sum(pool.map(snapshot_chunk, chunks))
+        else:
+            total = sum(snapshot_users(user_ids, prices) for user_ids in chunks)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'Successfully created daily snapshots for {total} users in {elapsed:.2f}s')
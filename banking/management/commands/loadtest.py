@@ -0,0 +1,84 @@
+import statistics
+import threading
+import time
+import uuid
+
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from banking.benchmarks import MODES, percentile, serve
+
+
+class Command(BaseCommand):
+    help = 'Starts gunicorn in each serving mode and compares request latency under concurrent load'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mode', action='append', choices=sorted(MODES), help='Serving mode (repeatable)')
+        parser.add_argument('--path', action='append', help='Page to request (repeatable)')
+        parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+        parser.add_argument('--threads', type=int, default=4, help='Threads per gthread worker')
+        parser.add_argument('--concurrency', type=int, default=16, help='Clients sending requests at once')
+        parser.add_argument('--requests', type=int, default=500, help='Requests per mode and path')
+
+    def handle(self, *args, **options):
+        modes = options['mode'] or ['wsgi', 'asgi']
+        paths = options['path'] or ['/', '/crypto/']
+
+        suffix = uuid.uuid4().hex[:8]
+        user = get_user_model().objects.create_user(
+            username=f"loadtest-{suffix}", email=f"loadtest-{suffix}@example.com", password=None
+        )
+        client = Client()
+        client.force_login(user)
+        cookies = {settings.SESSION_COOKIE_NAME: client.cookies[settings.SESSION_COOKIE_NAME].value}
+        try:
+            for mode in modes:
+                self.run_mode(mode, paths, cookies, options)
+        finally:
+            user.delete()
+
+    def run_mode(self, mode, paths, cookies, options):
+        with serve(mode, options['workers'], options['threads']) as base_url:
+            for path in paths:
+                latencies, errors = self.drive(base_url + path, cookies, options)
+                latencies.sort()
+                self.stdout.write(
+                    f"{mode:<8} {path:<20} p50 {percentile(latencies, 0.5) * 1000:7.1f}ms  "
+                    f"p99 {percentile(latencies, 0.99) * 1000:7.1f}ms  "
+                    f"mean {statistics.mean(latencies) * 1000:7.1f}ms  {errors} errors"
+                )
+
+    def drive(self, url, cookies, options):
+        latencies = []
+        errors = 0
+        lock = threading.Lock()
+        remaining = [options['requests']]
+
+        def client():
+            nonlocal errors
+            session = requests.Session()
+            session.cookies.update(cookies)
+            while True:
+                with lock:
+                    if not remaining[0]:
+                        return
+                    remaining[0] -= 1
+                started = time.perf_counter()
+                try:
+                    ok = session.get(url, timeout=30, allow_redirects=False).status_code == 200
+                except requests.RequestException:
+                    ok = False
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    errors += not ok
+
+        threads = [threading.Thread(target=client) for _ in range(options['concurrency'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return latencies, errors
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking', '0002_accounthistory'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['account', '-timestamp', '-id'], name='txn_account_timestamp_idx'),
+        ),
+    ]
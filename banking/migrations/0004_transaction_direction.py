@@ -0,0 +1,30 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:09
+
+from django.db import migrations, models
+
+
+def backfill_direction(apps, schema_editor):
+    Transaction = apps.get_model('banking', 'Transaction')
+    Transaction.objects.filter(transaction_type__in=['withdrawal', 'payment']).update(direction='debit')
+    # Outgoing transfer legs (including transfers to crypto) take money out;
+    # the incoming leg is the one the transfer view describes as incoming.
+    Transaction.objects.filter(transaction_type='transfer').exclude(
+        description__startswith='Incoming transfer'
+    ).update(direction='debit')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking', '0003_transaction_account_timestamp_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='direction',
+            field=models.CharField(choices=[('credit', 'Credit'), ('debit', 'Debit')], default='credit', max_length=10),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_direction, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:14
+
+from django.db import migrations, models
+
+# The SQLite full-text index of Transaction.description, copied from
+# banking.search as of this migration so later changes there don't alter it
+FTS_TABLE = 'banking_transaction_fts'
+SQLITE_FTS_SQL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        description, content='banking_transaction', content_rowid='id'
+    )""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON banking_transaction BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, description) VALUES (new.id, new.description);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON banking_transaction BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, description) VALUES ('delete', old.id, old.description);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF description ON banking_transaction BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, description) VALUES ('delete', old.id, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, description) VALUES (new.id, new.description);
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+
+def install_sqlite_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in SQLITE_FTS_SQL:
+        schema_editor.execute(statement)
+
+
+def uninstall_sqlite_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in SQLITE_FTS_SQL[:3] + [f"DROP TABLE IF EXISTS {FTS_TABLE}"]:
+        schema_editor.execute(statement)
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking', '0006_account_number_sequence'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['account', 'transaction_type', '-timestamp'], name='txn_account_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['account', 'amount'], name='txn_account_amount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['related_account', '-timestamp'], name='txn_counterparty_idx'),
+        ),
+        migrations.RunPython(install_sqlite_fts, uninstall_sqlite_fts),
+    ]
@@ -0,0 +1,114 @@
+# Store money as scaled integers (see banking.money)
+
+from django.db import migrations, models
+
+from banking.money import MoneyField
+
+CRYPTO = 8  # banking.money.CRYPTO when this migration was written
+
+# The SQLite full-text index of Transaction.description, copied from
+# banking.search as of this migration so later changes there don't alter it
+FTS_TABLE = 'banking_transaction_fts'
+SQLITE_FTS_SQL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        description, content='banking_transaction', content_rowid='id'
+    )""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON banking_transaction BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, description) VALUES (new.id, new.description);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON banking_transaction BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, description) VALUES ('delete', old.id, old.description);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF description ON banking_transaction BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, description) VALUES ('delete', old.id, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, description) VALUES (new.id, new.description);
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+
+def install_sqlite_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in SQLITE_FTS_SQL:
+        schema_editor.execute(statement)
+
+
+def uninstall_sqlite_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in SQLITE_FTS_SQL[:3] + [f"DROP TABLE IF EXISTS {FTS_TABLE}"]:
+        schema_editor.execute(statement)
+
+
+# Copied from banking.money as of this migration, so later changes there
+# don't alter it
+def decimal_to_money(app_label, model_name, fields):
+    """
+    Migration operations turning DecimalFields of one model into MoneyFields.
+
+    ``fields`` maps each field name to its final MoneyField. Values are copied
+    into a new integer column with one UPDATE per table, rounded to the new
+    scale, then the new column replaces the old one.
+    """
+    temporary = {name: f'{name}_units' for name in fields}
+
+    def rescale(apps, schema_editor):
+        model = apps.get_model(app_label, model_name)
+        quote = schema_editor.quote_name
+        assignments = ', '.join(
+            f"{quote(temporary[name])} = CAST(ROUND({quote(name)} * {10 ** field.scale}) AS BIGINT)"
+            for name, field in fields.items()
+        )
+        schema_editor.execute(f"UPDATE {quote(model._meta.db_table)} SET {assignments}")
+
+    operations = [
+        migrations.AddField(model_name, temporary[name], MoneyField(scale=field.scale, null=True))
+        for name, field in fields.items()
+    ]
+    # One way only: the old columns can't be re-added to non-empty tables
+    operations.append(migrations.RunPython(rescale))
+    for name, field in fields.items():
+        operations += [
+            migrations.RemoveField(model_name, name),
+            migrations.RenameField(model_name, temporary[name], name),
+            migrations.AlterField(model_name, name, field),
+        ]
+    return operations
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking', '0007_transaction_search'),
+    ]
+
+    operations = [
+        # The FTS triggers would not survive the Transaction table rebuilds
+        migrations.RunPython(uninstall_sqlite_fts, install_sqlite_fts),
+        migrations.RemoveIndex(model_name='transaction', name='txn_account_amount_idx'),
+        *decimal_to_money('banking', 'bankaccount', {
+            'balance': MoneyField(default=0),
+        }),
+        *decimal_to_money('banking', 'transaction', {
+            'amount': MoneyField(),
+        }),
+        *decimal_to_money('banking', 'balancecheckpoint', {
+            'balance': MoneyField(),
+        }),
+        *decimal_to_money('banking', 'accounthistory', {
+            'checking_balance': MoneyField(default=0),
+            'savings_balance': MoneyField(default=0),
+            'business_balance': MoneyField(default=0),
+            'crypto_balance': MoneyField(scale=CRYPTO, default=0),
+        }),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['account', 'amount'], name='txn_account_amount_idx'),
+        ),
+        migrations.RunPython(install_sqlite_fts, uninstall_sqlite_fts),
+    ]
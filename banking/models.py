@@ -3,6 +3,7 @@ from django.db import models
 from django.conf import settings
 
 from accounts.models import CustomUser
+from .money import CRYPTO, MoneyField
 
 class BankAccount(models.Model):
     ACCOUNT_TYPES = (
@@ -14,12 +15,22 @@ class BankAccount(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     account_type = models.CharField(max_length=20, choices=ACCOUNT_TYPES)
     account_number = models.CharField(max_length=20, unique=True)
-    balance = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    balance = MoneyField(default=0)
+    # Ledger postings since the last BalanceCheckpoint, kept by the ledger
+    postings_since_checkpoint = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
         return f"{self.user.username}'s {self.account_type} Account"
 
+class AccountNumberSequence(models.Model):
+    # Hi-lo counter for banking.numbering; each row hands out blocks of numbers
+    name = models.CharField(max_length=20, unique=True)
+    next_value = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.name} account numbers from {self.next_value}"
+
 class Transaction(models.Model):
     TRANSACTION_TYPES = (
         ('deposit', 'Deposit'),
@@ -28,23 +39,54 @@ class Transaction(models.Model):
         ('payment', 'Payment'),
     )
     
+    DIRECTIONS = (
+        ('credit', 'Credit'),
+        ('debit', 'Debit'),
+    )
+    
     account = models.ForeignKey(BankAccount, on_delete=models.CASCADE)
     transaction_type = models.CharField(max_length=20, choices=TRANSACTION_TYPES)
-    amount = models.DecimalField(max_digits=15, decimal_places=2)
+    # Whether the row added to or took from ``account``; both legs of a
+    # transfer share a transaction_type, so the sign can't be derived from it
+    direction = models.CharField(max_length=10, choices=DIRECTIONS)
+    amount = MoneyField()
     description = models.TextField(blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
     related_account = models.ForeignKey(BankAccount, on_delete=models.SET_NULL, null=True, blank=True, related_name='related_transactions')
+
+    class Meta:
+        indexes = [
+            # Backs keyset pagination of an account's history, newest first
+            models.Index(fields=['account', '-timestamp', '-id'], name='txn_account_timestamp_idx'),
+            # History filters: type within an account, amount ranges and counterparty
+            models.Index(fields=['account', 'transaction_type', '-timestamp'], name='txn_account_type_idx'),
+            models.Index(fields=['account', 'amount'], name='txn_account_amount_idx'),
+            models.Index(fields=['related_account', '-timestamp'], name='txn_counterparty_idx'),
+        ]
     
     def __str__(self):
         return f"{self.transaction_type} of ${self.amount} for {self.account}"
     
+class BalanceCheckpoint(models.Model):
+    account = models.ForeignKey(BankAccount, on_delete=models.CASCADE, related_name='checkpoints')
+    timestamp = models.DateTimeField()
+    balance = MoneyField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['account', 'timestamp'], name='checkpoint_account_ts_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.account} balance ${self.balance} at {self.timestamp}"
+
 class AccountHistory(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     date = models.DateField(auto_now_add=True)
-    checking_balance = models.DecimalField(max_digits=15, decimal_places=2, default=0)
-    savings_balance = models.DecimalField(max_digits=15, decimal_places=2, default=0)
-    business_balance = models.DecimalField(max_digits=15, decimal_places=2, default=0)
-    crypto_balance = models.DecimalField(max_digits=20, decimal_places=8, default=0)
+    checking_balance = MoneyField(default=0)
+    savings_balance = MoneyField(default=0)
+    business_balance = MoneyField(default=0)
+    crypto_balance = MoneyField(scale=CRYPTO, default=0)
 
     class Meta:
         ordering = ['-date']
@@ -0,0 +1,99 @@
+# banking/money.py
+# Money is stored as a scaled integer: cents for bank balances and amounts,
+# 1e-8 units for crypto quantities, prices and crypto cash. Python code still
+# sees exact Decimals, but the database only ever stores, sums and compares
+# integers, which behaves identically on SQLite and PostgreSQL.
+from decimal import ROUND_HALF_EVEN, Decimal
+
+from django import forms
+from django.core import exceptions
+from django.db import models
+from django.db.models import Value
+
+CENTS = 2
+CRYPTO = 8
+
+
+def to_minor(amount, scale=CENTS):
+    """Convert ``amount`` to an integer number of 10**-scale units, rounding half to even"""
+    if isinstance(amount, int):
+        return amount * 10 ** scale
+    if isinstance(amount, float):
+        amount = repr(amount)
+    return int(Decimal(amount).scaleb(scale).to_integral_value(ROUND_HALF_EVEN))
+
+
+def from_minor(units, scale=CENTS):
+    """The exact Decimal for ``units`` of 10**-scale"""
+    return Decimal(units).scaleb(-scale)
+
+
+def round_div(numerator, denominator):
+    """Integer division rounding half to even, for rescaling products exactly"""
+    quotient, remainder = divmod(numerator, denominator)
+    twice = 2 * remainder
+    if twice > denominator or (twice == denominator and quotient % 2):
+        quotient += 1
+    return quotient
+
+
+def multiply(amount, price, scale=CENTS, amount_scale=CRYPTO, price_scale=CRYPTO):
+    """``amount * price`` rounded to ``scale`` places, computed in integers"""
+    product = to_minor(amount, amount_scale) * to_minor(price, price_scale)
+    return from_minor(round_div(product, 10 ** (amount_scale + price_scale - scale)), scale)
+
+
+def prorate(total, part, whole, scale=CRYPTO):
+    """``total * part / whole`` rounded to ``scale`` places, computed in integers"""
+    return from_minor(round_div(to_minor(total, scale) * to_minor(part, scale), to_minor(whole, scale)), scale)
+
+
+def money_value(amount, field):
+    """
+    Wrap ``amount`` for use in an expression against the money ``field``.
+
+    ``F('balance') + amount`` would send the Decimal unscaled; the wrapped
+    value goes through the field's scaling like any saved value.
+    """
+    return Value(amount, output_field=field)
+
+
+class MoneyField(models.BigIntegerField):
+    """A BigIntegerField holding 10**-scale units that reads and writes Decimals"""
+
+    description = 'Fixed-point amount stored as a scaled integer'
+
+    def __init__(self, *args, scale=CENTS, **kwargs):
+        self.scale = scale
+        super().__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super().deconstruct()
+        kwargs['scale'] = self.scale
+        return name, path, args, kwargs
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return from_minor(value, self.scale)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, Decimal):
+            return value
+        try:
+            return Decimal(str(value))
+        except ArithmeticError:
+            raise exceptions.ValidationError(self.error_messages['invalid'], code='invalid', params={'value': value})
+
+    def get_prep_value(self, value):
+        value = models.Field.get_prep_value(self, value)
+        if value is None:
+            return None
+        return to_minor(value, self.scale)
+
+    def formfield(self, **kwargs):
+        return super(models.IntegerField, self).formfield(**{
+            'form_class': forms.DecimalField,
+            'decimal_places': self.scale,
+            **kwargs,
+        })
@@ -0,0 +1,100 @@
+# banking/numbering.py
+import threading
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .models import AccountNumberSequence
+
+# Allocated numbers start here so they never collide with the short
+# "<user id><count>" numbers issued before the allocator existed.
+FIRST_VALUE = 10 ** 9
+
+PREFIXES = {
+    'bank': '',
+    'crypto': 'CRYPTO',
+}
+
+_blocks = {}
+_blocks_lock = threading.Lock()
+
+
+def luhn_check_digit(digits):
+    """Return the Luhn check digit for a string of digits"""
+    total = 0
+    for i, digit in enumerate(reversed(digits)):
+        value = int(digit)
+        if i % 2 == 0:
+            value *= 2
+            if value > 9:
+                value -= 9
+        total += value
+    return str((10 - total % 10) % 10)
+
+
+def is_valid_account_number(number, kind='bank'):
+    prefix = PREFIXES[kind]
+    digits = number[len(prefix):]
+    if not number.startswith(prefix) or len(digits) < 2 or not digits.isdigit():
+        return False
+    return luhn_check_digit(digits[:-1]) == digits[-1]
+
+
+def _reserve_block(kind, size):
+    """Reserve ``size`` consecutive values for ``kind`` and return (first, end)"""
+    with transaction.atomic():
+        AccountNumberSequence.objects.get_or_create(name=kind, defaults={'next_value': FIRST_VALUE})
+        AccountNumberSequence.objects.filter(name=kind).update(next_value=F('next_value') + size)
+        end = AccountNumberSequence.objects.values_list('next_value', flat=True).get(name=kind)
+    return end - size, end
+
+
+def _format(kind, value):
+    digits = str(value)
+    return f"{PREFIXES[kind]}{digits}{luhn_check_digit(digits)}"
+
+
+def allocate_account_numbers(kind, count):
+    """
+    Allocate ``count`` unique account numbers of ``kind`` ('bank' or 'crypto').
+
+    Numbers come from a per-process block reserved with one UPDATE on
+    AccountNumberSequence, so most allocations touch no table at all and none
+    ever has to retry. If the block is reserved inside a transaction that is
+    later rolled back, the unused remainder is discarded rather than reused.
+    """
+    block_size = getattr(settings, 'ACCOUNT_NUMBER_BLOCK_SIZE', 100)
+    # The lock only guards the in-memory blocks; the reservation below runs
+    # outside it so one slow transaction cannot stall every allocating thread
+    with _blocks_lock:
+        current, end = _blocks.pop(kind, (0, 0))
+        first = current
+        current = min(end, current + count)
+        if current < end:
+            _blocks[kind] = (current, end)
+    values = list(range(first, current))
+
+    if len(values) < count:
+        current, end = _reserve_block(kind, max(block_size, count - len(values)))
+        first = current
+        current += count - len(values)
+        values.extend(range(first, current))
+
+        if current < end:
+            remainder = (current, end)
+
+            def publish():
+                # Another thread may have refilled the cache meanwhile; keep
+                # its block and drop this remainder
+                with _blocks_lock:
+                    _blocks.setdefault(kind, remainder)
+
+            # Only hand the rest of the block to later callers once the
+            # reservation is durable
+            transaction.on_commit(publish)
+    return [_format(kind, value) for value in values]
+
+
+def allocate_account_number(kind='bank'):
+    return allocate_account_numbers(kind, 1)[0]
@@ -0,0 +1,52 @@
+# banking/pagination.py
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 50
+
+
+def encode_cursor(timestamp, pk):
+    """Encode the (timestamp, id) of the last row on a page as an opaque token"""
+    raw = f"{timestamp.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return the (timestamp, id) pair of a cursor, or None if it is malformed"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def keyset_page(queryset, cursor=None, page_size=DEFAULT_PAGE_SIZE, field='timestamp', descending=True):
+    """
+    Return one page of ``queryset`` ordered newest first (oldest first when
+    not ``descending``), plus the cursor of the next page (None on the last
+    page).
+
+    Rows are sliced with ``WHERE (field, id) < (cursor)`` rather than OFFSET,
+    so every page is a bounded index range scan no matter how deep it is.
+    """
+    direction, after = ('-', 'lt') if descending else ('', 'gt')
+    queryset = queryset.order_by(f'{direction}{field}', f'{direction}id')
+    position = decode_cursor(cursor)
+    if position:
+        value, pk = position
+        queryset = queryset.filter(
+            Q(**{f'{field}__{after}': value}) | Q(**{field: value, f'id__{after}': pk})
+        )
+
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, field), last.pk)
+    return rows, next_cursor
@@ -0,0 +1,63 @@
+# banking/search.py
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'banking_transaction_fts'
+
+# SQLite keeps an FTS5 index of Transaction.description in a shadow table.
+# It is an external-content table over banking_transaction, kept in sync by
+# triggers created in migration 0007. Django rebuilds SQLite tables for most
+# schema changes, which drops their triggers, so migrations that alter
+# Transaction must drop and recreate them the way 0008_money_fields does.
+
+
+def search_transactions(queryset, query):
+    """
+    Narrow ``queryset`` to transactions whose description matches ``query``.
+
+    Every word must match, as a prefix. On SQLite this is an FTS5 lookup; on
+    PostgreSQL it is a full-text match on to_tsvector(description), which
+    should be backed by a GIN expression index when we move there. Other
+    backends fall back to a LIKE scan.
+    """
+    words = re.findall(r'\w+', query or '')
+    if not words:
+        return queryset
+
+    if connection.vendor == 'sqlite':
+        match = ' '.join(f'"{word}"*' for word in words)
+        return queryset.filter(pk__in=RawSQL(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match]
+        ))
+    if connection.vendor == 'postgresql':
+        from django.contrib.postgres.search import SearchQuery, SearchVector
+
+        match = ' & '.join(f'{word}:*' for word in words)
+        return queryset.annotate(
+            description_search=SearchVector('description', config='simple')
+        ).filter(description_search=SearchQuery(match, config='simple', search_type='raw'))
+
+    condition = Q()
+    for word in words:
+        condition &= Q(description__icontains=word)
+    return queryset.filter(condition)
+
+
+def filter_transactions(queryset, filters):
+    """Apply the cleaned fields of a TransactionFilterForm to ``queryset``"""
+    if filters.get('start'):
+        queryset = queryset.filter(timestamp__gte=filters['start'])
+    if filters.get('end'):
+        queryset = queryset.filter(timestamp__lt=filters['end'])
+    if filters.get('transaction_type'):
+        queryset = queryset.filter(transaction_type=filters['transaction_type'])
+    if filters.get('min_amount') is not None:
+        queryset = queryset.filter(amount__gte=filters['min_amount'])
+    if filters.get('max_amount') is not None:
+        queryset = queryset.filter(amount__lte=filters['max_amount'])
+    if filters.get('counterparty'):
+        queryset = queryset.filter(related_account__account_number=filters['counterparty'])
+    return search_transactions(queryset, filters.get('q'))
@@ -0,0 +1,59 @@
+# banking/snapshots.py
+from datetime import date
+
+from django.contrib.auth import get_user_model
+
+from .models import AccountHistory
+from .summary import annotate_portfolio_totals
+
+BALANCE_FIELDS = ['checking_balance', 'savings_balance', 'business_balance', 'crypto_balance']
+
+
+def iter_user_id_chunks(chunk_size):
+    """Yield lists of user ids in primary key order, seeking past the last id of each chunk"""
+    users = get_user_model().objects.order_by('pk').values_list('pk', flat=True)
+    last_id = 0
+    while True:
+        ids = list(users.filter(pk__gt=last_id)[:chunk_size])
+        if not ids:
+            return
+        yield ids
+        last_id = ids[-1]
+
+
+def snapshot_users(user_ids, prices=None):
+    """
+    Write today's AccountHistory row for each user with one grouped query.
+
+    The crypto balance is the crypto account's cash plus its holdings marked
+    to market in one vectorized pass; ``prices`` is an optional price_vector()
+    so a run over many chunks reads prices once. Rows are upserted on
+    (user, date), so re-running the snapshot on the same day refreshes the
+    balances instead of violating the unique constraint.
+    """
+    from crypto.valuation import holdings_values
+
+    totals = annotate_portfolio_totals(
+        get_user_model().objects.filter(pk__in=user_ids)
+    ).values_list('pk', 'checking', 'savings', 'business', 'crypto')
+    holdings = holdings_values(user_ids, prices)
+
+    today = date.today()
+    rows = [
+        AccountHistory(
+            user_id=pk,
+            date=today,
+            checking_balance=checking or 0,
+            savings_balance=savings or 0,
+            business_balance=business or 0,
+            crypto_balance=(crypto or 0) + holdings.get(pk, 0)
+        )
+        for pk, checking, savings, business, crypto in totals
+    ]
+    AccountHistory.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['user', 'date'],
+        update_fields=BALANCE_FIELDS
+    )
+    return len(rows)
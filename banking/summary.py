@@ -0,0 +1,80 @@
+# banking/summary.py
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery, Sum
+
+from accounts.models import CustomUser
+
+TIME_RANGES = ('1h', '1d', '7d', '1m')
+
+
+def summary_cache_timeout():
+    return getattr(settings, 'PORTFOLIO_SUMMARY_CACHE_TIMEOUT', 300)
+
+
+def summary_cache_key(user_id, time_range):
+    return f"portfolio-summary:{user_id}:{time_range}"
+
+
+def annotate_portfolio_totals(users):
+    """
+    Annotate a user queryset with per-type bank totals and the crypto balance.
+
+    The bank totals are one conditional aggregation over the user's accounts;
+    the crypto balance is a correlated subquery so the two joins can't fan out.
+    """
+    from crypto.models import CryptoAccount
+
+    crypto_balance = CryptoAccount.objects.filter(user=OuterRef('pk')).values('balance')[:1]
+    return users.annotate(
+        checking=Sum('bankaccount__balance', filter=Q(bankaccount__account_type='checking')),
+        savings=Sum('bankaccount__balance', filter=Q(bankaccount__account_type='savings')),
+        business=Sum('bankaccount__balance', filter=Q(bankaccount__account_type='business')),
+        crypto=Subquery(crypto_balance),
+    )
+
+
+def portfolio_totals(user):
+    """Per-type bank totals and the crypto balance (cash plus holdings at market) for a user"""
+    from crypto.valuation import holdings_values
+
+    totals = annotate_portfolio_totals(CustomUser.objects.filter(pk=user.pk)).values(
+        'checking', 'savings', 'business', 'crypto'
+    ).first() or {}
+    totals = {key: totals.get(key) or 0 for key in ('checking', 'savings', 'business', 'crypto')}
+    totals['crypto'] += holdings_values([user.pk]).get(user.pk, 0)
+    return totals
+
+
+def get_portfolio_summary(user, time_range, builder):
+    """
+    Return the cached dashboard summary for ``user``, calling
+    ``builder(user, time_range)`` to rebuild it on a miss.
+    """
+    key = summary_cache_key(user.pk, time_range)
+    summary = cache.get(key)
+    if summary is None:
+        summary = builder(user, time_range)
+        cache.set(key, summary, summary_cache_timeout())
+    return summary
+
+
+async def aget_portfolio_summary(user, time_range, builder):
+    """get_portfolio_summary for async views; ``builder`` is a coroutine function"""
+    key = summary_cache_key(user.pk, time_range)
+    summary = await cache.aget(key)
+    if summary is None:
+        summary = await builder(user, time_range)
+        await cache.aset(key, summary, summary_cache_timeout())
+    return summary
+
+
+def invalidate_portfolio_summary(*user_ids):
+    """Drop cached summaries once the current transaction (if any) commits"""
+    keys = [
+        summary_cache_key(user_id, time_range)
+        for user_id in set(user_ids)
+        for time_range in TIME_RANGES
+    ]
+    transaction.on_commit(lambda: cache.delete_many(keys))
@@ -1,251 +1,149 @@
 # banking/views.py
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta
+from decimal import Decimal
 import json
 
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
+from django.core.handlers.asgi import ASGIRequest
 from django.contrib import messages
+from django.conf import settings
 from django.utils import timezone
-from django.db.models import Sum
-
-from banking.models import BankAccount, Transaction, AccountHistory
-from crypto.models import CryptoAccount, CryptoTransaction
-from .models import BankAccount, Transaction
-from .forms import BankAccountForm, DepositWithdrawalForm, TransferForm
-from decimal import Decimal
 
+from banking_project.cache import cache_stats
+from .models import AccountHistory, BankAccount, Transaction
+from .balances import balance_series, lttb_indices
+from .concurrency import gather_queries
+from .exports import async_stream, csv_statement, gzip_stream, ofx_statement
+from .forms import BankAccountForm, BatchTransferForm, DepositWithdrawalForm, StatementExportForm, TransactionFilterForm, TransferForm
+from .ledger import LedgerError, post_batch_transfers, post_deposit, post_transfer, post_withdrawal
+from .numbering import allocate_account_number
+from .pagination import keyset_page
+from .search import filter_transactions
+from .snapshots import snapshot_users
+from .summary import TIME_RANGES, aget_portfolio_summary, invalidate_portfolio_summary, portfolio_totals
 
 
 def get_account_color(account_type):
     colors = {
         'checking': '#36A2EB',
         'savings': '#4BC0C0',
-        'business': '#FFCE56'
+        'business': '#FFCE56',
+        'crypto': '#FF6384'
     }
     return colors.get(account_type, '#9966FF')
 
-def generate_mock_history(current_balance, time_delta, volatility=1.0):
-    """Generate realistic mock historical data"""
-    import random
-    base_value = float(current_balance)
-    return [
-        round(base_value * (1 + (random.random() - 0.5) * volatility * 0.1 * (i+1)), 2)
-        for i in range(7)
-    ]
-
-def interpolate_history(history, interval):
-    """Create higher resolution data from daily snapshots"""
-    from django.db.models.functions import Trunc
-    from django.db.models import DateTimeField
-    
-    # This would need actual implementation based on your data
-    # For now returns the raw history
-    return history
-
-def get_historical_data(user, time_range):
-    now = timezone.now()
-    
-    if time_range == '1h':
-        start_date = now - timedelta(hours=1)
-        time_format = '%H:%M'
-        interval = '5 minutes'
-    elif time_range == '1d':
-        start_date = now - timedelta(days=1)
-        time_format = '%H:%M'
-        interval = '1 hour'
-    elif time_range == '1m':
-        start_date = now - timedelta(days=30)
-        time_format = '%m-%d'
-        interval = '1 day'
-    else:  # 7 days
-        start_date = now - timedelta(days=7)
-        time_format = '%m-%d'
-        interval = '1 day'
-
-    history = AccountHistory.objects.filter(
-        user=user,
-        date__gte=start_date
-    ).order_by('date')
 
-    # For higher resolution than daily snapshots
-    if time_range == '1h' or time_range == '1d':
-        history = interpolate_history(history, interval)
+CHART_RANGES = {
+    # range: (window, bucket, label format)
+    '1h': (timedelta(hours=1), '5min', '%H:%M'),
+    '1d': (timedelta(days=1), '5min', '%H:%M'),
+    '7d': (timedelta(days=7), 'day', '%m-%d'),
+    '1m': (timedelta(days=30), 'day', '%m-%d'),
+}
+SERIES_TYPES = ('checking', 'savings', 'business', 'crypto')
 
-    return history, time_format
+def interpolate_history(accounts, crypto_balance, start, end, bucket):
+    """Rebuild per-type balances at ``bucket`` resolution from the Transaction ledger"""
+    points, per_account = balance_series(accounts, start, end, bucket)
+    series = {account_type: [0] * len(points) for account_type in SERIES_TYPES}
+    for account in accounts:
+        totals = series[account.account_type]
+        for index, balance in enumerate(per_account[account.pk]):
+            totals[index] += balance
+    # Crypto cash doesn't go through the bank ledger, so hold it flat
+    series['crypto'] = [crypto_balance] * len(points)
+    return points, series
+
+def load_daily_history(user, time_range):
+    """The snapshots a daily chart range is drawn from (None for intraday ranges)"""
+    window, bucket, _ = CHART_RANGES[time_range]
+    if bucket != 'day':
+        return None
+    return list(AccountHistory.objects.filter(
+        user=user,
+        date__gte=(timezone.now() - window).date()
+    ).order_by('date'))
 
+def get_historical_data(user, time_range, accounts, current_data, history=None):
+    """Return chart labels and per-type balance series, downsampled to the point budget"""
+    window, bucket, time_format = CHART_RANGES[time_range]
+    now = timezone.now()
 
-def generate_pie_data(accounts, crypto_account):
-    pie_data = {
-        'labels': [],
-        'datasets': [{
-            'data': [],
-            'backgroundColor': []
-        }]
+    if bucket == 'day':
+        # Daily ranges read the snapshots, with the live balances as the last point
+        if history is None:
+            history = load_daily_history(user, time_range)
+        points = [h.date for h in history] + [now]
+        series = {
+            account_type: [getattr(h, f'{account_type}_balance') for h in history] + [current_data[account_type]]
+            for account_type in SERIES_TYPES
+        }
+    else:
+        points, series = interpolate_history(accounts, current_data['crypto'], now - window, now, bucket)
+
+    totals = [sum(values) for values in zip(*series.values())]
+    keep = lttb_indices(totals, getattr(settings, 'CHART_POINT_BUDGET', 120))
+    labels = [points[i].strftime(time_format) for i in keep]
+    return labels, {
+        account_type: [float(values[i]) for i in keep]
+        for account_type, values in series.items()
     }
 
-    # Add bank accounts
-    for account in accounts:
-        pie_data['labels'].append(account.get_account_type_display())
-        pie_data['datasets'][0]['data'].append(float(account.balance))
-        pie_data['datasets'][0]['backgroundColor'].append(
-            get_account_color(account.account_type)
-        )
-
-    # Add crypto if exists
-    if crypto_account:
-        pie_data['labels'].append('Crypto Investments')
-        pie_data['datasets'][0]['data'].append(float(crypto_account.balance))
-        pie_data['datasets'][0]['backgroundColor'].append('#FF6384')
-
-        # Add pending crypto transactions
-        pending_total = CryptoTransaction.objects.filter(
-            user=crypto_account.user,
-            status='pending'
-        ).aggregate(total=Sum('total_value'))['total'] or 0
-
-        if pending_total > 0:
-            pie_data['labels'].append('Pending Crypto Orders')
-            pie_data['datasets'][0]['data'].append(float(pending_total))
-            pie_data['datasets'][0]['backgroundColor'].append('#CCCCCC')
 
 def create_daily_snapshot(user):
     """Create daily snapshot of all account balances"""
-    accounts = BankAccount.objects.filter(user=user)
-    checking = accounts.filter(account_type='checking').first()
-    savings = accounts.filter(account_type='savings').first()
-    business = accounts.filter(account_type='business').first()
-    
-    try:
-        crypto_account = CryptoAccount.objects.get(user=user)
-        crypto_balance = crypto_account.balance
-    except CryptoAccount.DoesNotExist:
-        crypto_balance = 0
-
-    AccountHistory.objects.create(
-        user=user,
-        checking_balance=checking.balance if checking else 0,
-        savings_balance=savings.balance if savings else 0,
-        business_balance=business.balance if business else 0,
-        crypto_balance=crypto_balance
+    snapshot_users([user.pk])
+
+
+def build_dashboard_summary(user, time_range):
+    """Build the cacheable part of the dashboard for one user and time range"""
+    accounts = list(BankAccount.objects.filter(user=user))
+
+    # Calculate current totals in one conditional aggregation
+    current_data = portfolio_totals(user)
+    return summarize_dashboard(user, time_range, accounts, current_data, load_daily_history(user, time_range))
+
+
+async def abuild_dashboard_summary(user, time_range):
+    """build_dashboard_summary with the accounts, totals and snapshots read concurrently"""
+    accounts, current_data, history = await gather_queries(
+        lambda: list(BankAccount.objects.filter(user=user)),
+        lambda: portfolio_totals(user),
+        lambda: load_daily_history(user, time_range),
     )
+    return await sync_to_async(summarize_dashboard)(user, time_range, accounts, current_data, history)
 
 
-@login_required
-def home_view(request):
-    # Get all account data
-    accounts = BankAccount.objects.filter(user=request.user)
-    try:
-        crypto_account = CryptoAccount.objects.get(user=request.user)
-    except CryptoAccount.DoesNotExist:
-        crypto_account = None
-    
-    # Calculate current totals
+def summarize_dashboard(user, time_range, accounts, current_data, history):
+    # The accounts and the totals may have been read on different connections
+    # (gather_queries), so take the bank totals from the accounts listed
     current_data = {
-        'checking': accounts.filter(account_type='checking').aggregate(Sum('balance'))['balance__sum'] or 0,
-        'savings': accounts.filter(account_type='savings').aggregate(Sum('balance'))['balance__sum'] or 0,
-        'business': accounts.filter(account_type='business').aggregate(Sum('balance'))['balance__sum'] or 0,
-        'crypto': crypto_account.balance
+        **current_data,
+        **{
+            account_type: sum((a.balance for a in accounts if a.account_type == account_type), Decimal('0'))
+            for account_type in ('checking', 'savings', 'business')
+        }
     }
-
-
-    # Calculate total balance
-    total_balance = sum(account.balance for account in accounts)
-    if crypto_account:
-        total_balance += crypto_account.balance
-    
-    # Time range handling
-    time_range = request.GET.get('range', '7d')  # Default 7 days
-    now = datetime.now()
-    
-    if time_range == '1h':
-        delta = timedelta(hours=1)
-        time_format = '%H:%M'
-    elif time_range == '1d':
-        delta = timedelta(days=1)
-        time_format = '%H:%M'
-    elif time_range == '1m':
-        delta = timedelta(days=30)
-        time_format = '%m-%d'
-    else:  # 7 days
-        delta = timedelta(days=7)
-        time_format = '%m-%d'
-
-   # Get real historical data
-    history, time_format = get_historical_data(request.user, time_range)
-    
-    # Generate time series data (show current values if no history)
+    # Get real historical data
+    labels, series = get_historical_data(user, time_range, accounts, current_data, history)
     time_series = {
-        'labels': ['Now'],
+        'labels': labels,
         'datasets': [
             {
-                'label': 'Checking',
-                'data': [float(current_data['checking'])],
-                'borderColor': '#36A2EB'
-            },
-            {
-                'label': 'Savings',
-                'data': [float(current_data['savings'])],
-                'borderColor': '#4BC0C0'
-            },
-            {
-                'label': 'Business',
-                'data': [float(current_data['business'])],
-                'borderColor': '#FFCE56'
-            },
-            {
-                'label': 'Crypto',
-                'data': [float(current_data['crypto'])],
-                'borderColor': '#FF6384'
+                'label': account_type.capitalize(),
+                'data': series[account_type],
+                'borderColor': get_account_color(account_type),
+                'borderWidth': 2,
+                'fill': False
             }
+            for account_type in SERIES_TYPES
+            if any(series[account_type])
         ]
     }
 
-    # Add checking account data
-    if any(h.checking_balance for h in history):
-        time_series['datasets'].append({
-            'label': 'Checking Account',
-            'data': [float(h.checking_balance) for h in history],
-            'borderColor': '#36A2EB',
-            'borderWidth': 2,
-            'fill': False
-        })
-
-    # Add savings account data
-    if any(h.savings_balance for h in history):
-        time_series['datasets'].append({
-            'label': 'Savings Account',
-            'data': [float(h.savings_balance) for h in history],
-            'borderColor': '#4BC0C0',
-            'borderWidth': 2,
-            'fill': False
-        })
-
-    # Add business account data
-    if any(h.business_balance for h in history):
-        time_series['datasets'].append({
-            'label': 'Business Account',
-            'data': [float(h.business_balance) for h in history],
-            'borderColor': '#FFCE56',
-            'borderWidth': 2,
-            'fill': False
-        })
-
-    # Add crypto data
-    if any(h.crypto_balance for h in history):
-        time_series['datasets'].append({
-            'label': 'Crypto Investments',
-            'data': [float(h.crypto_balance) for h in history],
-            'borderColor': '#FF6384',
-            'borderWidth': 2,
-            'fill': False
-        })
-    
-    # Generate time labels
-    time_series['labels'] = [
-        (now - delta * (6-i)/6).strftime(time_format) 
-        for i in range(7)
-    ]
-
     # Generate pie chart data
     pie_data = {
         'labels': ['Checking', 'Savings', 'Business', 'Crypto'],
@@ -265,13 +163,32 @@ def home_view(request):
         }]
     }
 
-    context = {
-        'time_series': json.dumps(time_series),
-        'pie_data': json.dumps(pie_data),
+    return {
+        'time_series': {
+            'labels': json.dumps(time_series['labels']),
+            'datasets': json.dumps(time_series['datasets'])
+        },
+        'pie_data': {
+            'labels': json.dumps(pie_data['labels']),
+            'datasets': json.dumps(pie_data['datasets'])
+        },
         'accounts': accounts,
         'total_balance': sum(current_data.values())
     }
-    return render(request, 'banking/home.html', context)
+
+
+@login_required
+async def home_view(request):
+    time_range = request.GET.get('range', '7d')  # Default 7 days
+    if time_range not in TIME_RANGES:
+        time_range = '7d'
+
+    user = await request.auser()
+    context = await aget_portfolio_summary(user, time_range, abuild_dashboard_summary)
+    # Passing the user saves the template a second lookup through request.user
+    return await sync_to_async(render)(request, 'banking/home.html', {
+        **context, 'time_range': time_range, 'user': user
+    })
 
 @login_required
 def create_account_view(request):
@@ -280,8 +197,9 @@ def create_account_view(request):
         if form.is_valid():
             account = form.save(commit=False)
             account.user = request.user
-            account.account_number = f"{request.user.id}{BankAccount.objects.count() + 1}"
+            account.account_number = allocate_account_number('bank')
             account.save()
+            invalidate_portfolio_summary(request.user.id)
             messages.success(request, 'Account created successfully!')
             return redirect('home')
     else:
@@ -294,17 +212,13 @@ def deposit_view(request, account_id):
     if request.method == 'POST':
         form = DepositWithdrawalForm(request.POST)
         if form.is_valid():
-            amount = form.cleaned_data['amount']
-            account.balance += Decimal(amount)
-            account.save()
-            Transaction.objects.create(
-                account=account,
-                transaction_type='deposit',
-                amount=amount,
-                description=form.cleaned_data['description']
-            )
-            messages.success(request, 'Deposit successful!')
-            return redirect('home')
+            try:
+                post_deposit(account, form.cleaned_data['amount'], form.cleaned_data['description'])
+            except LedgerError as e:
+                messages.error(request, str(e))
+            else:
+                messages.success(request, 'Deposit successful!')
+                return redirect('home')
     else:
         form = DepositWithdrawalForm()
     return render(request, 'banking/deposit.html', {'form': form, 'account': account})
@@ -315,20 +229,13 @@ def withdraw_view(request, account_id):
     if request.method == 'POST':
         form = DepositWithdrawalForm(request.POST)
         if form.is_valid():
-            amount = form.cleaned_data['amount']
-            if account.balance >= Decimal(amount):
-                account.balance -= Decimal(amount)
-                account.save()
-                Transaction.objects.create(
-                    account=account,
-                    transaction_type='withdrawal',
-                    amount=amount,
-                    description=form.cleaned_data['description']
-                )
+            try:
+                post_withdrawal(account, form.cleaned_data['amount'], form.cleaned_data['description'])
+            except LedgerError as e:
+                messages.error(request, str(e))
+            else:
                 messages.success(request, 'Withdrawal successful!')
                 return redirect('home')
-            else:
-                messages.error(request, 'Insufficient funds.')
     else:
         form = DepositWithdrawalForm()
     return render(request, 'banking/withdraw.html', {'form': form, 'account': account})
@@ -339,7 +246,6 @@ def transfer_view(request, account_id):
     if request.method == 'POST':
         form = TransferForm(request.POST)
         if form.is_valid():
-            amount = form.cleaned_data['amount']
             to_account_number = form.cleaned_data['to_account']
             
             try:
@@ -348,38 +254,99 @@ def transfer_view(request, account_id):
                 messages.error(request, 'Destination account not found.')
                 return render(request, 'banking/transfer.html', {'form': form, 'account': from_account})
             
-            if from_account.balance >= Decimal(amount):
-                from_account.balance -= Decimal(amount)
-                to_account.balance += Decimal(amount)
-                from_account.save()
-                to_account.save()
-                
-                Transaction.objects.create(
-                    account=from_account,
-                    transaction_type='transfer',
-                    amount=amount,
-                    description=form.cleaned_data['description'],
-                    related_account=to_account
-                )
-                
-                Transaction.objects.create(
-                    account=to_account,
-                    transaction_type='transfer',
-                    amount=amount,
-                    description=f"Incoming transfer from {from_account.user.username}",
-                    related_account=from_account
+            try:
+                post_transfer(
+                    from_account,
+                    to_account,
+                    form.cleaned_data['amount'],
+                    form.cleaned_data['description']
                 )
-                
+            except LedgerError as e:
+                messages.error(request, str(e))
+            else:
                 messages.success(request, 'Transfer successful!')
                 return redirect('home')
-            else:
-                messages.error(request, 'Insufficient funds.')
     else:
         form = TransferForm()
     return render(request, 'banking/transfer.html', {'form': form, 'account': from_account})
 
+@login_required
+def batch_transfer_view(request):
+    results = None
+    if request.method == 'POST':
+        form = BatchTransferForm(request.POST, request.FILES)
+        if form.is_valid():
+            results = post_batch_transfers(request.user, form.cleaned_data['file'])
+            posted = sum(1 for result in results if result['ok'])
+            if posted:
+                messages.success(request, f'{posted} of {len(results)} payments posted.')
+            if posted < len(results):
+                messages.error(request, f'{len(results) - posted} payments failed; see the report below.')
+    else:
+        form = BatchTransferForm()
+    return render(request, 'banking/batch_transfer.html', {'form': form, 'results': results})
+
 @login_required
 def transaction_history_view(request):
     accounts = BankAccount.objects.filter(user=request.user)
-    transactions = Transaction.objects.filter(account__in=accounts).order_by('-timestamp')
-    return render(request, 'banking/transaction_history.html', {'transactions': transactions})
\ No newline at end of file
+    transactions = Transaction.objects.filter(account__in=accounts).select_related('account')
+
+    filter_form = TransactionFilterForm(request.GET)
+    if filter_form.is_valid():
+        transactions = filter_transactions(transactions, filter_form.cleaned_data)
+    transactions, next_cursor = keyset_page(transactions, request.GET.get('cursor'))
+
+    # Keep the filters on the "Load more" link
+    next_query = None
+    if next_cursor:
+        params = request.GET.copy()
+        params['cursor'] = next_cursor
+        next_query = params.urlencode()
+    return render(request, 'banking/transaction_history.html', {
+        'transactions': transactions,
+        'next_cursor': next_cursor,
+        'next_query': next_query,
+        'filter_form': filter_form
+    })
+
+@login_required
+def export_transactions_view(request):
+    form = StatementExportForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest(' '.join(form.errors.get('__all__', ['Invalid export parameters.'])))
+
+    transactions = Transaction.objects.filter(account__user=request.user)
+    tz = timezone.get_current_timezone()
+    start, end = form.cleaned_data['start'], form.cleaned_data['end']
+    start_time = datetime.combine(start, time.min, tz) if start else None
+    # The end date is inclusive
+    end_time = datetime.combine(end + timedelta(days=1), time.min, tz) if end else timezone.now()
+    if start_time:
+        transactions = transactions.filter(timestamp__gte=start_time)
+    if end:
+        transactions = transactions.filter(timestamp__lt=end_time)
+
+    if form.cleaned_data['format'] == 'ofx':
+        content = ofx_statement(transactions, start_time or timezone.make_aware(datetime(1970, 1, 1)), end_time)
+        content_type, extension = 'application/x-ofx', 'ofx'
+    else:
+        content = csv_statement(transactions)
+        content_type, extension = 'text/csv', 'csv'
+
+    filename = f"transactions.{extension}"
+    if form.cleaned_data['gzip']:
+        content = gzip_stream(content)
+        content_type, filename = 'application/gzip', f"{filename}.gz"
+    if isinstance(request, ASGIRequest):
+        content = async_stream(content)
+
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@login_required
+def cache_metrics_view(request):
+    """Cache hits and misses per key namespace, as counted by this worker process"""
+    if not request.user.is_superuser:
+        return redirect('home')
+    return JsonResponse({'backend': settings.CACHES['default']['BACKEND'], 'namespaces': cache_stats()})
@@ -0,0 +1,81 @@
+# banking_project/cache.py
+# The shared cache layer. With CACHE_URL (redis://...) every process uses
+# the same Redis-compatible server; without it each process keeps a local
+# memory cache, so nothing external is needed to run the app. Either way
+# the backend counts hits and misses per key namespace (the part of the key
+# before the first ':'; sessions are counted as 'sessions').
+import threading
+from collections import defaultdict
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.cache.backends.redis import RedisCache
+
+_MISSING = object()
+_stats = defaultdict(lambda: {'hits': 0, 'misses': 0})
+_stats_lock = threading.Lock()
+
+
+def cache_config(url=None, timeout=300, key_prefix='banking', max_entries=10000):
+    """The CACHES['default'] entry: Redis at ``url``, or local memory without one"""
+    if url:
+        return {
+            'BACKEND': 'banking_project.cache.MeteredRedisCache',
+            'LOCATION': url,
+            'TIMEOUT': timeout,
+            'KEY_PREFIX': key_prefix,
+        }
+    return {
+        'BACKEND': 'banking_project.cache.MeteredLocMemCache',
+        'LOCATION': key_prefix,
+        'TIMEOUT': timeout,
+        'OPTIONS': {'MAX_ENTRIES': max_entries},
+    }
+
+
+def key_namespace(key):
+    # Imported here: settings.py imports this module before apps are loaded
+    from django.contrib.sessions.backends.cached_db import KEY_PREFIX as SESSION_KEY_PREFIX
+
+    if key.startswith(SESSION_KEY_PREFIX):
+        return 'sessions'
+    return key.split(':', 1)[0]
+
+
+def _record(key, hit):
+    with _stats_lock:
+        _stats[key_namespace(key)]['hits' if hit else 'misses'] += 1
+
+
+def cache_stats():
+    """``{namespace: {'hits', 'misses', 'hit_rate'}}`` for this process since the last reset"""
+    with _stats_lock:
+        return {
+            namespace: {**counts, 'hit_rate': counts['hits'] / ((counts['hits'] + counts['misses']) or 1)}
+            for namespace, counts in sorted(_stats.items())
+        }
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+class MeteredCacheMixin:
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        _record(key, value is not _MISSING)
+        return default if value is _MISSING else value
+
+    def get_many(self, keys, version=None):
+        found = super().get_many(keys, version)
+        for key in keys:
+            _record(key, key in found)
+        return found
+
+
+class MeteredLocMemCache(MeteredCacheMixin, LocMemCache):
+    pass
+
+
+class MeteredRedisCache(MeteredCacheMixin, RedisCache):
+    pass
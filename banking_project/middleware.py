@@ -0,0 +1,218 @@
+# banking_project/middleware.py
+# Per-request SQL profiling, switched on with PROFILING_ENABLED. A sampled
+# request gets a profile in a context variable; every database connection
+# carries an execute wrapper that appends to the current profile, so queries
+# run from worker threads (e.g. gather_queries) are counted too. Requests
+# that aren't sampled pay one context variable lookup per query. A streamed
+# body is profiled as it is consumed and logged when it ends.
+import json
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger('banking_project.profiling')
+
+_current_profile = ContextVar('request_profile', default=None)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_LIST = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+
+
+def normalize_sql(sql):
+    """Reduce ``sql`` to its shape: literals become ``?`` and IN lists ``(...)``"""
+    sql = _NUMBER.sub('?', _STRING.sub('?', sql))
+    return _LIST.sub('(...)', sql)
+
+
+class RequestProfile:
+    def __init__(self):
+        self.queries = []
+        self.started = time.perf_counter()
+
+    def add(self, sql, params, duration):
+        self.queries.append((sql, params, duration))
+
+    @property
+    def sql_time(self):
+        return sum(duration for _, _, duration in self.queries)
+
+    def similar(self, threshold):
+        """``[(normalized sql, count, exact duplicates)]`` for shapes run ``threshold`` or more times"""
+        shapes = Counter(normalize_sql(sql) for sql, _, _ in self.queries)
+        exact = Counter((sql, repr(params)) for sql, params, _ in self.queries)
+        repeated = []
+        for shape, count in shapes.most_common():
+            if count < threshold:
+                break
+            duplicates = sum(
+                n - 1 for (sql, _), n in exact.items() if n > 1 and normalize_sql(sql) == shape
+            )
+            repeated.append((shape, count, duplicates))
+        return repeated
+
+
+def record_query(execute, sql, params, many, context):
+    profile = _current_profile.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.add(sql, params, time.perf_counter() - started)
+
+
+def _wrap_connection(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class QueryProfilingMiddleware:
+    """
+    Times sampled requests and their SQL, reports them in a JSON log line
+    (and a Server-Timing header if PROFILING_SERVER_TIMING), and warns when a request runs more than
+    PROFILING_QUERY_BUDGET queries or repeats one query shape
+    PROFILING_SIMILAR_THRESHOLD times (the usual sign of an N+1).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 1.0)
+        self.query_budget = getattr(settings, 'PROFILING_QUERY_BUDGET', 50)
+        self.similar_threshold = getattr(settings, 'PROFILING_SIMILAR_THRESHOLD', 5)
+        self.server_timing = getattr(settings, 'PROFILING_SERVER_TIMING', False)
+        connection_created.connect(_wrap_connection, dispatch_uid='banking_project.profiling')
+        for connection in connections.all(initialized_only=True):
+            _wrap_connection(None, connection)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        profile = RequestProfile()
+        token = _current_profile.set(profile)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_profile.reset(token)
+        return self.report(request, response, profile)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        profile = RequestProfile()
+        token = _current_profile.set(profile)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_profile.reset(token)
+        return self.report(request, response, profile)
+
+    def report(self, request, response, profile):
+        if self.server_timing:
+            self.add_server_timing(response, profile)
+        if response.streaming:
+            # The body is produced after this returns; profile it as it is
+            # consumed and log once it is done
+            if response.is_async:
+                response.streaming_content = self.profile_async_stream(
+                    request, response, response.streaming_content, profile
+                )
+            else:
+                response.streaming_content = self.profile_stream(request, response, response.streaming_content, profile)
+        else:
+            self.log(request, response, profile)
+        return response
+
+    def add_server_timing(self, response, profile):
+        total = time.perf_counter() - profile.started
+        sql_time = profile.sql_time
+        similar = profile.similar(self.similar_threshold)
+        timings = [
+            f'sql;dur={sql_time * 1000:.1f};desc="{len(profile.queries)} '
+            f'{"query" if len(profile.queries) == 1 else "queries"}"',
+            f'app;dur={(total - sql_time) * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ]
+        if similar:
+            timings.append(f'similar;desc="{sum(count for _, count, _ in similar)} repeated queries"')
+        if response.streaming:
+            # Headers go out before the body, so these figures stop there
+            timings.append('partial;desc="streamed body not included"')
+        existing = response.get('Server-Timing')
+        response['Server-Timing'] = ', '.join(([existing] if existing else []) + timings)
+
+    def profile_stream(self, request, response, content, profile):
+        chunks = iter(content)
+        try:
+            while True:
+                token = _current_profile.set(profile)
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    return
+                finally:
+                    _current_profile.reset(token)
+                yield chunk
+        finally:
+            self.log(request, response, profile)
+
+    async def profile_async_stream(self, request, response, content, profile):
+        chunks = aiter(content)
+        try:
+            while True:
+                token = _current_profile.set(profile)
+                try:
+                    chunk = await anext(chunks)
+                except StopAsyncIteration:
+                    return
+                finally:
+                    _current_profile.reset(token)
+                yield chunk
+        finally:
+            self.log(request, response, profile)
+
+    def log(self, request, response, profile):
+        total = time.perf_counter() - profile.started
+        sql_time = profile.sql_time
+        similar = profile.similar(self.similar_threshold)
+        match = getattr(request, 'resolver_match', None)
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'streamed': response.streaming,
+            'total_ms': round(total * 1000, 1),
+            'sql_ms': round(sql_time * 1000, 1),
+            'queries': len(profile.queries),
+            'similar': [
+                {'sql': shape, 'count': count, 'duplicates': duplicates}
+                for shape, count, duplicates in similar
+            ],
+        }
+        if len(profile.queries) > self.query_budget or similar:
+            logger.warning(json.dumps(record))
+        else:
+            logger.info(json.dumps(record))
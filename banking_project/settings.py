@@ -15,6 +15,9 @@ import os
 from dotenv import load_dotenv
 from pathlib import Path
 
+from .cache import cache_config
+from .database import parse_database_url
+
 # Load environment variables
 load_dotenv()
 
@@ -55,6 +58,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Removes itself unless PROFILING_ENABLED is on
+    'banking_project.middleware.QueryProfilingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -69,7 +74,7 @@ ROOT_URLCONF = 'banking_project.urls'
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': [BASE_DIR / 'templates'],
+        'DIRS': [BASE_DIR / 'templates', BASE_DIR / 'Templates'],
         'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
@@ -97,11 +102,23 @@ WSGI_APPLICATION = 'banking_project.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# DATABASE_URL picks the database (see banking_project/database.py); it
+# defaults to db.sqlite3 in WAL mode, with connections kept for CONN_MAX_AGE
+# seconds. PostgreSQL uses a psycopg pool of
+# DATABASE_POOL_MIN_SIZE..DATABASE_POOL_MAX_SIZE connections per process, or
+# with DATABASE_POOL off, persistent connections kept for CONN_MAX_AGE seconds.
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    'default': parse_database_url(
+        os.getenv('DATABASE_URL', 'sqlite:///db.sqlite3'),
+        BASE_DIR,
+        busy_timeout=float(os.getenv('SQLITE_BUSY_TIMEOUT', '20')),
+        mmap_size=int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+        pool=os.getenv('DATABASE_POOL', 'True').lower() == 'true',
+        pool_min_size=int(os.getenv('DATABASE_POOL_MIN_SIZE', '2')),
+        pool_max_size=int(os.getenv('DATABASE_POOL_MAX_SIZE', '10')),
+        pool_timeout=float(os.getenv('DATABASE_POOL_TIMEOUT', '10')),
+        conn_max_age=int(os.getenv('CONN_MAX_AGE', '60')),
+    )
 }
 
 # Password validation
@@ -121,6 +138,59 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Request profiling (banking_project/middleware.py): a PROFILING_SAMPLE_RATE
+# fraction of requests gets its SQL counted and timed, reported in a JSON
+# line on the banking_project.profiling logger. PROFILING_SERVER_TIMING also
+# sends the figures to the client in a Server-Timing header; it is off by
+# default because the header reveals query counts to anyone. Requests over PROFILING_QUERY_BUDGET queries, or repeating one
+# query shape PROFILING_SIMILAR_THRESHOLD times, are logged as warnings.
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False').lower() == 'true'
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '1.0'))
+PROFILING_QUERY_BUDGET = int(os.getenv('PROFILING_QUERY_BUDGET', '50'))
+PROFILING_SIMILAR_THRESHOLD = int(os.getenv('PROFILING_SIMILAR_THRESHOLD', '5'))
+PROFILING_SERVER_TIMING = os.getenv('PROFILING_SERVER_TIMING', 'False').lower() == 'true'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'banking_project.profiling': {
+            'handlers': ['console'],
+            'level': os.getenv('PROFILING_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+# Cache shared by sessions, dashboard summaries and other per-request
+# lookups. Set CACHE_URL (e.g. redis://localhost:6379/0) to share one Redis
+# between processes; without it each process caches in local memory.
+CACHE_URL = os.getenv('CACHE_URL', '')
+CACHES = {
+    'default': cache_config(
+        CACHE_URL,
+        timeout=int(os.getenv('CACHE_TIMEOUT', '300')),
+        max_entries=int(os.getenv('CACHE_MAX_ENTRIES', '10000')),
+    )
+}
+
+# Where sessions live: 'cached_db' reads them from the cache and only falls
+# back to the database on a miss; 'signed_cookies' keeps them in the cookie
+# itself; 'db' reads the session table on every request. cached_db needs a
+# shared cache, since a local-memory copy would outlive a logout made in
+# another worker, so without CACHE_URL the default is 'db'. signed_cookies
+# is opt-in only: a logout, password change or session flush can't revoke a
+# cookie that has already been issued.
+SESSION_ENGINES = {
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+    'db': 'django.contrib.sessions.backends.db',
+}
+SESSION_ENGINE = SESSION_ENGINES[os.getenv('SESSION_STORAGE', 'cached_db' if CACHE_URL else 'db')]
+
 SESSION_COOKIE_SECURE = False  # True in production with HTTPS
 SESSION_COOKIE_HTTPONLY = True
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
@@ -158,3 +228,70 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Seconds a user's cached dashboard summary lives before it is rebuilt.
+# Balance-changing views invalidate it immediately on commit.
+PORTFOLIO_SUMMARY_CACHE_TIMEOUT = int(os.getenv('PORTFOLIO_SUMMARY_CACHE_TIMEOUT', '300'))
+
+# Threads (and so database connections) per process that async views use to
+# run independent reads at once (banking/concurrency.py). Keep it within
+# DATABASE_POOL_MAX_SIZE when pooling.
+GATHER_QUERIES_THREADS = int(os.getenv('GATHER_QUERIES_THREADS', '8'))
+
+# Largest payments file accepted by the batch transfer page
+BATCH_TRANSFER_MAX_ROWS = int(os.getenv('BATCH_TRANSFER_MAX_ROWS', '10000'))
+
+# Most points a dashboard chart series is downsampled to
+CHART_POINT_BUDGET = int(os.getenv('CHART_POINT_BUDGET', '120'))
+
+# Ledger postings between automatic balance checkpoints for an account.
+# Run `manage.py create_balance_checkpoints` periodically to also checkpoint
+# quieter accounts.
+LEDGER_CHECKPOINT_INTERVAL = int(os.getenv('LEDGER_CHECKPOINT_INTERVAL', '100'))
+
+# Account numbers each process reserves from AccountNumberSequence at a time
+ACCOUNT_NUMBER_BLOCK_SIZE = int(os.getenv('ACCOUNT_NUMBER_BLOCK_SIZE', '100'))
+
+# Batches of pending crypto orders the admin pages settle in one request;
+# anything beyond that is left to `manage.py settle_crypto_orders`.
+CRYPTO_SETTLE_REQUEST_BATCHES = int(os.getenv('CRYPTO_SETTLE_REQUEST_BATCHES', '10'))
+
+# Crypto prices: views read an in-process snapshot reloaded at most every
+# CRYPTO_PRICE_CACHE_TTL seconds. Prices are moved by `manage.py
+# run_price_ticker`, or by a thread inside each web process when
+# CRYPTO_PRICE_TICKER_THREAD is on. However many tickers run, a lease row
+# (crypto.TickerLease) lets only one of them refresh at a time.
+CRYPTO_PRICE_CACHE_TTL = float(os.getenv('CRYPTO_PRICE_CACHE_TTL', '5'))
+CRYPTO_PRICE_TICKER_THREAD = os.getenv('CRYPTO_PRICE_TICKER_THREAD', 'False').lower() == 'true'
+CRYPTO_PRICE_TICKER_INTERVAL = float(os.getenv('CRYPTO_PRICE_TICKER_INTERVAL', '10'))
+
+# Where the ticker gets prices: 'simulated' moves them 1% per refresh, 'http'
+# quotes every symbol in one request to CRYPTO_PRICE_PROVIDER_URL (try
+# `manage.py run_mock_exchange`). Quotes are reused for FRESH seconds and,
+# while being re-fetched or while the upstream is failing, for STALE more.
+# After FAILURE_THRESHOLD consecutive failures the upstream is left alone
+# for RESET seconds.
+CRYPTO_PRICE_PROVIDER = os.getenv('CRYPTO_PRICE_PROVIDER', 'simulated')
+CRYPTO_PRICE_PROVIDER_URL = os.getenv('CRYPTO_PRICE_PROVIDER_URL', 'http://127.0.0.1:8001')
+CRYPTO_PRICE_PROVIDER_CONNECT_TIMEOUT = float(os.getenv('CRYPTO_PRICE_PROVIDER_CONNECT_TIMEOUT', '1'))
+CRYPTO_PRICE_PROVIDER_READ_TIMEOUT = float(os.getenv('CRYPTO_PRICE_PROVIDER_READ_TIMEOUT', '2'))
+CRYPTO_PRICE_PROVIDER_FRESH_SECONDS = float(os.getenv('CRYPTO_PRICE_PROVIDER_FRESH_SECONDS', '1'))
+CRYPTO_PRICE_PROVIDER_STALE_SECONDS = float(os.getenv('CRYPTO_PRICE_PROVIDER_STALE_SECONDS', '30'))
+CRYPTO_PRICE_PROVIDER_FAILURE_THRESHOLD = int(os.getenv('CRYPTO_PRICE_PROVIDER_FAILURE_THRESHOLD', '5'))
+CRYPTO_PRICE_PROVIDER_RESET_SECONDS = float(os.getenv('CRYPTO_PRICE_PROVIDER_RESET_SECONDS', '30'))
+
+# Price history: raw ticks are rolled into candles each ticker run. 1-minute
+# and 1-hour candles are kept for this many days; daily candles forever.
+CRYPTO_CANDLE_RETENTION_DAYS = {
+    '1m': int(os.getenv('CRYPTO_1M_CANDLE_RETENTION_DAYS', '7')),
+    '1h': int(os.getenv('CRYPTO_1H_CANDLE_RETENTION_DAYS', '365')),
+}
+# Most candles a price history request returns
+CRYPTO_HISTORY_MAX_POINTS = int(os.getenv('CRYPTO_HISTORY_MAX_POINTS', '500'))
+
+# Live prices (crypto/prices/stream/) are pushed as Server-Sent Events when
+# served through ASGI (banking_project.asgi); each process checks the price
+# cache every CRYPTO_STREAM_INTERVAL seconds and idle streams get a comment
+# every CRYPTO_STREAM_HEARTBEAT seconds. Under WSGI clients poll instead.
+CRYPTO_STREAM_INTERVAL = float(os.getenv('CRYPTO_STREAM_INTERVAL', '1'))
+CRYPTO_STREAM_HEARTBEAT = float(os.getenv('CRYPTO_STREAM_HEARTBEAT', '15'))
@@ -25,6 +25,7 @@ from django.conf.urls.static import static
 
 from accounts import views as account_views
 from banking import views as banking_views
+from crypto import streaming as crypto_streaming
 from crypto import views as crypto_views
 
 urlpatterns = [
@@ -41,7 +42,10 @@ urlpatterns = [
     path('deposit/<int:account_id>/', banking_views.deposit_view, name='deposit'),
     path('withdraw/<int:account_id>/', banking_views.withdraw_view, name='withdraw'),
     path('transfer/<int:account_id>/', banking_views.transfer_view, name='transfer'),
+    path('transfer/batch/', banking_views.batch_transfer_view, name='batch_transfer'),
     path('transactions/', banking_views.transaction_history_view, name='transaction_history'),
+    path('transactions/export/', banking_views.export_transactions_view, name='export_transactions'),
+    path('ops/cache/', banking_views.cache_metrics_view, name='cache_metrics'),
     
     # Crypto URLs
     path('crypto/', crypto_views.crypto_home_view, name='crypto_home'),
@@ -54,6 +58,8 @@ urlpatterns = [
     path('crypto/transfer-to-bank/', crypto_views.transfer_from_crypto_view, name='transfer_from_crypto'),
     path('crypto/buy/', crypto_views.buy_crypto_view, name='buy_crypto'),
     path('crypto/sell/', crypto_views.sell_crypto_view, name='sell_crypto'),
+    path('crypto/history/<str:symbol>/', crypto_views.price_history_view, name='crypto_price_history'),
+    path('crypto/prices/stream/', crypto_streaming.price_stream_view, name='crypto_price_stream'),
     path('crypto/admin/', crypto_views.admin_approve_transactions, name='admin_approve'),
 ]
 
@@ -1,7 +1,8 @@
 # crypto/admin.py
 from django.contrib import admin
 
-from .models import Cryptocurrency, CryptoAccount, CryptoTransaction
+from .models import Cryptocurrency, CryptoAccount, CryptoHolding, CryptoLot, CryptoTransaction
+from .settlement import settle_from_request
 
 class CryptocurrencyAdmin(admin.ModelAdmin):
     list_display = ('name', 'symbol', 'current_price', 'last_updated')
@@ -9,14 +10,41 @@ class CryptocurrencyAdmin(admin.ModelAdmin):
     readonly_fields = ('last_updated',)
 
 class CryptoAccountAdmin(admin.ModelAdmin):
-    list_display = ('account_number', 'user', 'balance')
+    list_display = ('account_number', 'user', 'balance', 'reserved_balance')
     search_fields = ('account_number', 'user__username')
+    list_select_related = ('user',)
 
 class CryptoTransactionAdmin(admin.ModelAdmin):
     list_display = ('user', 'crypto', 'transaction_type', 'amount', 'status', 'timestamp')
     search_fields = ('user__username', 'crypto__symbol')
     list_filter = ('transaction_type', 'status', 'timestamp')
+    list_select_related = ('user', 'crypto')
+    actions = ['approve_orders', 'reject_orders']
+
+    def settle(self, request, queryset, action):
+        for level, text in settle_from_request(action, queryset):
+            self.message_user(request, text, level)
+
+    @admin.action(description='Approve selected pending transactions')
+    def approve_orders(self, request, queryset):
+        self.settle(request, queryset, 'approve')
+
+    @admin.action(description='Reject selected pending transactions')
+    def reject_orders(self, request, queryset):
+        self.settle(request, queryset, 'reject')
+
+class CryptoLotInline(admin.TabularInline):
+    model = CryptoLot
+    extra = 0
+    readonly_fields = ('order', 'acquired_at', 'price', 'quantity', 'remaining_quantity', 'remaining_cost')
+
+class CryptoHoldingAdmin(admin.ModelAdmin):
+    list_display = ('user', 'crypto', 'quantity', 'reserved_quantity', 'cost_basis', 'realized_pnl', 'updated_at')
+    search_fields = ('user__username', 'crypto__symbol')
+    list_select_related = ('user', 'crypto')
+    inlines = [CryptoLotInline]
 
 admin.site.register(Cryptocurrency, CryptocurrencyAdmin)
 admin.site.register(CryptoAccount, CryptoAccountAdmin)
-admin.site.register(CryptoTransaction, CryptoTransactionAdmin)
\ No newline at end of file
+admin.site.register(CryptoTransaction, CryptoTransactionAdmin)
+admin.site.register(CryptoHolding, CryptoHoldingAdmin)
\ No newline at end of file
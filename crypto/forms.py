@@ -32,4 +32,24 @@ class BuySellCryptoForm(forms.ModelForm):
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields['crypto'].queryset = Cryptocurrency.objects.all()
\ No newline at end of file
+        self.fields['crypto'].queryset = Cryptocurrency.objects.all()
+
+class PendingOrderFilterForm(forms.Form):
+    symbol = forms.ModelChoiceField(
+        queryset=Cryptocurrency.objects.all(), to_field_name='symbol', required=False, empty_label='Any crypto'
+    )
+    transaction_type = forms.ChoiceField(
+        choices=(('', 'Any type'),) + CryptoTransaction.TRANSACTION_TYPES,
+        required=False,
+        label="Type"
+    )
+    username = forms.CharField(max_length=150, required=False, label="User")
+    min_age = forms.IntegerField(required=False, min_value=0, label="Older than (minutes)")
+    min_total = forms.DecimalField(required=False, min_value=0, decimal_places=2)
+    max_total = forms.DecimalField(required=False, min_value=0, decimal_places=2)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for name, field in self.fields.items():
+            css = 'form-select' if name in ('symbol', 'transaction_type') else 'form-control'
+            field.widget.attrs['class'] = f'{css} {css}-sm'
@@ -0,0 +1,139 @@
+# crypto/history.py
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from banking.balances import floor_time
+from .models import PriceCandle, PriceTick
+
+RESOLUTIONS = {
+    '1m': timedelta(minutes=1),
+    '1h': timedelta(hours=1),
+    '1d': timedelta(days=1),
+}
+# Each resolution is built from the one before it
+ROLLUPS = (('1m', '1h'), ('1h', '1d'))
+
+
+def record_ticks(cryptos, timestamp=None):
+    """Store one tick per cryptocurrency at its current price"""
+    timestamp = timestamp or timezone.now()
+    PriceTick.objects.bulk_create([
+        PriceTick(crypto_id=crypto.pk, timestamp=timestamp, price=crypto.current_price)
+        for crypto in cryptos
+    ])
+
+
+def _merge(candles, crypto_id, bucket, open_, high, low, close, first_at=None, last_at=None):
+    key = (crypto_id, bucket)
+    candle = candles.get(key)
+    if candle is None:
+        candles[key] = [open_, high, low, close, first_at, last_at]
+        return
+    candle[1] = max(candle[1], high)
+    candle[2] = min(candle[2], low)
+    # Out-of-order data only moves open and close if it is earlier / later
+    # than what the candle has; without times, the later merge is the later data
+    if first_at is not None and candle[4] is not None and first_at < candle[4]:
+        candle[0], candle[4] = open_, first_at
+    if last_at is None or candle[5] is None or last_at >= candle[5]:
+        candle[3], candle[5] = close, last_at or candle[5]
+
+
+def _upsert(resolution, candles):
+    PriceCandle.objects.bulk_create([
+        PriceCandle(
+            crypto_id=crypto_id, resolution=resolution, bucket=bucket,
+            open=open_, high=high, low=low, close=close, first_tick_at=first_at, last_tick_at=last_at
+        )
+        for (crypto_id, bucket), (open_, high, low, close, first_at, last_at) in candles.items()
+    ], batch_size=1000, update_conflicts=True,
+        unique_fields=['crypto', 'resolution', 'bucket'],
+        update_fields=['open', 'high', 'low', 'close', 'first_tick_at', 'last_tick_at'])
+
+
+def _rebuild(source, target, buckets):
+    """Recompute ``target`` candles for the given (crypto, bucket) keys from ``source`` candles"""
+    width = RESOLUTIONS[target]
+    candles = {}
+    for crypto_id, bucket in sorted(buckets):
+        rows = PriceCandle.objects.filter(
+            crypto_id=crypto_id, resolution=source,
+            bucket__gte=bucket, bucket__lt=bucket + width
+        ).order_by('bucket').values_list('open', 'high', 'low', 'close', 'first_tick_at', 'last_tick_at')
+        for row in rows:
+            _merge(candles, crypto_id, bucket, *row)
+    _upsert(target, candles)
+    return candles
+
+
+def rollup_prices(now=None):
+    """
+    Fold closed minutes of raw ticks into 1m candles, then refresh the 1h and
+    1d candles they fall in, and prune ticks and old fine-grained candles.
+
+    Only buckets that received new data are recomputed, so each run costs
+    time proportional to the ticks since the previous run.
+    """
+    now = now or timezone.now()
+    cutoff = floor_time(now, RESOLUTIONS['1m'])
+
+    with transaction.atomic():
+        ticks = PriceTick.objects.filter(timestamp__lt=cutoff)
+        minute_candles = {}
+        for crypto_id, timestamp, price in ticks.order_by('crypto_id', 'timestamp', 'id').values_list(
+            'crypto_id', 'timestamp', 'price'
+        ).iterator(chunk_size=5000):
+            _merge(minute_candles, crypto_id, floor_time(timestamp, RESOLUTIONS['1m']),
+                   price, price, price, price, timestamp, timestamp)
+        if not minute_candles:
+            return 0
+
+        # A late tick may land in a minute that was already rolled up
+        for candle in PriceCandle.objects.filter(
+            resolution='1m',
+            crypto_id__in={crypto_id for crypto_id, _ in minute_candles},
+            bucket__in={bucket for _, bucket in minute_candles}
+        ):
+            key = (candle.crypto_id, candle.bucket)
+            if key in minute_candles:
+                existing = {key: [
+                    candle.open, candle.high, candle.low, candle.close, candle.first_tick_at, candle.last_tick_at
+                ]}
+                _merge(existing, *key, *minute_candles[key])
+                minute_candles[key] = existing[key]
+        _upsert('1m', minute_candles)
+        ticks.delete()
+
+        touched = minute_candles
+        for source, target in ROLLUPS:
+            width = RESOLUTIONS[target]
+            touched = _rebuild(source, target, {
+                (crypto_id, floor_time(bucket, width)) for crypto_id, bucket in touched
+            })
+
+        retention = getattr(settings, 'CRYPTO_CANDLE_RETENTION_DAYS', {'1m': 7, '1h': 365})
+        for resolution, days in retention.items():
+            PriceCandle.objects.filter(
+                resolution=resolution, bucket__lt=now - timedelta(days=days)
+            ).delete()
+    return len(minute_candles)
+
+
+def pick_resolution(start, end, max_points):
+    """The finest resolution that covers [start, end] in at most ``max_points`` candles"""
+    for resolution, width in RESOLUTIONS.items():
+        if (end - start) / width <= max_points:
+            return resolution
+    return '1d'
+
+
+def price_history(crypto, start, end, max_points=500):
+    """Return ``(resolution, candles)`` for ``crypto`` between ``start`` and ``end``"""
+    resolution = pick_resolution(start, end, max_points)
+    candles = PriceCandle.objects.filter(
+        crypto=crypto, resolution=resolution, bucket__gte=start, bucket__lte=end
+    ).order_by('bucket')
+    return resolution, list(candles)
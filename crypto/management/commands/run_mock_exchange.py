@@ -0,0 +1,66 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from crypto.mock_exchange import MockExchange, start_mock_exchange
+from crypto.models import Cryptocurrency
+from crypto.providers import CircuitBreaker, HTTPProvider
+
+
+class Command(BaseCommand):
+    help = 'Serves simulated market data for CRYPTO_PRICE_PROVIDER=http, or benchmarks the provider against it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8001)
+        parser.add_argument('--latency', type=float, default=0, help='Seconds added to every response')
+        parser.add_argument('--failure-rate', type=float, default=0, help='Fraction of requests answered with 503')
+        parser.add_argument(
+            '--benchmark', type=int, metavar='REFRESHES',
+            help='Time this many batched quote requests against a private server, then exit'
+        )
+
+    def handle(self, *args, **options):
+        cryptos = list(Cryptocurrency.objects.order_by('pk'))
+        exchange = MockExchange(
+            {crypto.symbol: crypto.current_price for crypto in cryptos},
+            latency=options['latency'], failure_rate=options['failure_rate']
+        )
+        if options['benchmark']:
+            return self.benchmark(exchange, cryptos, options['benchmark'])
+
+        server = start_mock_exchange(exchange, options['host'], options['port'])
+        host, port = server.server_address
+        self.stdout.write(f'Mock exchange quoting {len(cryptos)} symbols at http://{host}:{port}/quotes')
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
+
+    def benchmark(self, exchange, cryptos, refreshes):
+        server = start_mock_exchange(exchange)
+        host, port = server.server_address
+        # Fresh window of zero: every call goes to the server
+        provider = HTTPProvider(
+            f'http://{host}:{port}', fresh_for=0, stale_for=0,
+            breaker=CircuitBreaker(threshold=refreshes + 1)
+        )
+        timings = []
+        failures = 0
+        for _ in range(refreshes):
+            started = time.perf_counter()
+            try:
+                provider.quotes(cryptos)
+            except Exception:
+                failures += 1
+            timings.append(time.perf_counter() - started)
+        server.shutdown()
+
+        timings.sort()
+        self.stdout.write(
+            f'{refreshes} refreshes of {len(cryptos)} symbols in {exchange.requests} requests: '
+            f'median {statistics.median(timings) * 1000:.2f}ms, '
+            f'p95 {timings[int(len(timings) * 0.95) - 1] * 1000:.2f}ms, {failures} failed'
+        )
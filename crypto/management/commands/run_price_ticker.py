@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from crypto.prices import run_ticker
+
+
+class Command(BaseCommand):
+    help = 'Refreshes cryptocurrency prices on a fixed cadence'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=None,
+            help='Seconds between price refreshes (default: CRYPTO_PRICE_TICKER_INTERVAL)'
+        )
+        parser.add_argument('--iterations', type=int, default=None, help='Stop after this many refreshes')
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        if interval is None:
+            interval = getattr(settings, 'CRYPTO_PRICE_TICKER_INTERVAL', 10)
+        count = run_ticker(interval, options['iterations'])
+        self.stdout.write(f'Refreshed prices {count} times')
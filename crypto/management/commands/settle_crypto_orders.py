@@ -0,0 +1,73 @@
+import logging
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connection
+
+from crypto.settlement import ACTIONS, SettlementError, settle_batch
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Settles pending crypto orders in batches, optionally with parallel workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--action', choices=sorted(ACTIONS), default='approve')
+        parser.add_argument('--batch-size', type=int, default=500, help='Orders claimed per transaction')
+        parser.add_argument('--workers', type=int, default=1, help='Workers draining the queue in parallel')
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new orders instead of exiting')
+        parser.add_argument('--interval', type=float, default=1, help='Seconds to wait when the queue is empty')
+
+    def handle(self, *args, **options):
+        counts = {'settled': 0, 'retried': 0}
+        counts_lock = threading.Lock()
+        stop = threading.Event()
+
+        def worker():
+            try:
+                while not stop.is_set():
+                    close_old_connections()
+                    try:
+                        settled = settle_batch(options['action'], options['batch_size'])
+                    except OperationalError:
+                        # Lock wait timed out; the batch rolled back, so claim again
+                        with counts_lock:
+                            counts['retried'] += 1
+                        continue
+                    except SettlementError as e:
+                        # Another settler changed some of the claimed orders; the
+                        # batch rolled back, and the next claim skips those orders
+                        logger.warning('Settlement batch rolled back: %s', e)
+                        with counts_lock:
+                            counts['retried'] += 1
+                        continue
+                    with counts_lock:
+                        counts['settled'] += settled
+                    if not settled:
+                        if not options['loop']:
+                            break
+                        stop.wait(options['interval'])
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['workers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            stop.set()
+            for thread in threads:
+                thread.join()
+        elapsed = time.perf_counter() - started
+
+        rate = counts['settled'] / elapsed if elapsed else 0
+        self.stdout.write(
+            f"Settled {counts['settled']} orders ({options['action']}) in {elapsed:.2f}s "
+            f"({rate:.1f} orders/s, {options['workers']} workers, {counts['retried']} retries)"
+        )
@@ -0,0 +1,127 @@
+import time
+import uuid
+from decimal import Decimal
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from banking.snapshots import iter_user_id_chunks, snapshot_users
+from crypto.models import CryptoHolding, Cryptocurrency
+from crypto.valuation import exposure_by_crypto, position_matrix, price_vector
+
+
+class Command(BaseCommand):
+    help = 'Marks every crypto holding to market and reports exposure per cryptocurrency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=50000, help='Users valued per pass')
+        parser.add_argument(
+            '--benchmark', type=int, action='append', metavar='USERS',
+            help=(
+                'Compute-only: value this many synthetic users held in memory (repeatable). '
+                'Excludes the database reads and the snapshot write-back'
+            )
+        )
+        parser.add_argument(
+            '--benchmark-database', type=int, action='append', metavar='USERS',
+            help=(
+                'Seed this many users and their holdings, then time the real job: the exposure pass '
+                'and the snapshot write-back. The seeded rows are rolled back afterwards (repeatable)'
+            )
+        )
+        parser.add_argument('--cryptos', type=int, default=20, help='Cryptocurrencies in the synthetic benchmark')
+        parser.add_argument('--holdings', type=int, default=3, help='Holdings per synthetic user')
+
+    def handle(self, *args, **options):
+        if options['benchmark'] or options['benchmark_database']:
+            for users in options['benchmark'] or []:
+                self.benchmark(users, options['cryptos'], options['holdings'], options['chunk_size'])
+            for users in options['benchmark_database'] or []:
+                self.benchmark_database(users, options['cryptos'], options['holdings'], options['chunk_size'])
+            return
+
+        started = time.perf_counter()
+        prices = price_vector()
+        exposure, total = exposure_by_crypto(iter_user_id_chunks(options['chunk_size']), prices)
+        elapsed = time.perf_counter() - started
+
+        symbols = dict(Cryptocurrency.objects.values_list('pk', 'symbol'))
+        for crypto_id, (quantity, value) in sorted(exposure.items(), key=lambda item: -item[1][1]):
+            self.stdout.write(f"{symbols[crypto_id]:<10} {quantity:>24f} ${value:,.2f}")
+        self.stdout.write(f"Total crypto exposure ${total:,.2f} valued in {elapsed:.2f}s")
+
+    def benchmark(self, users, cryptos, holdings, chunk_size):
+        rng = np.random.default_rng(0)
+        user_ids = np.arange(1, users + 1, dtype=np.int64)
+        crypto_ids = np.arange(1, cryptos + 1, dtype=np.int64)
+        prices = rng.uniform(1, 50000, cryptos)
+        # Rows shaped like the (user_id, crypto_id, quantity) the database returns
+        row_users = np.repeat(user_ids, holdings)
+        row_cryptos = rng.integers(1, cryptos + 1, len(row_users))
+        row_quantities = [Decimal(f"{q:.8f}") for q in rng.uniform(0, 10, len(row_users))]
+        rows = list(zip(row_users.tolist(), row_cryptos.tolist(), row_quantities))
+
+        started = time.perf_counter()
+        values = np.empty(users)
+        for start in range(0, users, chunk_size):
+            chunk = user_ids[start:start + chunk_size]
+            chunk_rows = rows[start * holdings:(start + len(chunk)) * holdings]
+            values[start:start + len(chunk)] = position_matrix(chunk, crypto_ids, chunk_rows) @ prices
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(
+            f"{users} users x {holdings} holdings over {cryptos} cryptocurrencies valued in {elapsed:.2f}s "
+            f"({users / elapsed:,.0f} users/s, total ${values.sum():,.2f}; compute only, no database)"
+        )
+
+    def benchmark_database(self, users, cryptos, holdings, chunk_size):
+        with transaction.atomic():
+            user_ids = self.seed(users, cryptos, holdings)
+            chunks = [user_ids[start:start + chunk_size] for start in range(0, users, chunk_size)]
+
+            started = time.perf_counter()
+            prices = price_vector()
+            _, total = exposure_by_crypto(chunks, prices)
+            valued = time.perf_counter() - started
+
+            started = time.perf_counter()
+            for chunk in chunks:
+                snapshot_users(chunk, prices)
+            snapshotted = time.perf_counter() - started
+
+            transaction.set_rollback(True)
+
+        self.stdout.write(
+            f"{users} users x {holdings} holdings over {cryptos} cryptocurrencies from the database: "
+            f"exposure in {valued:.2f}s ({users / valued:,.0f} users/s, total ${total:,.2f}), "
+            f"snapshots written in {snapshotted:.2f}s ({users / snapshotted:,.0f} users/s)"
+        )
+
+    def seed(self, users, cryptos, holdings):
+        """Create the benchmark users, cryptocurrencies and holdings; return the user ids in order"""
+        User = get_user_model()
+        suffix = uuid.uuid4().hex[:8]
+        rng = np.random.default_rng(0)
+
+        people = []
+        for i in range(users):
+            user = User(username=f'value-{suffix}-{i}', email=f'value-{suffix}-{i}@example.com')
+            user.set_unusable_password()
+            people.append(user)
+        User.objects.bulk_create(people, batch_size=5000)
+        user_ids = list(
+            User.objects.filter(username__startswith=f'value-{suffix}-').order_by('pk').values_list('pk', flat=True)
+        )
+
+        coins = Cryptocurrency.objects.bulk_create([
+            Cryptocurrency(name=f'Valuation coin {i}', symbol=f'V{suffix[:6]}{i}', current_price=Decimal(f'{price:.2f}'))
+            for i, price in enumerate(rng.uniform(1, 50000, cryptos))
+        ])
+        CryptoHolding.objects.bulk_create((
+            CryptoHolding(user_id=user_id, crypto=coin, quantity=Decimal(f'{rng.uniform(0, 10):.8f}'))
+            for user_id in user_ids
+            for coin in rng.choice(coins, min(holdings, cryptos), replace=False)
+        ), batch_size=5000)
+        return user_ids
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from crypto.reservations import verify_reservations
+
+
+class Command(BaseCommand):
+    help = 'Checks every crypto account reservation against its pending buy orders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Accounts checked per transaction')
+        parser.add_argument('--fix', action='store_true', help='Reset drifted reservations to the pending total')
+
+    def handle(self, *args, **options):
+        drift = verify_reservations(options['chunk_size'], options['fix'])
+        for account, expected in drift:
+            self.stdout.write(
+                f"{account.account_number}: reserved {account.reserved_balance}, pending buys {expected}"
+            )
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('All reservations match pending buy orders'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f"Fixed {len(drift)} accounts"))
+        else:
+            self.stdout.write(self.style.WARNING(f"{len(drift)} accounts have drifted; rerun with --fix to repair"))
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crypto', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceCandle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('1m', '1 minute'), ('1h', '1 hour'), ('1d', '1 day')], max_length=2)),
+                ('bucket', models.DateTimeField()),
+                ('open', models.BigIntegerField()),
+                ('high', models.BigIntegerField()),
+                ('low', models.BigIntegerField()),
+                ('close', models.BigIntegerField()),
+                ('crypto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='candles', to='crypto.cryptocurrency')),
+            ],
+            options={
+                'unique_together': {('crypto', 'resolution', 'bucket')},
+            },
+        ),
+        migrations.CreateModel(
+            name='PriceTick',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('price', models.BigIntegerField()),
+                ('crypto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ticks', to='crypto.cryptocurrency')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['timestamp'], name='price_tick_timestamp_idx')],
+            },
+        ),
+    ]
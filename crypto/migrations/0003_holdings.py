@@ -0,0 +1,136 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:20
+
+import django.db.models.deletion
+from django.conf import settings
+from decimal import Decimal
+
+from django.db import migrations, models
+
+QUANTITY_QUANTUM = Decimal('0.00000001')
+
+
+def consume_lots(lots, quantity):
+    # crypto.positions.consume_lots as it was when this migration was
+    # written; migrations mustn't follow later changes to app code
+    filled = Decimal('0')
+    cost = Decimal('0')
+    for lot in lots:
+        if filled >= quantity:
+            break
+        if lot.remaining_quantity <= 0:
+            continue
+        take = min(lot.remaining_quantity, quantity - filled)
+        if take == lot.remaining_quantity:
+            taken_cost = lot.remaining_cost
+        else:
+            taken_cost = (lot.remaining_cost * take / lot.remaining_quantity).quantize(QUANTITY_QUANTUM)
+        lot.remaining_quantity -= take
+        lot.remaining_cost -= taken_cost
+        filled += take
+        cost += taken_cost
+    return filled, cost
+
+
+def backfill_holdings(apps, schema_editor):
+    # Replay settled orders once to open the positions and lots that
+    # settlement maintains from now on. Pending sells reserve their coins.
+    CryptoTransaction = apps.get_model('crypto', 'CryptoTransaction')
+    CryptoHolding = apps.get_model('crypto', 'CryptoHolding')
+    CryptoLot = apps.get_model('crypto', 'CryptoLot')
+
+    holdings = {}
+    lots = {}
+    orders = CryptoTransaction.objects.filter(
+        transaction_type__in=['buy', 'sell'],
+        status__in=['completed', 'pending']
+    ).order_by('timestamp', 'id')
+    for order in orders.iterator(chunk_size=2000):
+        key = (order.user_id, order.crypto_id)
+        holding = holdings.get(key)
+        if holding is None:
+            holding = holdings[key] = CryptoHolding(
+                user_id=order.user_id, crypto_id=order.crypto_id, quantity=Decimal('0'),
+                reserved_quantity=Decimal('0'), cost_basis=Decimal('0'), realized_pnl=Decimal('0')
+            )
+            lots[key] = []
+        if order.status == 'pending':
+            if order.transaction_type == 'sell':
+                holding.reserved_quantity += order.amount
+            continue
+        if order.transaction_type == 'buy':
+            lots[key].append(CryptoLot(
+                order_id=order.pk,
+                acquired_at=order.timestamp,
+                price=order.price_at_transaction,
+                quantity=order.amount,
+                remaining_quantity=order.amount,
+                remaining_cost=order.total_value
+            ))
+            holding.quantity += order.amount
+            holding.cost_basis += order.total_value
+        else:
+            # Sells were never checked against holdings before, so only the
+            # part covered by earlier buys is closed
+            filled, cost = consume_lots(lots[key], order.amount)
+            holding.quantity -= filled
+            holding.cost_basis -= cost
+            holding.realized_pnl += order.total_value * (filled / order.amount) - cost
+
+    for key, holding in holdings.items():
+        holding.reserved_quantity = min(holding.reserved_quantity, holding.quantity)
+        holding.realized_pnl = holding.realized_pnl.quantize(QUANTITY_QUANTUM)
+    CryptoHolding.objects.bulk_create(holdings.values(), batch_size=1000)
+    saved = {
+        (holding.user_id, holding.crypto_id): holding
+        for holding in CryptoHolding.objects.all()
+    }
+    new_lots = []
+    for key, holding_lots in lots.items():
+        for lot in holding_lots:
+            lot.holding = saved[key]
+            new_lots.append(lot)
+    CryptoLot.objects.bulk_create(new_lots, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crypto', '0002_price_history'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CryptoHolding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.DecimalField(decimal_places=8, default=0, max_digits=28)),
+                ('reserved_quantity', models.DecimalField(decimal_places=8, default=0, max_digits=28)),
+                ('cost_basis', models.DecimalField(decimal_places=8, default=0, max_digits=20)),
+                ('realized_pnl', models.DecimalField(decimal_places=8, default=0, max_digits=20)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('crypto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='holdings', to='crypto.cryptocurrency')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='crypto_holdings', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'crypto')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CryptoLot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('acquired_at', models.DateTimeField()),
+                ('price', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('quantity', models.DecimalField(decimal_places=8, max_digits=28)),
+                ('remaining_quantity', models.DecimalField(decimal_places=8, max_digits=28)),
+                ('remaining_cost', models.DecimalField(decimal_places=8, max_digits=20)),
+                ('holding', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lots', to='crypto.cryptoholding')),
+                ('order', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='crypto.cryptotransaction')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['holding', 'acquired_at', 'id'], name='crypto_lot_fifo_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_holdings, migrations.RunPython.noop),
+    ]
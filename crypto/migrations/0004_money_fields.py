@@ -0,0 +1,82 @@
+# Store money, prices and quantities as scaled integers (see banking.money)
+
+from django.db import migrations
+
+from banking.money import MoneyField
+
+CRYPTO = 8  # banking.money.CRYPTO when this migration was written
+
+# Copied from banking.money as of this migration, so later changes there
+# don't alter it
+def decimal_to_money(app_label, model_name, fields):
+    """
+    Migration operations turning DecimalFields of one model into MoneyFields.
+
+    ``fields`` maps each field name to its final MoneyField. Values are copied
+    into a new integer column with one UPDATE per table, rounded to the new
+    scale, then the new column replaces the old one.
+    """
+    temporary = {name: f'{name}_units' for name in fields}
+
+    def rescale(apps, schema_editor):
+        model = apps.get_model(app_label, model_name)
+        quote = schema_editor.quote_name
+        assignments = ', '.join(
+            f"{quote(temporary[name])} = CAST(ROUND({quote(name)} * {10 ** field.scale}) AS BIGINT)"
+            for name, field in fields.items()
+        )
+        schema_editor.execute(f"UPDATE {quote(model._meta.db_table)} SET {assignments}")
+
+    operations = [
+        migrations.AddField(model_name, temporary[name], MoneyField(scale=field.scale, null=True))
+        for name, field in fields.items()
+    ]
+    # One way only: the old columns can't be re-added to non-empty tables
+    operations.append(migrations.RunPython(rescale))
+    for name, field in fields.items():
+        operations += [
+            migrations.RemoveField(model_name, name),
+            migrations.RenameField(model_name, temporary[name], name),
+            migrations.AlterField(model_name, name, field),
+        ]
+    return operations
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crypto', '0003_holdings'),
+    ]
+
+    operations = [
+        *decimal_to_money('crypto', 'cryptoaccount', {
+            'balance': MoneyField(scale=CRYPTO, default=0),
+        }),
+        *decimal_to_money('crypto', 'cryptocurrency', {
+            'current_price': MoneyField(scale=CRYPTO),
+        }),
+        *decimal_to_money('crypto', 'cryptotransaction', {
+            'amount': MoneyField(scale=CRYPTO),
+            'price_at_transaction': MoneyField(scale=CRYPTO),
+            'total_value': MoneyField(),
+        }),
+        *decimal_to_money('crypto', 'cryptoholding', {
+            'quantity': MoneyField(scale=CRYPTO, default=0),
+            'reserved_quantity': MoneyField(scale=CRYPTO, default=0),
+            'cost_basis': MoneyField(scale=CRYPTO, default=0),
+            'realized_pnl': MoneyField(scale=CRYPTO, default=0),
+        }),
+        *decimal_to_money('crypto', 'cryptolot', {
+            'price': MoneyField(scale=CRYPTO),
+            'quantity': MoneyField(scale=CRYPTO),
+            'remaining_quantity': MoneyField(scale=CRYPTO),
+            'remaining_cost': MoneyField(scale=CRYPTO),
+        }),
+        # Ticks and candles were already integers in 1e-8 units
+        migrations.AlterField('pricetick', 'price', MoneyField(scale=CRYPTO)),
+        migrations.AlterField('pricecandle', 'open', MoneyField(scale=CRYPTO)),
+        migrations.AlterField('pricecandle', 'high', MoneyField(scale=CRYPTO)),
+        migrations.AlterField('pricecandle', 'low', MoneyField(scale=CRYPTO)),
+        migrations.AlterField('pricecandle', 'close', MoneyField(scale=CRYPTO)),
+    ]
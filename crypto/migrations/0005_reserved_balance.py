@@ -0,0 +1,51 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:29
+
+import banking.money
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def reserve_pending_buys(apps, schema_editor):
+    # Pending buys used to take their cost out of the balance when placed.
+    # It is now held in reserved_balance instead, so put it back.
+    CryptoAccount = apps.get_model('crypto', 'CryptoAccount')
+    CryptoTransaction = apps.get_model('crypto', 'CryptoTransaction')
+    pending = CryptoTransaction.objects.filter(
+        transaction_type='buy', status='pending'
+    ).values('user_id').annotate(total=Sum('total_value'))
+    for row in pending.iterator(chunk_size=2000):
+        account = CryptoAccount.objects.filter(user_id=row['user_id']).order_by('pk').first()
+        if account is not None:
+            account.balance += row['total']
+            account.reserved_balance = row['total']
+            account.save(update_fields=['balance', 'reserved_balance'])
+
+
+def release_pending_buys(apps, schema_editor):
+    CryptoAccount = apps.get_model('crypto', 'CryptoAccount')
+    for account in CryptoAccount.objects.exclude(reserved_balance=0).iterator(chunk_size=2000):
+        account.balance -= account.reserved_balance
+        account.save(update_fields=['balance'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking', '0008_money_fields'),
+        ('crypto', '0004_money_fields'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cryptoaccount',
+            name='reserved_balance',
+            field=banking.money.MoneyField(default=0, scale=8),
+        ),
+        migrations.AddIndex(
+            model_name='cryptotransaction',
+            index=models.Index(fields=['user', 'status'], name='crypto_txn_user_status_idx'),
+        ),
+        migrations.RunPython(reserve_pending_buys, release_pending_buys),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.3 on 2026-10-18 11:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('banking', '0008_money_fields'),
+        ('crypto', '0005_reserved_balance'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cryptotransaction',
+            index=models.Index(fields=['status', 'timestamp', 'id'], name='crypto_txn_queue_idx'),
+        ),
+    ]
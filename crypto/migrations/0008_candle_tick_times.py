@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-18 12:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crypto', '0007_ticker_lease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pricecandle',
+            name='first_tick_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='pricecandle',
+            name='last_tick_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# crypto/mock_exchange.py
+# A stand-in market-data server speaking the protocol HTTPProvider expects,
+# so the provider can be developed, tested and benchmarked offline. Prices
+# take a small random walk on every request; latency and failures can be
+# injected to exercise timeouts and the circuit breaker.
+import json
+import random
+import threading
+import time
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class MockExchange:
+    """Holds the simulated market: one price per symbol plus fault injection"""
+
+    def __init__(self, prices=None, latency=0, failure_rate=0, volatility=0.005, seed=None):
+        self.prices = {symbol: Decimal(price) for symbol, price in (prices or {}).items()}
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.volatility = volatility
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def quote(self, symbols):
+        with self.lock:
+            quotes = {}
+            for symbol in symbols:
+                price = self.prices.get(symbol, Decimal('100'))
+                move = Decimal(str(self.random.uniform(-self.volatility, self.volatility)))
+                price = self.prices[symbol] = (price * (1 + move)).quantize(Decimal('0.00000001'))
+                quotes[symbol] = str(price)
+            return quotes
+
+
+class QuoteHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections open so pooled clients can reuse them
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; don't let Nagle hold the body back
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        exchange = self.server.exchange
+        with exchange.lock:
+            exchange.requests += 1
+        url = urlparse(self.path)
+        if url.path != '/quotes':
+            return self.send_json(404, {'error': 'not found'})
+        if exchange.latency:
+            time.sleep(exchange.latency)
+        if exchange.failure_rate and exchange.random.random() < exchange.failure_rate:
+            return self.send_json(503, {'error': 'unavailable'})
+        symbols = [s for s in parse_qs(url.query).get('symbols', [''])[0].split(',') if s]
+        self.send_json(200, {'quotes': exchange.quote(symbols), 'timestamp': time.time()})
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_mock_exchange(exchange, host='127.0.0.1', port=0):
+    """Serve ``exchange`` from a background thread; returns the server (``server.server_address``)"""
+    server = ThreadingHTTPServer((host, port), QuoteHandler)
+    server.daemon_threads = True
+    server.exchange = exchange
+    threading.Thread(target=server.serve_forever, name='mock-exchange', daemon=True).start()
+    return server
@@ -3,20 +3,27 @@ from django.db import models
 
 from accounts.models import CustomUser
 from banking.models import BankAccount
+from banking.money import CRYPTO, MoneyField, multiply
 
 class CryptoAccount(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     account_number = models.CharField(max_length=20, unique=True)
-    balance = models.DecimalField(max_digits=20, decimal_places=8, default=0)
+    balance = MoneyField(scale=CRYPTO, default=0)
+    # Cash held back for pending buy orders; part of balance, but not available
+    reserved_balance = MoneyField(scale=CRYPTO, default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
         return f"{self.user.username}'s Crypto Account"
 
+    @property
+    def available_balance(self):
+        return self.balance - self.reserved_balance
+
 class Cryptocurrency(models.Model):
     name = models.CharField(max_length=50)
     symbol = models.CharField(max_length=10, unique=True)
-    current_price = models.DecimalField(max_digits=20, decimal_places=8)
+    current_price = MoneyField(scale=CRYPTO)
     last_updated = models.DateTimeField(auto_now=True)
     
     def __str__(self):
@@ -37,16 +44,118 @@ class CryptoTransaction(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     crypto = models.ForeignKey(Cryptocurrency, on_delete=models.CASCADE)
     transaction_type = models.CharField(max_length=20, choices=TRANSACTION_TYPES)
-    amount = models.DecimalField(max_digits=20, decimal_places=8)
-    price_at_transaction = models.DecimalField(max_digits=20, decimal_places=8)
-    total_value = models.DecimalField(max_digits=20, decimal_places=2)
+    amount = MoneyField(scale=CRYPTO)
+    price_at_transaction = MoneyField(scale=CRYPTO)
+    total_value = MoneyField()
     timestamp = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     bank_account = models.ForeignKey(BankAccount, on_delete=models.SET_NULL, null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # A user's open orders, and the reservation verifier's grouped sums
+            models.Index(fields=['user', 'status'], name='crypto_txn_user_status_idx'),
+            # The pending queue, oldest first, for settlement and the approval pages
+            models.Index(fields=['status', 'timestamp', 'id'], name='crypto_txn_queue_idx'),
+        ]
     
     def save(self, *args, **kwargs):
-        self.total_value = float(self.amount) * float(self.price_at_transaction)
+        self.total_value = multiply(self.amount, self.price_at_transaction)
         super().save(*args, **kwargs)
     
     def __str__(self):
-        return f"{self.transaction_type} {self.amount} {self.crypto.symbol} by {self.user.username}"
\ No newline at end of file
+        return f"{self.transaction_type} {self.amount} {self.crypto.symbol} by {self.user.username}"
+
+class PriceTick(models.Model):
+    # Raw price observations from the ticker; rolled into PriceCandle rows and
+    # pruned by crypto.history.rollup_prices
+    crypto = models.ForeignKey(Cryptocurrency, on_delete=models.CASCADE, related_name='ticks')
+    timestamp = models.DateTimeField()
+    price = MoneyField(scale=CRYPTO)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['timestamp'], name='price_tick_timestamp_idx'),
+        ]
+
+class TickerLease(models.Model):
+    # Whoever holds the unexpired lease is the one process refreshing prices,
+    # however many web workers run a ticker thread; see crypto.prices
+    name = models.CharField(max_length=50, unique=True)
+    holder = models.CharField(max_length=100)
+    expires_at = models.DateTimeField()
+
+class PriceCandle(models.Model):
+    RESOLUTIONS = (
+        ('1m', '1 minute'),
+        ('1h', '1 hour'),
+        ('1d', '1 day'),
+    )
+
+    crypto = models.ForeignKey(Cryptocurrency, on_delete=models.CASCADE, related_name='candles')
+    resolution = models.CharField(max_length=2, choices=RESOLUTIONS)
+    bucket = models.DateTimeField()
+    open = MoneyField(scale=CRYPTO)
+    high = MoneyField(scale=CRYPTO)
+    low = MoneyField(scale=CRYPTO)
+    close = MoneyField(scale=CRYPTO)
+    # When open and close were observed, so a late tick merged into the
+    # candle only replaces them if it is earlier / later
+    first_tick_at = models.DateTimeField(null=True, blank=True)
+    last_tick_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ['crypto', 'resolution', 'bucket']
+
+    def __str__(self):
+        return f"{self.crypto.symbol} {self.resolution} candle at {self.bucket}"
+
+class CryptoHolding(models.Model):
+    # A user's position in one cryptocurrency, kept up to date by
+    # crypto.positions as orders settle. cost_basis is what the remaining
+    # quantity cost, i.e. the sum of its open lots.
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='crypto_holdings')
+    crypto = models.ForeignKey(Cryptocurrency, on_delete=models.CASCADE, related_name='holdings')
+    quantity = MoneyField(scale=CRYPTO, default=0)
+    reserved_quantity = MoneyField(scale=CRYPTO, default=0)
+    cost_basis = MoneyField(scale=CRYPTO, default=0)
+    realized_pnl = MoneyField(scale=CRYPTO, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['user', 'crypto']
+
+    def __str__(self):
+        return f"{self.user.username}'s {self.crypto.symbol} holding"
+
+    @property
+    def available_quantity(self):
+        return self.quantity - self.reserved_quantity
+
+    @property
+    def average_cost(self):
+        return self.cost_basis / self.quantity if self.quantity else 0
+
+    def market_value(self, price):
+        return self.quantity * price
+
+    def unrealized_pnl(self, price):
+        return self.market_value(price) - self.cost_basis
+
+class CryptoLot(models.Model):
+    # One settled buy. Sells consume the oldest open lots first (FIFO).
+    holding = models.ForeignKey(CryptoHolding, on_delete=models.CASCADE, related_name='lots')
+    order = models.OneToOneField(CryptoTransaction, on_delete=models.SET_NULL, null=True, blank=True)
+    acquired_at = models.DateTimeField()
+    price = MoneyField(scale=CRYPTO)
+    quantity = MoneyField(scale=CRYPTO)
+    remaining_quantity = MoneyField(scale=CRYPTO)
+    remaining_cost = MoneyField(scale=CRYPTO)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['holding', 'acquired_at', 'id'], name='crypto_lot_fifo_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} {self.holding.crypto.symbol} at {self.price}"
@@ -0,0 +1,153 @@
+# crypto/positions.py
+# Holdings and FIFO lots are maintained incrementally here as orders settle,
+# so a position, its cost basis and its P&L are single-row lookups rather
+# than a replay of the user's order history.
+from decimal import Decimal
+
+from django.db.models import F
+from django.utils import timezone
+
+from banking.ledger import LedgerError
+from banking.money import money_value, prorate
+from .models import CryptoHolding, CryptoLot
+
+class InsufficientHoldings(LedgerError):
+    def __init__(self, message='Insufficient holdings.'):
+        super().__init__(message)
+
+
+def consume_lots(lots, quantity):
+    """
+    Take ``quantity`` from ``lots`` (oldest first) and return ``(filled, cost)``.
+
+    Lots are changed in place; a partly used lot gives up a pro-rata share of
+    its remaining cost, and an emptied lot gives up all of it, so the cost of
+    the open lots always adds up exactly.
+    """
+    filled = Decimal('0')
+    cost = Decimal('0')
+    for lot in lots:
+        if filled >= quantity:
+            break
+        if lot.remaining_quantity <= 0:
+            continue
+        take = min(lot.remaining_quantity, quantity - filled)
+        if take == lot.remaining_quantity:
+            taken_cost = lot.remaining_cost
+        else:
+            taken_cost = prorate(lot.remaining_cost, take, lot.remaining_quantity)
+        lot.remaining_quantity -= take
+        lot.remaining_cost -= taken_cost
+        filled += take
+        cost += taken_cost
+    return filled, cost
+
+
+def reserve_for_sell(user, crypto, amount):
+    """Set ``amount`` of ``user``'s ``crypto`` aside for a pending sell, or raise InsufficientHoldings"""
+    amount = money_value(amount, CryptoHolding._meta.get_field('reserved_quantity'))
+    reserved = CryptoHolding.objects.filter(
+        user=user,
+        crypto=crypto,
+        quantity__gte=F('reserved_quantity') + amount
+    ).update(reserved_quantity=F('reserved_quantity') + amount)
+    if not reserved:
+        raise InsufficientHoldings()
+
+
+def _lock_holdings(orders):
+    keys = {(order.user_id, order.crypto_id) for order in orders}
+    CryptoHolding.objects.bulk_create(
+        [CryptoHolding(user_id=user_id, crypto_id=crypto_id) for user_id, crypto_id in keys],
+        ignore_conflicts=True
+    )
+    holdings = CryptoHolding.objects.select_for_update().filter(
+        user_id__in={user_id for user_id, _ in keys},
+        crypto_id__in={crypto_id for _, crypto_id in keys}
+    ).order_by('pk')
+    return {
+        (holding.user_id, holding.crypto_id): holding
+        for holding in holdings
+        if (holding.user_id, holding.crypto_id) in keys
+    }
+
+
+def settle_positions(orders, action):
+    """
+    Apply a batch of settling orders to their holdings and lots.
+
+    Approved buys open a lot; approved sells close lots FIFO and book the
+    realised P&L; either way a sell's reservation is released. Must run in
+    the transaction that settles ``orders``. Returns the pks of sells that
+    the position can't cover (only possible for orders placed before
+    holdings were tracked); the caller rejects those instead.
+    """
+    holdings = _lock_holdings(orders)
+    lots = {}
+    sell_keys = {(order.user_id, order.crypto_id) for order in orders if order.transaction_type == 'sell'}
+    if action == 'approve' and sell_keys:
+        open_lots = CryptoLot.objects.filter(
+            holding__in=[holdings[key] for key in sell_keys],
+            remaining_quantity__gt=0
+        ).order_by('holding_id', 'acquired_at', 'id')
+        for lot in open_lots:
+            lots.setdefault(lot.holding_id, []).append(lot)
+
+    new_lots = []
+    changed_lots = set()
+    unfilled = set()
+    for order in sorted(orders, key=lambda order: (order.timestamp, order.pk)):
+        holding = holdings[(order.user_id, order.crypto_id)]
+        amount = Decimal(order.amount)
+        value = Decimal(order.total_value)
+        if order.transaction_type == 'sell':
+            holding.reserved_quantity = max(holding.reserved_quantity - amount, 0)
+            if action != 'approve':
+                continue
+            if holding.quantity < amount:
+                unfilled.add(order.pk)
+                continue
+            holding_lots = lots.get(holding.pk, [])
+            _, cost = consume_lots(holding_lots, amount)
+            changed_lots.update(lot for lot in holding_lots if lot.pk)
+            holding.quantity -= amount
+            holding.cost_basis -= cost
+            holding.realized_pnl += value - cost
+        elif order.transaction_type == 'buy' and action == 'approve':
+            lot = CryptoLot(
+                holding=holding,
+                order_id=order.pk,
+                acquired_at=order.timestamp,
+                price=order.price_at_transaction,
+                quantity=amount,
+                remaining_quantity=amount,
+                remaining_cost=value
+            )
+            new_lots.append(lot)
+            lots.setdefault(holding.pk, []).append(lot)
+            holding.quantity += amount
+            holding.cost_basis += value
+
+    now = timezone.now()
+    for holding in holdings.values():
+        holding.updated_at = now
+    CryptoHolding.objects.bulk_update(
+        holdings.values(), ['quantity', 'reserved_quantity', 'cost_basis', 'realized_pnl', 'updated_at'],
+        batch_size=500
+    )
+    CryptoLot.objects.bulk_update(changed_lots, ['remaining_quantity', 'remaining_cost'], batch_size=500)
+    CryptoLot.objects.bulk_create(new_lots, batch_size=500)
+    return unfilled
+
+
+def portfolio(user, prices):
+    """``user``'s non-empty holdings with market value and P&L at ``prices`` ({crypto_id: price})"""
+    holdings = list(CryptoHolding.objects.filter(user=user).exclude(
+        quantity=0, realized_pnl=0
+    ).select_related('crypto').order_by('crypto__symbol'))
+    for holding in holdings:
+        price = prices.get(holding.crypto_id, holding.crypto.current_price)
+        holding.price = price
+        holding.value = holding.market_value(price)
+        holding.unrealized = holding.unrealized_pnl(price)
+    return holdings
@@ -0,0 +1,161 @@
+# crypto/prices.py
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .history import record_ticks, rollup_prices
+from .models import Cryptocurrency, TickerLease
+from .providers import ProviderError, get_provider
+
+# Process-wide snapshot of the Cryptocurrency table. Views read it instead of
+# the database; it is reloaded at most once per CRYPTO_PRICE_CACHE_TTL seconds
+# and its version only changes when the prices themselves change.
+_snapshot = {'version': 0, 'loaded_at': None, 'cryptos': [], 'prices': None}
+_snapshot_lock = threading.Lock()
+_ticker = None
+
+
+def price_cache_ttl():
+    return getattr(settings, 'CRYPTO_PRICE_CACHE_TTL', 5)
+
+
+def _store(cryptos):
+    prices = tuple((crypto.pk, crypto.current_price) for crypto in cryptos)
+    with _snapshot_lock:
+        if prices != _snapshot['prices']:
+            _snapshot['version'] += 1
+            _snapshot['prices'] = prices
+        _snapshot['cryptos'] = cryptos
+        _snapshot['loaded_at'] = time.monotonic()
+
+
+def get_cryptocurrencies():
+    """Return the cached list of cryptocurrencies with their current prices"""
+    if getattr(settings, 'CRYPTO_PRICE_TICKER_THREAD', False):
+        start_price_ticker()
+    loaded_at = _snapshot['loaded_at']
+    if loaded_at is None or time.monotonic() - loaded_at > price_cache_ttl():
+        _store(list(Cryptocurrency.objects.order_by('pk')))
+    return _snapshot['cryptos']
+
+
+def get_price_snapshot():
+    """Return ``(version, cryptos)``; the version changes whenever any price does"""
+    cryptos = get_cryptocurrencies()
+    return _snapshot['version'], cryptos
+
+
+def invalidate_price_cache():
+    with _snapshot_lock:
+        _snapshot['loaded_at'] = None
+
+
+def refresh_prices():
+    """
+    Apply one round of provider quotes with a single bulk_update.
+
+    Each price is stamped with the time it was quoted, not the time it was
+    applied. Quotes no newer than a cryptocurrency's last_updated (a cached
+    quote served again while the provider revalidates) are skipped, so they
+    neither look fresh nor record a second tick.
+
+    Raises ProviderError, leaving prices untouched, if no quotes are available.
+    """
+    cryptos = list(Cryptocurrency.objects.order_by('pk'))
+    quotes = get_provider().quotes(cryptos)
+    quoted = [
+        crypto for crypto in cryptos
+        if crypto.symbol in quotes and (crypto.last_updated is None or quotes.quoted_at > crypto.last_updated)
+    ]
+    for crypto in quoted:
+        crypto.current_price = quotes[crypto.symbol]
+        crypto.last_updated = quotes.quoted_at
+    if quoted:
+        Cryptocurrency.objects.bulk_update(quoted, ['current_price', 'last_updated'])
+        record_ticks(quoted, quotes.quoted_at)
+    _store(cryptos)
+    return cryptos
+
+
+TICKER_LEASE = 'price-ticker'
+
+
+def acquire_lease(name, holder, ttl):
+    """
+    Take or renew the lease ``name`` for ``ttl`` seconds. Returns False while
+    another holder's lease is unexpired. The single conditional UPDATE is
+    atomic on every backend, so two processes can't both take a lapsed lease.
+    """
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=ttl)
+    if TickerLease.objects.filter(name=name).filter(Q(holder=holder) | Q(expires_at__lt=now)).update(
+        holder=holder, expires_at=expires_at
+    ):
+        return True
+    try:
+        with transaction.atomic():
+            TickerLease.objects.create(name=name, holder=holder, expires_at=expires_at)
+    except IntegrityError:
+        return False
+    return True
+
+
+def release_lease(name, holder):
+    TickerLease.objects.filter(name=name, holder=holder).delete()
+
+
+def run_ticker(interval, iterations=None, stop_event=None):
+    """
+    Refresh prices every ``interval`` seconds until stopped, rolling up
+    history as it goes, and return how many refreshes this ticker ran. Only
+    the holder of the ticker lease refreshes; any
+    other ticker (another web worker's thread, a second run_price_ticker)
+    just waits, ready to take over if the holder stops renewing.
+    """
+    holder = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+    # A holder that misses a few renewals is presumed dead
+    ttl = max(interval * 3, 5)
+    count = refreshed = 0
+    try:
+        while iterations is None or count < iterations:
+            started = time.monotonic()
+            close_old_connections()
+            if acquire_lease(TICKER_LEASE, holder, ttl):
+                try:
+                    refresh_prices()
+                except ProviderError:
+                    # Keep the last prices and try again next interval
+                    pass
+                rollup_prices()
+                refreshed += 1
+            count += 1
+            wait = max(0, interval - (time.monotonic() - started))
+            if stop_event is not None:
+                if stop_event.wait(wait):
+                    break
+            elif iterations is None or count < iterations:
+                time.sleep(wait)
+    finally:
+        release_lease(TICKER_LEASE, holder)
+    return refreshed
+
+
+def start_price_ticker():
+    """Start the in-process ticker thread once per process"""
+    global _ticker
+    with _snapshot_lock:
+        if _ticker is None:
+            interval = getattr(settings, 'CRYPTO_PRICE_TICKER_INTERVAL', 10)
+            _ticker = threading.Thread(
+                target=run_ticker, args=(interval,), name='crypto-price-ticker', daemon=True
+            )
+            _ticker.start()
+    return _ticker
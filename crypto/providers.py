@@ -0,0 +1,213 @@
+# crypto/providers.py
+# Where new prices come from. refresh_prices asks the configured provider for
+# quotes for every cryptocurrency at once; the provider is chosen with
+# CRYPTO_PRICE_PROVIDER and built once per process so its HTTP connections
+# are reused across refreshes.
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+
+import requests
+from django.conf import settings
+from django.utils import timezone
+from requests.adapters import HTTPAdapter
+
+PRICE_QUANTUM = Decimal('0.00000001')
+
+
+class ProviderError(Exception):
+    """Quotes could not be fetched and no usable cached quotes exist"""
+
+
+class Quotes(dict):
+    """
+    ``{symbol: price}`` plus ``quoted_at``, when the upstream produced them.
+    Quotes served from a cache keep the time they were fetched, so callers
+    can tell a new price from one they have already applied.
+    """
+
+    def __init__(self, prices, quoted_at):
+        super().__init__(prices)
+        self.quoted_at = quoted_at
+
+    @property
+    def age(self):
+        """Seconds since the upstream quoted these prices"""
+        return (timezone.now() - self.quoted_at).total_seconds()
+
+
+class PriceProvider:
+    """Returns ``Quotes`` for a list of cryptocurrencies"""
+
+    def quotes(self, cryptos):
+        raise NotImplementedError
+
+
+class SimulatedProvider(PriceProvider):
+    """Moves every price up 1% per refresh, for running without a market feed"""
+
+    def quotes(self, cryptos):
+        return Quotes({
+            crypto.symbol: (crypto.current_price * Decimal('1.01')).quantize(PRICE_QUANTUM)
+            for crypto in cryptos
+        }, timezone.now())
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing upstream for ``reset_timeout`` seconds after
+    ``threshold`` consecutive failures, then lets a single trial call through.
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Half open: the next failure re-opens the circuit immediately
+                self.opened_at = None
+                self.failures = self.threshold - 1
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+class HTTPProvider(PriceProvider):
+    """
+    Quotes every symbol with one ``GET {base_url}/quotes?symbols=A,B,...``
+    expecting ``{"quotes": {"A": "123.45", ...}}``.
+
+    Connections come from a pooled keep-alive session. Quotes younger than
+    ``fresh_for`` seconds are served from memory; up to ``stale_for`` seconds
+    older than that they are still served while one background request
+    revalidates them. Failures count towards a circuit breaker, and while it
+    is open only cached quotes within the stale window are returned.
+    """
+
+    def __init__(self, base_url, timeout=(1, 2), fresh_for=1, stale_for=30,
+                 pool_size=4, breaker=None):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.fresh_for = fresh_for
+        self.stale_for = stale_for
+        self.breaker = breaker or CircuitBreaker()
+        self.session = requests.Session()
+        # No retries: a slow upstream must cost one round-trip, not several
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.cached = {}
+        self.fetched_at = None
+        self.quoted_at = None
+        self.lock = threading.Lock()
+        self.revalidating = None
+
+    def fetch(self, symbols):
+        """Request quotes for ``symbols`` from the upstream and cache them"""
+        if not self.breaker.allow():
+            raise ProviderError('Price provider circuit is open')
+        try:
+            response = self.session.get(
+                f'{self.base_url}/quotes', params={'symbols': ','.join(symbols)}, timeout=self.timeout
+            )
+            response.raise_for_status()
+            quotes = {
+                symbol: Decimal(str(price)).quantize(PRICE_QUANTUM)
+                for symbol, price in response.json()['quotes'].items()
+            }
+        except (requests.RequestException, ValueError, KeyError, TypeError, InvalidOperation) as e:
+            self.breaker.record_failure()
+            raise ProviderError(f'Price provider request failed: {e}') from e
+        self.breaker.record_success()
+        quoted_at = timezone.now()
+        with self.lock:
+            self.cached.update(quotes)
+            self.fetched_at = time.monotonic()
+            self.quoted_at = quoted_at
+        return Quotes(quotes, quoted_at)
+
+    def _revalidate(self, symbols):
+        try:
+            self.fetch(symbols)
+        except ProviderError:
+            pass
+        finally:
+            self.revalidating = None
+
+    def quotes(self, cryptos):
+        symbols = sorted(crypto.symbol for crypto in cryptos)
+        with self.lock:
+            age = None if self.fetched_at is None else time.monotonic() - self.fetched_at
+            covered = all(symbol in self.cached for symbol in symbols)
+            cached = Quotes(
+                {symbol: self.cached[symbol] for symbol in symbols if symbol in self.cached}, self.quoted_at
+            )
+            if covered and age is not None and age < self.fresh_for:
+                return cached
+            if covered and age is not None and age < self.fresh_for + self.stale_for:
+                if self.revalidating is None:
+                    self.revalidating = threading.Thread(
+                        target=self._revalidate, args=(symbols,), name='crypto-price-revalidate', daemon=True
+                    )
+                    self.revalidating.start()
+                return cached
+        return self.fetch(symbols)
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def build_provider():
+    """The provider named by CRYPTO_PRICE_PROVIDER"""
+    name = getattr(settings, 'CRYPTO_PRICE_PROVIDER', 'simulated')
+    if name == 'simulated':
+        return SimulatedProvider()
+    if name == 'http':
+        return HTTPProvider(
+            settings.CRYPTO_PRICE_PROVIDER_URL,
+            timeout=(
+                getattr(settings, 'CRYPTO_PRICE_PROVIDER_CONNECT_TIMEOUT', 1),
+                getattr(settings, 'CRYPTO_PRICE_PROVIDER_READ_TIMEOUT', 2),
+            ),
+            fresh_for=getattr(settings, 'CRYPTO_PRICE_PROVIDER_FRESH_SECONDS', 1),
+            stale_for=getattr(settings, 'CRYPTO_PRICE_PROVIDER_STALE_SECONDS', 30),
+            breaker=CircuitBreaker(
+                getattr(settings, 'CRYPTO_PRICE_PROVIDER_FAILURE_THRESHOLD', 5),
+                getattr(settings, 'CRYPTO_PRICE_PROVIDER_RESET_SECONDS', 30),
+            ),
+        )
+    raise ValueError(f'Unknown CRYPTO_PRICE_PROVIDER {name!r}')
+
+
+def get_provider():
+    """The process-wide provider, built on first use"""
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            _provider = build_provider()
+    return _provider
+
+
+def reset_provider():
+    """Forget the process-wide provider, e.g. after changing settings"""
+    global _provider
+    with _provider_lock:
+        _provider = None
@@ -0,0 +1,68 @@
+# crypto/reservations.py
+# Cash for pending buy orders stays in CryptoAccount.balance but is held back
+# in reserved_balance, which is changed in the same UPDATE that places or
+# settles an order. Available funds are balance - reserved_balance, read from
+# a single row; verify_reservations recomputes the reservations from the
+# orders themselves to catch drift.
+from django.db import transaction
+from django.db.models import Case, F, Sum, When
+
+from banking.ledger import InsufficientFunds
+from banking.money import money_value
+from .models import CryptoAccount, CryptoTransaction
+
+
+def reserve_for_buy(crypto_account, amount):
+    """Hold ``amount`` of the account's cash for a buy order, or raise InsufficientFunds"""
+    amount = money_value(amount, CryptoAccount._meta.get_field('reserved_balance'))
+    reserved = CryptoAccount.objects.filter(
+        pk=crypto_account.pk,
+        balance__gte=F('reserved_balance') + amount
+    ).update(reserved_balance=F('reserved_balance') + amount)
+    if not reserved:
+        raise InsufficientFunds('Insufficient funds in crypto account')
+
+
+def pending_buy_totals(user_ids):
+    """``{user_id: total}`` of pending buy orders, grouped in one query"""
+    return dict(CryptoTransaction.objects.filter(
+        user_id__in=user_ids,
+        status='pending',
+        transaction_type='buy'
+    ).values('user_id').annotate(total=Sum('total_value')).values_list('user_id', 'total'))
+
+
+def verify_reservations(chunk_size=2000, fix=False):
+    """
+    Compare every account's reserved_balance with its pending buys.
+
+    Accounts are walked in primary key chunks; each chunk is locked while its
+    pending totals are summed, so orders placed meanwhile can't show up as
+    drift. Returns ``[(account, expected)]`` for accounts that disagree and,
+    with ``fix``, sets them to the expected value.
+    """
+    drift = []
+    last_pk = 0
+    while True:
+        with transaction.atomic():
+            accounts = list(CryptoAccount.objects.select_for_update().filter(
+                pk__gt=last_pk
+            ).order_by('pk')[:chunk_size])
+            if not accounts:
+                return drift
+            totals = pending_buy_totals({account.user_id for account in accounts})
+            chunk = [
+                (account, totals.get(account.user_id, 0))
+                for account in accounts
+                if account.reserved_balance != totals.get(account.user_id, 0)
+            ]
+            if fix and chunk:
+                field = CryptoAccount._meta.get_field('reserved_balance')
+                CryptoAccount.objects.filter(pk__in=[account.pk for account, _ in chunk]).update(
+                    reserved_balance=Case(
+                        *[When(pk=account.pk, then=money_value(expected, field)) for account, expected in chunk],
+                        output_field=field
+                    )
+                )
+        drift += chunk
+        last_pk = accounts[-1].pk
@@ -0,0 +1,180 @@
+# crypto/settlement.py
+# Pending buy and sell orders are settled here in batches. A batch is claimed
+# with SELECT ... FOR UPDATE SKIP LOCKED, so any number of workers can drain
+# the queue at once: each sees only rows nobody else holds. On SQLite, where
+# row locks don't exist, IMMEDIATE transactions serialise the workers instead.
+# Status changes are also guarded by status='pending', so an order can never
+# be settled twice.
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib import messages
+from django.db import OperationalError, transaction
+from django.db.models import Case, F, When
+from django.utils import timezone
+
+from banking.money import money_value
+from banking.summary import invalidate_portfolio_summary
+from .models import CryptoAccount, CryptoTransaction
+from .positions import settle_positions
+
+ACTIONS = {
+    'approve': 'completed',
+    'reject': 'rejected',
+}
+
+
+class SettlementError(Exception):
+    """Raised when a claimed batch no longer matches the database"""
+
+
+def cash_change(order, action):
+    """
+    Effect of settling ``order`` on its owner's crypto account, as
+    ``(balance change, reserved_balance change)``.
+
+    A buy's cost is reserved when the order is placed: approving it spends
+    the reservation, rejecting it releases it. A sell pays out when approved.
+    """
+    value = Decimal(order.total_value)
+    if order.transaction_type == 'buy':
+        return (-value if action == 'approve' else Decimal('0')), -value
+    if order.transaction_type == 'sell' and action == 'approve':
+        return value, Decimal('0')
+    return Decimal('0'), Decimal('0')
+
+
+def claim_orders(queryset, batch_size):
+    """Lock up to ``batch_size`` pending orders nobody else has claimed, oldest first"""
+    # of=('self',) keeps a select_related() queryset from also locking the
+    # joined user and cryptocurrency rows, which would block the price ticker
+    # and make concurrent workers skip each other's orders for the same coin
+    return list(
+        queryset.select_for_update(skip_locked=True, of=('self',)).filter(
+            status='pending'
+        ).order_by('timestamp', 'id')[:batch_size]
+    )
+
+
+def filter_orders(queryset, filters, now=None):
+    """Narrow ``queryset`` by the cleaned data of a PendingOrderFilterForm"""
+    if filters.get('symbol'):
+        queryset = queryset.filter(crypto=filters['symbol'])
+    if filters.get('transaction_type'):
+        queryset = queryset.filter(transaction_type=filters['transaction_type'])
+    if filters.get('username'):
+        queryset = queryset.filter(user__username=filters['username'])
+    if filters.get('min_age') is not None:
+        queryset = queryset.filter(timestamp__lte=(now or timezone.now()) - timedelta(minutes=filters['min_age']))
+    if filters.get('min_total') is not None:
+        queryset = queryset.filter(total_value__gte=filters['min_total'])
+    if filters.get('max_total') is not None:
+        queryset = queryset.filter(total_value__lte=filters['max_total'])
+    return queryset
+
+
+def settle_batch(action='approve', batch_size=500, order_ids=None, queryset=None):
+    """
+    Claim a batch of pending orders and approve or reject them atomically.
+
+    Order statuses are changed with one UPDATE and each owner's crypto account
+    balance and reservation with one CASE update for the whole batch; holdings and lots are updated
+    alongside. Sells the seller's position can't cover are rejected rather
+    than approved. ``order_ids`` or ``queryset`` limit the batch to
+    particular orders. Returns the number of orders settled.
+    """
+    status = ACTIONS[action]
+    if queryset is None:
+        queryset = CryptoTransaction.objects.all()
+    if order_ids is not None:
+        queryset = queryset.filter(pk__in=order_ids)
+
+    with transaction.atomic():
+        orders = claim_orders(queryset, batch_size)
+        if not orders:
+            return 0
+
+        unfilled = settle_positions(orders, action)
+
+        deltas = {}
+        for order in orders:
+            balance_change, reserved_change = cash_change(order, 'reject' if order.pk in unfilled else action)
+            if balance_change or reserved_change:
+                balance_delta, reserved_delta = deltas.get(order.user_id, (0, 0))
+                deltas[order.user_id] = (balance_delta + balance_change, reserved_delta + reserved_change)
+
+        updated = CryptoTransaction.objects.filter(
+            pk__in=[order.pk for order in orders if order.pk not in unfilled], status='pending'
+        ).update(status=status)
+        if unfilled:
+            updated += CryptoTransaction.objects.filter(
+                pk__in=unfilled, status='pending'
+            ).update(status='rejected')
+        if updated != len(orders):
+            raise SettlementError('Orders were settled by someone else while the batch was claimed.')
+
+        if deltas:
+            CryptoAccount.objects.filter(user_id__in=deltas).update(**{
+                name: F(name) + Case(
+                    *[
+                        When(user_id=user_id, then=money_value(changes[index], field))
+                        for user_id, changes in deltas.items()
+                    ],
+                    output_field=field
+                )
+                for index, name in enumerate(['balance', 'reserved_balance'])
+                for field in [CryptoAccount._meta.get_field(name)]
+            })
+        invalidate_portfolio_summary(*{order.user_id for order in orders})
+    return len(orders)
+
+
+def settle_pending(action='approve', batch_size=500, max_batches=None, queryset=None):
+    """
+    Settle batches until the queue (or ``queryset``) is empty, or ``max_batches`` have run.
+
+    Each batch commits on its own. If one raises, the orders settled by the
+    batches before it are recorded on the exception as ``settled``.
+    """
+    total = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        try:
+            settled = settle_batch(action, batch_size, queryset=queryset)
+        except Exception as e:
+            e.settled = total
+            raise
+        if not settled:
+            break
+        total += settled
+        batches += 1
+    return total
+
+
+def settle_from_request(action, queryset):
+    """
+    Settle matching orders inside a web request, returning the messages to
+    show as ``[(level, text)]``.
+
+    At most CRYPTO_SETTLE_REQUEST_BATCHES batches run, so a large queue
+    can't hold the request open; the rest is left to ``manage.py
+    settle_crypto_orders``. A batch that fails (a lock timeout, or a clash
+    with a settlement worker) rolls back alone: batches before it stay
+    settled and are reported.
+    """
+    max_batches = getattr(settings, 'CRYPTO_SETTLE_REQUEST_BATCHES', 10)
+    try:
+        settled, failure = settle_pending(action, max_batches=max_batches, queryset=queryset), None
+    except (SettlementError, OperationalError) as e:
+        settled, failure = getattr(e, 'settled', 0), e
+    reports = []
+    if settled or not failure:
+        reports.append((messages.SUCCESS, f'{settled} matching transactions {ACTIONS[action]}.'))
+    if failure:
+        reports.append((messages.ERROR, f'Settlement stopped early; the remaining orders are still pending. {failure}'))
+    elif queryset.filter(status='pending').exists():
+        reports.append((messages.WARNING, (
+            'More matching orders are still pending; settle them again or run manage.py settle_crypto_orders.'
+        )))
+    return reports
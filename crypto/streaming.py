@@ -0,0 +1,167 @@
+# crypto/streaming.py
+# Live prices over Server-Sent Events. Each process runs one broadcaster task
+# that watches the price cache and encodes an update once per price change;
+# every connected client only owns a one-slot queue that the broadcaster
+# drops the encoded bytes into. A slow client therefore skips to the newest
+# prices instead of buffering old ones, and the cost of a price change is
+# one JSON encode plus a queue put per client.
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+from .prices import get_price_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Browsers reconnect this many milliseconds after a stream ends
+RETRY_MS = 5000
+
+
+def price_event_id(cryptos):
+    """
+    The SSE event id for a set of prices. It is derived from the prices
+    themselves, not from the per-process snapshot version, so a client that
+    reconnects to a different worker is only spared prices it already has.
+    """
+    key = ','.join(f'{crypto.pk}:{crypto.current_price}' for crypto in sorted(cryptos, key=lambda c: c.pk))
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def encode_prices(cryptos):
+    """One SSE ``prices`` event for a price snapshot"""
+    event_id = price_event_id(cryptos)
+    data = json.dumps({
+        'id': event_id,
+        'prices': [
+            {
+                'symbol': crypto.symbol,
+                'price': str(crypto.current_price),
+                'last_updated': crypto.last_updated.isoformat() if crypto.last_updated else None,
+            }
+            for crypto in cryptos
+        ],
+    }, separators=(',', ':'))
+    return f"id: {event_id}\nevent: prices\ndata: {data}\n\n".encode()
+
+
+def _offer(queue, message):
+    # Replace whatever the client hasn't read yet; only the latest prices matter
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(message)
+
+
+class PriceBroadcaster:
+    """Fans price updates out from a single polling task to every subscriber queue"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.subscribers = set()
+        self.version = None
+        self.event_id = None
+        self.message = None
+        self.task = None
+
+    async def refresh(self):
+        """Re-read the price cache and push an update if the prices changed"""
+        version, cryptos = await sync_to_async(get_price_snapshot)()
+        if version != self.version:
+            self.version = version
+            self.event_id = price_event_id(cryptos)
+            self.message = encode_prices(cryptos)
+            for queue in self.subscribers:
+                _offer(queue, self.message)
+
+    async def run(self):
+        while self.subscribers:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh()
+            except Exception:
+                # A failed read (e.g. the database is briefly unavailable)
+                # must not end the stream for every client
+                logger.warning('Price stream refresh failed', exc_info=True)
+                continue
+        self.task = None
+
+    async def subscribe(self):
+        queue = asyncio.Queue(maxsize=1)
+        if self.message is None:
+            await self.refresh()
+        self.subscribers.add(queue)
+        if self.task is None:
+            # The task outlives the request that started it, so it gets an
+            # empty context rather than a copy of that request's (which
+            # would e.g. keep adding its queries to the request's profile)
+            self.task = contextvars.Context().run(asyncio.create_task, self.run())
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+
+_broadcasters = {}
+
+
+def get_broadcaster():
+    """The broadcaster for the running event loop, created on first use"""
+    loop = asyncio.get_running_loop()
+    broadcaster = _broadcasters.get(loop)
+    if broadcaster is None:
+        # Forget broadcasters of loops that have been closed (e.g. between tests)
+        for stale in [other for other in _broadcasters if other.is_closed()]:
+            del _broadcasters[stale]
+        broadcaster = _broadcasters[loop] = PriceBroadcaster(
+            getattr(settings, 'CRYPTO_STREAM_INTERVAL', 1)
+        )
+    return broadcaster
+
+
+async def _events(broadcaster, last_event_id):
+    heartbeat = getattr(settings, 'CRYPTO_STREAM_HEARTBEAT', 15)
+    # Subscribing here rather than in the view ties the subscription to the
+    # generator, whose cleanup runs when the client disconnects
+    queue = await broadcaster.subscribe()
+    try:
+        yield f"retry: {RETRY_MS}\n\n".encode()
+        if last_event_id != broadcaster.event_id:
+            yield broadcaster.message
+        while True:
+            try:
+                yield await asyncio.wait_for(queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing an idle connection
+                yield b": keep-alive\n\n"
+    finally:
+        broadcaster.unsubscribe(queue)
+
+
+def _stream_response(content):
+    response = StreamingHttpResponse(content, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@login_required
+async def price_stream_view(request):
+    """
+    Stream price updates to one client.
+
+    Under WSGI a request can't be held open without tying up a worker, so the
+    client gets the current prices once and EventSource reconnects after
+    RETRY_MS, which degrades to polling.
+    """
+    if not isinstance(request, ASGIRequest):
+        _, cryptos = await sync_to_async(get_price_snapshot)()
+        return _stream_response(iter([f"retry: {RETRY_MS}\n\n".encode(), encode_prices(cryptos)]))
+
+    return _stream_response(_events(get_broadcaster(), request.headers.get('Last-Event-ID')))
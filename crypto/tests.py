@@ -1,11 +1,33 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
 from decimal import Decimal
-from django.test import TestCase
+from io import StringIO
+from unittest.mock import patch
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from banking.models import BankAccount
-from crypto.models import CryptoAccount, Cryptocurrency
+from crypto.history import pick_resolution, price_history, rollup_prices
+from crypto.models import CryptoAccount, Cryptocurrency, CryptoHolding, CryptoTransaction, PriceCandle, PriceTick, TickerLease
+from crypto.mock_exchange import MockExchange, start_mock_exchange
+from crypto.providers import CircuitBreaker, HTTPProvider, ProviderError
+from crypto.prices import (
+    TICKER_LEASE, acquire_lease, get_price_snapshot, invalidate_price_cache, refresh_prices, run_ticker
+)
+from crypto.reservations import reserve_for_buy, verify_reservations
+from crypto.settlement import SettlementError, settle_batch, settle_pending
+from crypto.streaming import PriceBroadcaster, _events, get_broadcaster
+from asgiref.sync import sync_to_async
+from crypto.valuation import exposure_by_crypto, value_users
+from banking.models import AccountHistory
+from banking.snapshots import snapshot_users
 
 class CryptoTests(TestCase):
     def setUp(self):
-        self.user = get_user_model().objects.create_user(username='testuser', password='testpass')
+        self.user = get_user_model().objects.create_user(username='testuser', email='test@example.com', password='testpass')
         self.bank_account = BankAccount.objects.create(
             user=self.user,
             account_type='checking',
@@ -27,4 +49,517 @@ class CryptoTests(TestCase):
         self.bank_account.refresh_from_db()
         self.crypto_account.refresh_from_db()
         self.assertEqual(self.bank_account.balance, Decimal('500.00'))
-        self.assertEqual(self.crypto_account.balance, Decimal('500.00'))
\ No newline at end of file
+        self.assertEqual(self.crypto_account.balance, Decimal('500.00'))
+
+    def test_transfer_to_crypto_requires_login_and_opens_the_wallet(self):
+        response = self.client.get(reverse('transfer_to_crypto'))
+        self.assertRedirects(response, f"{reverse('login')}?next={reverse('transfer_to_crypto')}", fetch_redirect_response=False)
+
+        self.crypto_account.delete()
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('transfer_to_crypto'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(CryptoAccount.objects.filter(user=self.user).exists())
+
+class PriceCacheTests(TestCase):
+    def setUp(self):
+        invalidate_price_cache()
+        self.user = get_user_model().objects.create_user(
+            username='priceuser', email='price@example.com', password='testpass'
+        )
+        CryptoAccount.objects.create(user=self.user, account_number='CRYPTOPRICE')
+        self.btc = Cryptocurrency.objects.create(name='Bitcoin', symbol='BTC', current_price=Decimal('100.00'))
+        Cryptocurrency.objects.create(name='Ether', symbol='ETH', current_price=Decimal('10.00'))
+        self.client.force_login(self.user)
+
+    def test_crypto_home_does_not_write_prices(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('crypto_home'))
+            self.client.get(reverse('crypto_home'))
+        self.assertFalse([q for q in queries if q['sql'].startswith('UPDATE')])
+        self.btc.refresh_from_db()
+        self.assertEqual(self.btc.current_price, Decimal('100.00'))
+
+    async def test_crypto_home_under_asgi_creates_one_account(self):
+        user = await get_user_model().objects.acreate_user(
+            username='newtrader', email='newtrader@example.com', password='testpass'
+        )
+        await self.async_client.aforce_login(user)
+        for _ in range(2):
+            response = await self.async_client.get(reverse('crypto_home'))
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(await CryptoAccount.objects.filter(user=user).acount(), 1)
+        self.assertEqual(response.context['cryptos'][0].symbol, 'BTC')
+
+    def test_refresh_is_one_bulk_update_and_bumps_version(self):
+        version, _ = get_price_snapshot()
+        with CaptureQueriesContext(connection) as queries:
+            refresh_prices()
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('UPDATE')]), 1)
+        new_version, cryptos = get_price_snapshot()
+        self.assertEqual(new_version, version + 1)
+        self.assertEqual(cryptos[0].current_price, Decimal('101.00'))
+
+class ProviderTests(TestCase):
+    def setUp(self):
+        self.exchange = MockExchange({'BTC': '100', 'ETH': '10'}, volatility=0, seed=1)
+        self.server = start_mock_exchange(self.exchange)
+        host, port = self.server.server_address
+        self.url = f'http://{host}:{port}'
+        self.cryptos = [
+            Cryptocurrency(name='Bitcoin', symbol='BTC', current_price=Decimal('1')),
+            Cryptocurrency(name='Ether', symbol='ETH', current_price=Decimal('1')),
+        ]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_quotes_all_symbols_in_one_request(self):
+        provider = HTTPProvider(self.url, fresh_for=60)
+        self.assertEqual(provider.quotes(self.cryptos), {'BTC': Decimal('100'), 'ETH': Decimal('10')})
+        provider.quotes(self.cryptos)
+        self.assertEqual(self.exchange.requests, 1)
+
+    def test_serves_stale_quotes_while_upstream_fails(self):
+        provider = HTTPProvider(self.url, fresh_for=0, stale_for=60, breaker=CircuitBreaker(threshold=2))
+        provider.quotes(self.cryptos)
+        self.exchange.failure_rate = 1
+        for _ in range(3):
+            self.assertEqual(provider.quotes(self.cryptos)['BTC'], Decimal('100'))
+            revalidating = provider.revalidating
+            if revalidating:
+                revalidating.join()
+        # Two failed revalidations opened the circuit, so the third never left the process
+        self.assertEqual(self.exchange.requests, 3)
+        with self.assertRaises(ProviderError):
+            provider.fetch(['BTC'])
+
+    def test_stale_quotes_are_not_applied_again(self):
+        for crypto in self.cryptos:
+            crypto.save()
+        provider = HTTPProvider(self.url, fresh_for=0, stale_for=60)
+        with patch('crypto.prices.get_provider', return_value=provider):
+            refresh_prices()
+            quoted_at = provider.quoted_at
+            self.exchange.failure_rate = 1
+            refresh_prices()
+            revalidating = provider.revalidating
+            if revalidating:
+                revalidating.join()
+        self.assertEqual(PriceTick.objects.count(), 2)
+        btc = Cryptocurrency.objects.get(symbol='BTC')
+        self.assertEqual((btc.current_price, btc.last_updated), (Decimal('100'), quoted_at))
+        self.assertGreater(provider.quotes(self.cryptos).age, 0)
+
+@override_settings(CRYPTO_STREAM_INTERVAL=3600)
+class PriceStreamTests(TestCase):
+    def setUp(self):
+        invalidate_price_cache()
+        self.user = get_user_model().objects.create_user(
+            username='streamer', email='streamer@example.com', password='testpass'
+        )
+        Cryptocurrency.objects.create(name='Bitcoin', symbol='BTC', current_price=Decimal('100.00'))
+
+    def test_wsgi_clients_get_one_snapshot(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('crypto_price_stream'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join(response.streaming_content).decode()
+        self.assertIn('retry: ', body)
+        self.assertIn('"symbol":"BTC","price":"100.00000000"', body)
+
+    async def test_asgi_clients_share_one_broadcaster(self):
+        await self.async_client.aforce_login(self.user)
+        streams = []
+        for _ in range(2):
+            response = await self.async_client.get(reverse('crypto_price_stream'))
+            stream = aiter(response.streaming_content)
+            self.assertTrue((await anext(stream)).startswith(b'retry: '))
+            self.assertIn(b'"price":"100.00000000"', await anext(stream))
+            streams.append(stream)
+
+        broadcaster = get_broadcaster()
+        self.assertEqual(len(broadcaster.subscribers), 2)
+        await sync_to_async(refresh_prices)()
+        await broadcaster.refresh()
+        for stream in streams:
+            self.assertIn(b'"price":"101.00000000"', await anext(stream))
+            await stream.aclose()
+
+    @override_settings(CRYPTO_STREAM_HEARTBEAT=0.01)
+    async def test_reconnect_skips_only_prices_the_client_already_has(self):
+        broadcaster = get_broadcaster()
+        await broadcaster.refresh()
+        # The id names the prices, so another worker's broadcaster agrees on it
+        other_worker = PriceBroadcaster(1)
+        await other_worker.refresh()
+        self.assertEqual(other_worker.event_id, broadcaster.event_id)
+
+        for last_event_id, expected in [(broadcaster.event_id, b': keep-alive'), ('1', b'id: ')]:
+            events = _events(broadcaster, last_event_id)
+            await anext(events)
+            self.assertTrue((await anext(events)).startswith(expected))
+            await events.aclose()
+
+    async def test_disconnect_unsubscribes(self):
+        broadcaster = get_broadcaster()
+        events = _events(broadcaster, None)
+        await anext(events)
+        self.assertEqual(len(broadcaster.subscribers), 1)
+        await events.aclose()
+        self.assertFalse(broadcaster.subscribers)
+
+class PriceHistoryTests(TestCase):
+    def setUp(self):
+        self.btc = Cryptocurrency.objects.create(name='Bitcoin', symbol='BTC', current_price=Decimal('100.00'))
+        self.start = datetime(2025, 1, 1, 10, 0, tzinfo=dt_timezone.utc)
+
+    def tick(self, seconds, price):
+        PriceTick.objects.create(
+            crypto=self.btc, timestamp=self.start + timedelta(seconds=seconds), price=Decimal(price)
+        )
+
+    def test_rollup_builds_candles_and_prunes_ticks(self):
+        for seconds, price in [(0, '100'), (20, '105'), (40, '98'), (70, '101'), (130, '99')]:
+            self.tick(seconds, price)
+        # The minute starting at 10:02 is still open and must not be rolled up
+        rollup_prices(now=self.start + timedelta(seconds=150))
+
+        minutes = list(PriceCandle.objects.filter(resolution='1m').order_by('bucket'))
+        self.assertEqual(len(minutes), 2)
+        self.assertEqual(
+            [minutes[0].open, minutes[0].high, minutes[0].low, minutes[0].close],
+            [100, 105, 98, 98]
+        )
+        self.assertEqual(PriceTick.objects.count(), 1)
+
+        hour = PriceCandle.objects.get(resolution='1h')
+        self.assertEqual((hour.open, hour.high, hour.low, hour.close),
+                         (100, 105, 98, 101))
+
+        # A later run folds the remaining tick into the same hour and day
+        rollup_prices(now=self.start + timedelta(minutes=5))
+        day = PriceCandle.objects.get(resolution='1d')
+        self.assertEqual((day.low, day.close), (98, 99))
+        self.assertFalse(PriceTick.objects.exists())
+
+    def test_late_ticks_keep_the_minute_open_and_close_in_time_order(self):
+        self.tick(20, '100')
+        self.tick(40, '102')
+        rollup_prices(now=self.start + timedelta(minutes=2))
+
+        # Late ticks from before and between the rolled-up ones
+        self.tick(10, '97')
+        self.tick(30, '106')
+        rollup_prices(now=self.start + timedelta(minutes=3))
+        minute = PriceCandle.objects.get(resolution='1m')
+        self.assertEqual((minute.open, minute.high, minute.low, minute.close), (97, 106, 97, 102))
+
+        # A tick after the last one still moves the close
+        self.tick(50, '101')
+        rollup_prices(now=self.start + timedelta(minutes=4))
+        minute.refresh_from_db()
+        self.assertEqual((minute.open, minute.close, minute.last_tick_at), (97, 101, self.start + timedelta(seconds=50)))
+        self.assertEqual(PriceCandle.objects.get(resolution='1h').close, 101)
+
+    def test_long_ranges_read_coarse_candles(self):
+        end = self.start
+        self.assertEqual(pick_resolution(end - timedelta(hours=1), end, 500), '1m')
+        self.assertEqual(pick_resolution(end - timedelta(days=7), end, 500), '1h')
+        self.assertEqual(pick_resolution(end - timedelta(days=365), end, 500), '1d')
+
+        PriceCandle.objects.bulk_create([
+            PriceCandle(crypto=self.btc, resolution='1d', bucket=end - timedelta(days=day),
+                        open=1, high=1, low=1, close=1)
+            for day in range(400)
+        ])
+        resolution, candles = price_history(self.btc, end - timedelta(days=365), end)
+        self.assertEqual(resolution, '1d')
+        self.assertEqual(len(candles), 366)
+
+    def test_refresh_records_ticks(self):
+        refresh_prices()
+        self.assertEqual(PriceTick.objects.get().price, Decimal('101.00'))
+
+    def test_only_the_lease_holder_ticks(self):
+        self.assertTrue(acquire_lease(TICKER_LEASE, 'other-worker', 60))
+        self.assertEqual(run_ticker(0, iterations=2), 0)
+        self.assertFalse(PriceTick.objects.exists())
+
+        # Once the holder stops renewing, the next ticker takes over
+        TickerLease.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(run_ticker(0, iterations=2), 2)
+        self.assertEqual(PriceTick.objects.count(), 2)
+        self.assertFalse(TickerLease.objects.exists())
+
+    @override_settings(CRYPTO_PRICE_TICKER_INTERVAL=3)
+    def test_ticker_command_defaults_to_the_configured_interval(self):
+        with patch('crypto.management.commands.run_price_ticker.run_ticker', return_value=1) as run_ticker:
+            call_command('run_price_ticker', iterations=1, stdout=StringIO())
+            call_command('run_price_ticker', interval=0.5, iterations=1, stdout=StringIO())
+        self.assertEqual([c.args for c in run_ticker.call_args_list], [(3, 1), (0.5, 1)])
+
+class SettlementTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='trader', email='trader@example.com', password='testpass'
+        )
+        self.crypto_account = CryptoAccount.objects.create(
+            user=self.user, account_number='CRYPTOTRADER', balance=Decimal('1000.00')
+        )
+        self.btc = Cryptocurrency.objects.create(name='Bitcoin', symbol='BTC', current_price=Decimal('100.00'))
+
+    def order(self, transaction_type, amount):
+        order = CryptoTransaction.objects.create(
+            user=self.user,
+            crypto=self.btc,
+            transaction_type=transaction_type,
+            amount=Decimal(amount),
+            price_at_transaction=self.btc.current_price,
+            total_value=0
+        )
+        if transaction_type == 'buy':
+            reserve_for_buy(self.crypto_account, order.total_value)
+        return order
+
+    def test_settles_batches_with_grouped_balance_updates(self):
+        self.order('buy', '3')
+        settle_batch('approve')
+        for _ in range(3):
+            self.order('sell', '1')
+        self.order('buy', '2')
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(settle_batch('approve', batch_size=10), 4)
+        # Order statuses, cash balances, holdings and lots: one statement each
+        updates = [q for q in queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 4)
+
+        self.crypto_account.refresh_from_db()
+        self.assertEqual(self.crypto_account.balance, Decimal('800.00'))
+        self.assertEqual(self.crypto_account.reserved_balance, 0)
+        self.assertFalse(CryptoTransaction.objects.filter(status='pending').exists())
+        self.assertEqual(settle_pending(), 0)
+
+    def test_uncovered_sells_are_rejected(self):
+        sell = self.order('sell', '1')
+        self.assertEqual(settle_batch('approve'), 1)
+        sell.refresh_from_db()
+        self.assertEqual(sell.status, 'rejected')
+        self.crypto_account.refresh_from_db()
+        self.assertEqual(self.crypto_account.balance, Decimal('1000.00'))
+
+    def test_reject_releases_buy_reservations(self):
+        buy = self.order('buy', '2')
+        self.crypto_account.refresh_from_db()
+        self.assertEqual(self.crypto_account.available_balance, Decimal('800.00'))
+        self.assertEqual(settle_batch('reject', order_ids=[buy.pk]), 1)
+        self.crypto_account.refresh_from_db()
+        self.assertEqual(self.crypto_account.balance, Decimal('1000.00'))
+        self.assertEqual(self.crypto_account.reserved_balance, 0)
+        # Already settled, so a second attempt is a no-op
+        self.assertEqual(settle_batch('approve', order_ids=[buy.pk]), 0)
+
+    def test_admin_approves_one_order(self):
+        admin = get_user_model().objects.create_superuser(
+            username='boss', email='boss@example.com', password='testpass'
+        )
+        self.order('buy', '1')
+        settle_batch('approve')
+        sell = self.order('sell', '1')
+        self.client.force_login(admin)
+        response = self.client.post(reverse('admin_approve'), {'transaction_id': sell.pk, 'action': 'approve'})
+        self.assertEqual(response.status_code, 200)
+        sell.refresh_from_db()
+        self.assertEqual(sell.status, 'completed')
+        self.crypto_account.refresh_from_db()
+        self.assertEqual(self.crypto_account.balance, Decimal('1000.00'))
+
+    def test_admin_queue_filters_pages_and_bulk_settles(self):
+        admin = get_user_model().objects.create_superuser(
+            username='boss', email='boss@example.com', password='testpass'
+        )
+        eth = Cryptocurrency.objects.create(name='Ether', symbol='ETH', current_price=Decimal('10.00'))
+        btc_buys = [self.order('buy', '1') for _ in range(3)]
+        CryptoTransaction.objects.create(
+            user=self.user, crypto=eth, transaction_type='buy', amount=Decimal('1'),
+            price_at_transaction=eth.current_price, total_value=0
+        )
+        self.client.force_login(admin)
+        url = reverse('admin_approve')
+
+        with patch('crypto.views.ADMIN_QUEUE_SIZE', 2):
+            first = self.client.get(url, {'symbol': 'BTC'})
+            self.assertEqual(first.context['pending_count'], 3)
+            self.assertEqual(list(first.context['transactions']), btc_buys[:2])
+            second = self.client.get(f"{url}?{first.context['next_query']}")
+        self.assertEqual(list(second.context['transactions']), btc_buys[2:])
+        self.assertIsNone(second.context['next_cursor'])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(f'{url}?symbol=BTC', {'bulk_action': 'reject'})
+        self.assertLess(len(queries), 25)
+        self.assertEqual(CryptoTransaction.objects.filter(status='rejected').count(), 3)
+        self.assertEqual(CryptoTransaction.objects.get(status='pending').crypto, eth)
+
+        # A bad filter must not widen "all matching" to the whole queue
+        response = self.client.post(f'{url}?symbol=ETH&min_total=-1', {'bulk_action': 'reject'})
+        self.assertTrue(response.context['filter_form'].non_field_errors())
+        self.assertEqual(response.context['pending_count'], 0)
+        self.assertEqual(CryptoTransaction.objects.get(status='pending').crypto, eth)
+        self.crypto_account.refresh_from_db()
+        self.assertEqual(self.crypto_account.reserved_balance, 0)
+
+    def test_bulk_settle_reports_partial_progress(self):
+        admin = get_user_model().objects.create_superuser(
+            username='boss', email='boss@example.com', password='testpass'
+        )
+        self.order('buy', '1')
+        self.client.force_login(admin)
+        url = reverse('admin_approve')
+
+        error = SettlementError('Orders were settled by someone else while the batch was claimed.')
+        with patch('crypto.settlement.settle_batch', side_effect=[2, error]):
+            response = self.client.post(url, {'bulk_action': 'approve'}, follow=True)
+        self.assertEqual(response.status_code, 200)
+        reports = [(m.level_tag, m.message) for m in response.context['messages']]
+        self.assertEqual(reports[0], ('success', '2 matching transactions completed.'))
+        self.assertEqual(reports[1][0], 'error')
+        self.assertIn('settled by someone else', reports[1][1])
+
+        # The request stops after CRYPTO_SETTLE_REQUEST_BATCHES and points at the worker
+        with override_settings(CRYPTO_SETTLE_REQUEST_BATCHES=1), \
+                patch('crypto.settlement.settle_batch', return_value=1):
+            response = self.client.post(url, {'bulk_action': 'approve'})
+        reports = [(m.level_tag, m.message) for m in response.context['messages']]
+        self.assertEqual(reports[0], ('success', '1 matching transactions completed.'))
+        self.assertEqual(reports[1][0], 'warning')
+        self.assertIn('settle_crypto_orders', reports[1][1])
+
+    def test_settle_command_retries_after_a_conflicting_batch(self):
+        error = SettlementError('Orders were settled by someone else while the batch was claimed.')
+        stdout = StringIO()
+        with patch('crypto.management.commands.settle_crypto_orders.settle_batch', side_effect=[error, 2, 0]), \
+                self.assertLogs('crypto.management.commands.settle_crypto_orders', 'WARNING') as logs:
+            call_command('settle_crypto_orders', stdout=stdout)
+        self.assertIn('Settled 2 orders', stdout.getvalue())
+        self.assertIn('1 retries', stdout.getvalue())
+        self.assertIn('settled by someone else', logs.output[0])
+
+class ReservationTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='reserver', email='reserver@example.com', password='testpass'
+        )
+        self.crypto_account = CryptoAccount.objects.create(
+            user=self.user, account_number='CRYPTORESERVE', balance=Decimal('300.00')
+        )
+        self.bank_account = BankAccount.objects.create(user=self.user, account_type='checking')
+        self.btc = Cryptocurrency.objects.create(name='Bitcoin', symbol='BTC', current_price=Decimal('100.00'))
+        self.client.force_login(self.user)
+
+    def test_buys_reserve_and_withdrawals_respect_them(self):
+        buy = reverse('buy_crypto')
+        self.client.post(buy, {'crypto': self.btc.pk, 'amount': '2'})
+        self.client.post(buy, {'crypto': self.btc.pk, 'amount': '2'})
+        self.assertEqual(CryptoTransaction.objects.filter(transaction_type='buy').count(), 1)
+        self.crypto_account.refresh_from_db()
+        self.assertEqual(self.crypto_account.balance, Decimal('300.00'))
+        self.assertEqual(self.crypto_account.reserved_balance, Decimal('200.00'))
+
+        withdraw = reverse('transfer_from_crypto')
+        self.client.post(withdraw, {'amount': '150.00', 'bank_account': self.bank_account.pk})
+        self.client.post(withdraw, {'amount': '100.00', 'bank_account': self.bank_account.pk})
+        self.crypto_account.refresh_from_db()
+        self.assertEqual(self.crypto_account.balance, Decimal('200.00'))
+        self.assertEqual(self.crypto_account.available_balance, 0)
+
+    def test_verifier_finds_and_fixes_drift(self):
+        CryptoTransaction.objects.create(
+            user=self.user, crypto=self.btc, transaction_type='buy',
+            amount=Decimal('1'), price_at_transaction=self.btc.current_price, total_value=0
+        )
+        drift = verify_reservations()
+        self.assertEqual([(account.pk, expected) for account, expected in drift],
+                         [(self.crypto_account.pk, Decimal('100.00'))])
+
+        verify_reservations(fix=True)
+        self.crypto_account.refresh_from_db()
+        self.assertEqual(self.crypto_account.reserved_balance, Decimal('100.00'))
+        self.assertEqual(verify_reservations(), [])
+
+class HoldingTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            username='holder', email='holder@example.com', password='testpass'
+        )
+        self.crypto_account = CryptoAccount.objects.create(
+            user=self.user, account_number='CRYPTOHOLDER', balance=Decimal('1000.00')
+        )
+        self.btc = Cryptocurrency.objects.create(name='Bitcoin', symbol='BTC', current_price=Decimal('100.00'))
+        self.client.force_login(self.user)
+
+    def settle(self, transaction_type, amount, price):
+        order = CryptoTransaction.objects.create(
+            user=self.user, crypto=self.btc, transaction_type=transaction_type,
+            amount=Decimal(amount), price_at_transaction=Decimal(price), total_value=0
+        )
+        if transaction_type == 'buy':
+            reserve_for_buy(self.crypto_account, order.total_value)
+        settle_batch('approve', order_ids=[order.pk])
+        return order
+
+    def holding(self):
+        return CryptoHolding.objects.get(user=self.user, crypto=self.btc)
+
+    def test_sells_close_lots_fifo(self):
+        self.settle('buy', '1', '100')
+        self.settle('buy', '1', '200')
+        self.settle('sell', '1.5', '300')
+
+        holding = self.holding()
+        self.assertEqual(holding.quantity, Decimal('0.5'))
+        # 1 @ 100 and 0.5 @ 200 were sold for 450
+        self.assertEqual(holding.cost_basis, Decimal('100'))
+        self.assertEqual(holding.realized_pnl, Decimal('250'))
+        self.assertEqual(holding.unrealized_pnl(Decimal('300')), Decimal('50'))
+        self.assertEqual(sorted(holding.lots.values_list('remaining_quantity', flat=True)), [0, Decimal('0.5')])
+
+    def test_sell_view_checks_and_reserves_holdings(self):
+        url = reverse('sell_crypto')
+        self.client.post(url, {'crypto': self.btc.pk, 'amount': '1'})
+        self.assertFalse(CryptoTransaction.objects.filter(transaction_type='sell').exists())
+
+        self.settle('buy', '1', '100')
+        self.client.post(url, {'crypto': self.btc.pk, 'amount': '0.75'})
+        self.client.post(url, {'crypto': self.btc.pk, 'amount': '0.5'})
+        self.assertEqual(CryptoTransaction.objects.filter(transaction_type='sell').count(), 1)
+        self.assertEqual(self.holding().available_quantity, Decimal('0.25'))
+
+        settle_batch('reject')
+        self.assertEqual(self.holding().available_quantity, Decimal('1'))
+
+class ValuationTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='testpass')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='testpass')
+        CryptoAccount.objects.create(user=self.alice, account_number='CRYPTOALICE', balance=Decimal('5.00'))
+        btc = Cryptocurrency.objects.create(name='Bitcoin', symbol='BTC', current_price=Decimal('100.00'))
+        eth = Cryptocurrency.objects.create(name='Ether', symbol='ETH', current_price=Decimal('10.00'))
+        CryptoHolding.objects.create(user=self.alice, crypto=btc, quantity=Decimal('2'))
+        CryptoHolding.objects.create(user=self.alice, crypto=eth, quantity=Decimal('0.5'))
+        CryptoHolding.objects.create(user=self.bob, crypto=eth, quantity=Decimal('3'))
+
+    def test_values_users_in_one_pass(self):
+        user_ids, values = value_users([self.bob.pk, self.alice.pk])
+        self.assertEqual(dict(zip(user_ids.tolist(), values.tolist())), {self.alice.pk: 205.0, self.bob.pk: 30.0})
+
+        exposure, total = exposure_by_crypto([[self.alice.pk, self.bob.pk]])
+        self.assertEqual(total, Decimal('235'))
+
+    def test_snapshot_marks_holdings_to_market(self):
+        snapshot_users([self.alice.pk])
+        history = AccountHistory.objects.get(user=self.alice)
+        self.assertEqual(history.crypto_balance, Decimal('210'))
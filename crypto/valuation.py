@@ -0,0 +1,97 @@
+# crypto/valuation.py
+# Mark-to-market valuation of crypto holdings for many users at once. A chunk
+# of users' positions is loaded into a (users x cryptocurrencies) quantity
+# matrix and valued with a single matrix-vector product against the current
+# prices. Values are float64, which is plenty for reporting and snapshots;
+# the ledger itself never goes through here.
+from decimal import Decimal
+
+import numpy as np
+
+from .models import CryptoHolding, Cryptocurrency
+
+VALUE_QUANTUM = Decimal('0.00000001')
+
+
+def to_decimal(value):
+    return Decimal(repr(float(value))).quantize(VALUE_QUANTUM)
+
+
+def price_vector():
+    """Return ``(crypto_ids, prices)`` arrays sorted by crypto id"""
+    rows = Cryptocurrency.objects.order_by('pk').values_list('pk', 'current_price')
+    crypto_ids = np.fromiter((pk for pk, _ in rows), dtype=np.int64)
+    prices = np.fromiter((price for _, price in rows), dtype=np.float64)
+    return crypto_ids, prices
+
+
+def position_matrix(user_ids, crypto_ids, rows):
+    """
+    Build the quantity matrix for sorted ``user_ids`` x sorted ``crypto_ids``.
+
+    ``rows`` is an iterable of ``(user_id, crypto_id, quantity)``; rows for
+    users or cryptocurrencies outside the given ids are ignored.
+    """
+    rows = list(rows)
+    matrix = np.zeros((len(user_ids), len(crypto_ids)), dtype=np.float64)
+    if not rows or not matrix.size:
+        return matrix
+    users = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    cryptos = np.fromiter((row[1] for row in rows), dtype=np.int64, count=len(rows))
+    quantities = np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows))
+
+    user_index = np.searchsorted(user_ids, users).clip(max=len(user_ids) - 1)
+    crypto_index = np.searchsorted(crypto_ids, cryptos).clip(max=len(crypto_ids) - 1)
+    known = (user_ids[user_index] == users) & (crypto_ids[crypto_index] == cryptos)
+    np.add.at(matrix, (user_index[known], crypto_index[known]), quantities[known])
+    return matrix
+
+
+def load_positions(user_ids, crypto_ids):
+    """Position matrix for a chunk of users read with one range scan of CryptoHolding"""
+    rows = CryptoHolding.objects.filter(
+        user_id__gte=user_ids[0],
+        user_id__lte=user_ids[-1],
+        quantity__gt=0
+    ).values_list('user_id', 'crypto_id', 'quantity')
+    return position_matrix(user_ids, crypto_ids, rows.iterator(chunk_size=5000))
+
+
+def value_users(user_ids, prices=None):
+    """
+    Market value of each user's holdings, as an array aligned with the sorted
+    ``user_ids``. ``prices`` is a ``(crypto_ids, prices)`` pair from
+    price_vector(), so callers valuing many chunks read prices once.
+    """
+    user_ids = np.unique(np.asarray(user_ids, dtype=np.int64))
+    if not len(user_ids):
+        return user_ids, np.zeros(0)
+    crypto_ids, price = prices or price_vector()
+    return user_ids, load_positions(user_ids, crypto_ids) @ price
+
+
+def holdings_values(user_ids, prices=None):
+    """``{user_id: Decimal value}`` for users with a non-zero mark-to-market value"""
+    ids, values = value_users(user_ids, prices)
+    return {
+        int(user_id): to_decimal(value)
+        for user_id, value in zip(ids, values)
+        if value
+    }
+
+
+def exposure_by_crypto(chunks, prices=None):
+    """
+    System-wide ``{crypto_id: (quantity, value)}`` and the total value, summed
+    over the positions of every chunk of user ids in ``chunks``.
+    """
+    crypto_ids, price = prices or price_vector()
+    quantities = np.zeros(len(crypto_ids))
+    for user_ids in chunks:
+        quantities += load_positions(np.asarray(user_ids, dtype=np.int64), crypto_ids).sum(axis=0)
+    values = quantities * price
+    exposure = {
+        int(crypto_id): (to_decimal(quantity), to_decimal(value))
+        for crypto_id, quantity, value in zip(crypto_ids, quantities, values)
+    }
+    return exposure, to_decimal(values.sum())
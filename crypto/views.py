@@ -1,48 +1,124 @@
 # crypto/views.py
-import requests
+from datetime import timedelta
 from decimal import Decimal
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, JsonResponse
 from django.shortcuts import render, redirect
+from django.utils import timezone
+from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Sum
+from django.db import transaction as db_transaction
 
 from .models import Cryptocurrency, CryptoAccount, CryptoTransaction
-from .forms import CryptoTransferForm, BuySellCryptoForm, CryptoWithdrawalForm
+from .forms import CryptoTransferForm, BuySellCryptoForm, CryptoWithdrawalForm, PendingOrderFilterForm
+from .history import price_history
+from .positions import InsufficientHoldings, portfolio, reserve_for_sell
+from .prices import get_cryptocurrencies
+from .reservations import reserve_for_buy
+from .settlement import ACTIONS, filter_orders, settle_batch, settle_from_request
 from banking.models import BankAccount, Transaction
+from banking.concurrency import gather_queries
+from banking.ledger import InsufficientFunds, LedgerError, fund_crypto_account, withdraw_crypto_account
+from banking.money import multiply
+from banking.numbering import allocate_account_number
+from banking.pagination import keyset_page
+from banking.summary import invalidate_portfolio_summary
+
+# Pending orders per page of the approval queue, oldest first
+ADMIN_QUEUE_SIZE = 100
 
 def fetch_crypto_prices():
-    # In a real app, you'd use an actual API like CoinGecko or CoinMarketCap
-    # This is a simplified mock implementation
-    cryptos = Cryptocurrency.objects.all()
-    for crypto in cryptos:
-        # Simulate price changes
-        crypto.current_price = Decimal(crypto.current_price) * Decimal('1.01')
-        crypto.save()
-    return cryptos
+    # Prices are refreshed by the price ticker (manage.py run_price_ticker or
+    # CRYPTO_PRICE_TICKER_THREAD); page views only read the cached snapshot
+    return get_cryptocurrencies()
+
+# Orders listed on the crypto home page
+RECENT_TRANSACTIONS = 50
+
+def get_or_create_crypto_account(user):
+    crypto_account = CryptoAccount.objects.filter(user=user).first()
+    if crypto_account is None:
+        with db_transaction.atomic():
+            # Concurrent first visits queue on the user row, so only one creates the account
+            get_user_model().objects.select_for_update().get(pk=user.pk)
+            crypto_account = CryptoAccount.objects.filter(user=user).first() or CryptoAccount.objects.create(
+                user=user,
+                account_number=allocate_account_number('crypto')
+            )
+    return crypto_account
 
 @login_required
-def crypto_home_view(request):
-    try:
-        crypto_account = CryptoAccount.objects.get(user=request.user)
-    except CryptoAccount.DoesNotExist:
-        crypto_account = CryptoAccount.objects.create(
-            user=request.user,
-            account_number=f"CRYPTO{request.user.id}{CryptoAccount.objects.count() + 1}"
-        )
+async def crypto_home_view(request):
+    user = await request.auser()
+    cryptos = await sync_to_async(fetch_crypto_prices)()
+    prices = {crypto.pk: crypto.current_price for crypto in cryptos}
     
-    cryptos = fetch_crypto_prices()
-    transactions = CryptoTransaction.objects.filter(user=request.user).order_by('-timestamp')
+    # The account, recent orders and holdings don't depend on each other
+    crypto_account, transactions, holdings = await gather_queries(
+        lambda: get_or_create_crypto_account(user),
+        lambda: list(CryptoTransaction.objects.filter(user=user).select_related(
+            'crypto'
+        ).order_by('-timestamp')[:RECENT_TRANSACTIONS]),
+        lambda: portfolio(user, prices),
+    )
     
-    return render(request, 'crypto/crypto_home.html', {
+    return await sync_to_async(render)(request, 'crypto/crypto_home.html', {
         'crypto_account': crypto_account,
         'cryptos': cryptos,
-        'transactions': transactions
+        'transactions': transactions,
+        'holdings': holdings,
+        'user': user
     })
 
+# Windows offered by the price history endpoint
+HISTORY_RANGES = {
+    '1h': timedelta(hours=1),
+    '1d': timedelta(days=1),
+    '7d': timedelta(days=7),
+    '1m': timedelta(days=30),
+    '1y': timedelta(days=365),
+}
+
+@login_required
+def price_history_view(request, symbol):
+    """OHLC candles for one cryptocurrency, at the finest resolution the range allows"""
+    try:
+        crypto = Cryptocurrency.objects.get(symbol__iexact=symbol)
+    except Cryptocurrency.DoesNotExist:
+        raise Http404('Unknown cryptocurrency')
 
+    time_range = request.GET.get('range', '1d')
+    if time_range not in HISTORY_RANGES:
+        time_range = '1d'
+    end = timezone.now()
+    resolution, candles = price_history(
+        crypto, end - HISTORY_RANGES[time_range], end,
+        max_points=settings.CRYPTO_HISTORY_MAX_POINTS
+    )
+
+    return JsonResponse({
+        'symbol': crypto.symbol,
+        'range': time_range,
+        'resolution': resolution,
+        'candles': [
+            {
+                'time': candle.bucket.isoformat(),
+                'open': str(candle.open),
+                'high': str(candle.high),
+                'low': str(candle.low),
+                'close': str(candle.close),
+            }
+            for candle in candles
+        ]
+    })
+
+
+@login_required
 def transfer_to_crypto_view(request):
-    crypto_account = CryptoAccount.objects.get(user=request.user)
+    crypto_account = get_or_create_crypto_account(request.user)
     
     if request.method == 'POST':
         form = CryptoTransferForm(request.user, request.POST)
@@ -50,23 +126,13 @@ def transfer_to_crypto_view(request):
             amount = form.cleaned_data['amount']
             bank_account = form.cleaned_data['bank_account']
             
-            if bank_account.balance >= Decimal(amount):
-                bank_account.balance -= Decimal(amount)
-                crypto_account.balance += Decimal(amount)
-                bank_account.save()
-                crypto_account.save()
-                
-                Transaction.objects.create(
-                    account=bank_account,
-                    transaction_type='transfer',
-                    amount=amount,
-                    description=f"Transfer to crypto account {crypto_account.account_number}"
-                )
-                
+            try:
+                fund_crypto_account(bank_account, crypto_account, amount)
+            except LedgerError as e:
+                messages.error(request, str(e))
+            else:
                 messages.success(request, 'Transfer successful!')
                 return redirect('crypto_home')
-            else:
-                messages.error(request, 'Insufficient funds')
     else:
         form = CryptoTransferForm(request.user)
     
@@ -74,16 +140,10 @@ def transfer_to_crypto_view(request):
 
 @login_required
 def transfer_from_crypto_view(request):
-    crypto_account = CryptoAccount.objects.get(user=request.user)
+    crypto_account = get_or_create_crypto_account(request.user)
     bank_accounts = BankAccount.objects.filter(user=request.user)
     
-    # Calculate available balance (total minus pending orders)
-    pending_orders = CryptoTransaction.objects.filter(
-        user=request.user,
-        status='pending'
-    ).aggregate(total_pending=Sum('total_value'))['total_pending'] or 0
-    
-    available_balance = crypto_account.balance - Decimal(pending_orders)
+    available_balance = crypto_account.available_balance
     
     if request.method == 'POST':
         form = CryptoWithdrawalForm(request.user, request.POST)
@@ -91,25 +151,17 @@ def transfer_from_crypto_view(request):
             amount = Decimal(form.cleaned_data['amount'])
             bank_account = form.cleaned_data['bank_account']
             
-            if amount <= available_balance:
-                crypto_account.balance -= amount
-                bank_account.balance += amount
-                crypto_account.save()
-                bank_account.save()
-                
-                Transaction.objects.create(
-                    account=bank_account,
-                    transaction_type='deposit',
-                    amount=amount,
-                    description=f"Transfer from crypto account {crypto_account.account_number}"
-                )
-                
-                messages.success(request, 'Transfer to bank account successful!')
-                return redirect('crypto_home')
-            else:
+            try:
+                withdraw_crypto_account(crypto_account, bank_account, amount)
+            except InsufficientFunds:
                 messages.error(request, 
                     f'Insufficient available funds. You have ${available_balance} available '
-                    f'(excluding ${pending_orders} in pending orders)')
+                    f'(excluding ${crypto_account.reserved_balance} in pending orders)')
+            except LedgerError as e:
+                messages.error(request, str(e))
+            else:
+                messages.success(request, 'Transfer to bank account successful!')
+                return redirect('crypto_home')
     else:
         form = CryptoWithdrawalForm(request.user)
     
@@ -129,27 +181,27 @@ def buy_crypto_view(request):
             amount = form.cleaned_data['amount']
             crypto_account = CryptoAccount.objects.get(user=request.user)
             
-            total_cost = float(amount) * float(crypto.current_price)
+            total_cost = multiply(amount, crypto.current_price)
             
-            if crypto_account.balance >= Decimal(total_cost):
-                # Reserve funds for the order
-                crypto_account.balance -= Decimal(total_cost)
-                crypto_account.save()
-                
-                CryptoTransaction.objects.create(
-                    user=request.user,
-                    crypto=crypto,
-                    transaction_type='buy',
-                    amount=amount,
-                    price_at_transaction=crypto.current_price,
-                    total_value=total_cost,
-                    status='pending'
-                )
-                
+            try:
+                with db_transaction.atomic():
+                    # Hold the cost back until the order settles
+                    reserve_for_buy(crypto_account, total_cost)
+                    CryptoTransaction.objects.create(
+                        user=request.user,
+                        crypto=crypto,
+                        transaction_type='buy',
+                        amount=amount,
+                        price_at_transaction=crypto.current_price,
+                        total_value=total_cost,
+                        status='pending'
+                    )
+            except InsufficientFunds as e:
+                messages.error(request, str(e))
+            else:
+                invalidate_portfolio_summary(request.user.id)
                 messages.success(request, f'Buy order for {amount} {crypto.symbol} submitted!')
                 return redirect('crypto_home')
-            else:
-                messages.error(request, 'Insufficient funds in crypto account')
     else:
         form = BuySellCryptoForm()
     
@@ -168,20 +220,25 @@ def sell_crypto_view(request):
             crypto = form.cleaned_data['crypto']
             amount = form.cleaned_data['amount']
             
-            # Check available balance (would need a CryptoHolding model in real implementation)
-            transaction = CryptoTransaction(
-                user=request.user,
-                crypto=crypto,
-                transaction_type='sell',
-                amount=amount,
-                price_at_transaction=crypto.current_price,
-                total_value=float(amount) * float(crypto.current_price),
-                status='pending'
-            )
-            transaction.save()
-            
-            messages.success(request, f'Sell order for {amount} {crypto.symbol} submitted!')
-            return redirect('crypto_home')
+            try:
+                with db_transaction.atomic():
+                    # Hold the coins back until the order settles
+                    reserve_for_sell(request.user, crypto, amount)
+                    transaction = CryptoTransaction(
+                        user=request.user,
+                        crypto=crypto,
+                        transaction_type='sell',
+                        amount=amount,
+                        price_at_transaction=crypto.current_price,
+                        total_value=multiply(amount, crypto.current_price),
+                        status='pending'
+                    )
+                    transaction.save()
+            except InsufficientHoldings:
+                messages.error(request, f'You do not have {amount} {crypto.symbol} available to sell')
+            else:
+                messages.success(request, f'Sell order for {amount} {crypto.symbol} submitted!')
+                return redirect('crypto_home')
     else:
         form = BuySellCryptoForm()
     
@@ -195,33 +252,54 @@ def admin_approve_transactions(request):
     if not request.user.is_superuser:
         return redirect('home')
     
-    pending_transactions = CryptoTransaction.objects.filter(status='pending').order_by('timestamp')
+    # Filters come from the query string for listing and bulk actions alike
+    filter_form = PendingOrderFilterForm(request.GET)
+    if filter_form.is_valid():
+        pending_transactions = filter_orders(
+            CryptoTransaction.objects.filter(status='pending'), filter_form.cleaned_data
+        ).select_related('user', 'crypto')
+    else:
+        # An invalid filter matches nothing; dropping it would match the whole queue
+        pending_transactions = CryptoTransaction.objects.none()
     
     if request.method == 'POST':
         transaction_id = request.POST.get('transaction_id')
         action = request.POST.get('action')
+        bulk_action = request.POST.get('bulk_action')
         
-        try:
-            transaction = CryptoTransaction.objects.get(id=transaction_id)
-            crypto_account = CryptoAccount.objects.get(user=transaction.user)
-            
-            if action == 'approve':
-                if transaction.transaction_type == 'buy':
-                    crypto_account.balance -= Decimal(transaction.total_value)
-                    # In a real app, you'd also track the specific crypto holdings
-                elif transaction.transaction_type == 'sell':
-                    crypto_account.balance += Decimal(transaction.total_value)
-                    # Deduct from crypto holdings in a real app
-                
-                crypto_account.save()
-                transaction.status = 'completed'
-                transaction.save()
-                messages.success(request, f'Transaction {transaction_id} approved.')
-            elif action == 'reject':
-                transaction.status = 'rejected'
-                transaction.save()
-                messages.success(request, f'Transaction {transaction_id} rejected.')
-        except CryptoTransaction.DoesNotExist:
+        if bulk_action in ACTIONS and not filter_form.is_valid():
+            filter_form.add_error(None, 'Correct the filters before settling all matching orders.')
+            messages.error(request, 'No orders were settled: the filters are invalid.')
+        elif bulk_action in ACTIONS:
+            # Orders placed after the button was pressed aren't part of "all matching"
+            matching = pending_transactions.filter(timestamp__lte=timezone.now())
+            for level, text in settle_from_request(bulk_action, matching):
+                messages.add_message(request, level, text)
+        elif action in ACTIONS and transaction_id and transaction_id.isdigit():
+            if settle_batch(action, batch_size=1, order_ids=[int(transaction_id)]):
+                messages.success(request, f'Transaction {transaction_id} {ACTIONS[action]}.')
+            else:
+                messages.error(request, 'Transaction not found or already settled.')
+        else:
             messages.error(request, 'Transaction not found.')
     
-    return render(request, 'crypto/admin_approve.html', {'transactions': pending_transactions})
\ No newline at end of file
+    transactions, next_cursor = keyset_page(
+        pending_transactions, request.GET.get('cursor'), ADMIN_QUEUE_SIZE, descending=False
+    )
+    # Keep the filters on the "Next page" link
+    next_query = None
+    if next_cursor:
+        params = request.GET.copy()
+        params['cursor'] = next_cursor
+        next_query = params.urlencode()
+    filter_query = request.GET.copy()
+    filter_query.pop('cursor', None)
+    
+    return render(request, 'crypto/admin_approve.html', {
+        'transactions': transactions,
+        'pending_count': pending_transactions.count(),
+        'filter_form': filter_form,
+        'filter_query': filter_query.urlencode(),
+        'next_cursor': next_cursor,
+        'next_query': next_query
+    })
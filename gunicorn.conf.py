@@ -0,0 +1,39 @@
+# gunicorn.conf.py
+# Server settings, all overridable from the environment:
+#
+#   SERVER_MODE            wsgi (default) or asgi
+#   GUNICORN_WORKER_CLASS  sync, gthread or uvicorn_worker.UvicornWorker;
+#                          defaults to sync for wsgi and uvicorn for asgi
+#   WEB_CONCURRENCY        worker processes (default 2; see sizing below)
+#   GUNICORN_THREADS       threads per gthread worker (default 1)
+#   GUNICORN_TIMEOUT       seconds before a silent worker is restarted
+#   GUNICORN_KEEPALIVE     seconds to hold idle keep-alive connections
+#   GUNICORN_MAX_REQUESTS  recycle a worker after this many requests (0 = never)
+#
+# ASGI workers run the async views (dashboard, crypto page, live price
+# stream) on an event loop, so a worker waiting on the database keeps
+# serving other requests.
+#
+# Sizing: every worker is a separate process with its own database
+# connections: up to DATABASE_POOL_MAX_SIZE (default 10) when pooling on
+# PostgreSQL, otherwise one per request thread plus GATHER_QUERIES_THREADS
+# (default 8). Keep WEB_CONCURRENCY x that within the database's
+# max_connections (less what migrations, cron jobs and admin tools need)
+# and the container's memory before raising it; the default of 2 is
+# deliberately small rather than scaled to the host's CPU count.
+import os
+
+server_mode = os.getenv('SERVER_MODE', 'wsgi').lower()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+worker_class = os.getenv(
+    'GUNICORN_WORKER_CLASS', 'uvicorn_worker.UvicornWorker' if server_mode == 'asgi' else 'sync'
+)
+wsgi_app = 'banking_project.asgi:application' if 'uvicorn' in worker_class.lower() else 'banking_project.wsgi:application'
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+threads = int(os.getenv('GUNICORN_THREADS', '1'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = max_requests // 10
+accesslog = os.getenv('GUNICORN_ACCESS_LOG') or None